@@ -2,9 +2,9 @@ from __future__ import annotations
 
 import time
 from contextlib import contextmanager
-from typing import Iterator
+from typing import Iterable, Iterator, Optional
 
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 REQUEST_COUNT = Counter(
     "http_requests_total",
@@ -20,7 +20,7 @@ REQUEST_DURATION = Histogram(
 PREDICTIONS_TOTAL = Counter(
     "predictions_total",
     "Total number of predictions",
-    ["result"],
+    ["result", "model_version"],
 )
 PREDICTION_DURATION = Histogram(
     "prediction_duration_seconds",
@@ -42,11 +42,85 @@ MODEL_PREDICTION_PROBABILITY = Histogram(
     "Distribution of violation probabilities from model",
     buckets=[0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
 )
+PREDICTION_BATCH_SIZE = Histogram(
+    "prediction_batch_size",
+    "Number of rows scored in one micro-batch",
+    buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256],
+)
+PREDICTION_BATCH_QUEUE_WAIT = Histogram(
+    "prediction_batch_queue_wait_seconds",
+    "Time a prediction request waits in the micro-batch queue",
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1],
+)
+INFERENCE_EXECUTOR_QUEUE_DEPTH = Gauge(
+    "inference_executor_queue_depth",
+    "Inference calls waiting for a free executor worker",
+)
+INFERENCE_EXECUTOR_SATURATION = Gauge(
+    "inference_executor_saturation",
+    "Share of busy inference executor workers",
+)
+PREDICTION_CACHE_LOOKUPS_TOTAL = Counter(
+    "prediction_cache_lookups_total",
+    "Prediction cache lookups by tier",
+    ["tier", "result"],
+)
+PREDICTION_COALESCED_REQUESTS_TOTAL = Counter(
+    "prediction_coalesced_requests_total",
+    "Cache misses served by another in-flight computation",
+    ["scope"],
+)
+PREDICTION_CACHE_BACKGROUND_REFRESHES_TOTAL = Counter(
+    "prediction_cache_background_refreshes_total",
+    "Background refreshes of stale cached predictions",
+    ["result"],
+)
+CACHE_WARMUP_ITEMS_TOTAL = Counter(
+    "prediction_cache_warmup_items_total",
+    "Items processed by the prediction cache warm-up",
+    ["result"],
+)
+CACHE_WARMUP_PROGRESS = Gauge(
+    "prediction_cache_warmup_progress",
+    "Share of the current warm-up run already processed",
+)
+REDIS_SHARD_UP = Gauge(
+    "redis_shard_up",
+    "Whether a Redis cache shard passes health checks",
+    ["shard"],
+)
+MODERATION_WORKER_IN_FLIGHT = Gauge(
+    "moderation_worker_in_flight",
+    "Moderation messages being processed concurrently",
+)
+MODERATION_WORKER_COMMIT_LAG = Gauge(
+    "moderation_worker_commit_lag",
+    "Fetched moderation messages whose offsets are not committed yet",
+    ["partition"],
+)
+MODERATION_RETRY_QUEUE_SIZE = Gauge(
+    "moderation_retry_queue_size",
+    "Moderation retries waiting in the delay queue",
+)
+MODEL_INFO = Gauge(
+    "model_info",
+    "Model version currently served by this process",
+    ["version"],
+)
+MODEL_RELOADS_TOTAL = Counter(
+    "model_reloads_total",
+    "Model hot reload attempts",
+    ["result"],
+)
 
 
-def observe_prediction_result(is_violation: bool, probability: float) -> None:
+def observe_prediction_result(
+    is_violation: bool,
+    probability: float,
+    model_version: Optional[str] = None,
+) -> None:
     label = "violation" if is_violation else "no_violation"
-    PREDICTIONS_TOTAL.labels(result=label).inc()
+    PREDICTIONS_TOTAL.labels(result=label, model_version=model_version or "unknown").inc()
     MODEL_PREDICTION_PROBABILITY.observe(float(probability))
 
 
@@ -58,6 +132,77 @@ def observe_db_query_duration(query_type: str, started_at: float) -> None:
     DB_QUERY_DURATION.labels(query_type=query_type).observe(time.perf_counter() - started_at)
 
 
+def observe_prediction_batch(batch_size: int, queue_waits: Iterable[float]) -> None:
+    PREDICTION_BATCH_SIZE.observe(batch_size)
+    for queue_wait in queue_waits:
+        PREDICTION_BATCH_QUEUE_WAIT.observe(queue_wait)
+
+
+def observe_inference_executor_load(in_flight: int, max_workers: int) -> None:
+    INFERENCE_EXECUTOR_QUEUE_DEPTH.set(max(in_flight - max_workers, 0))
+    INFERENCE_EXECUTOR_SATURATION.set(min(in_flight, max_workers) / max_workers)
+
+
+# Дочерние счётчики заранее: labels() на каждом обращении к кэшу заметен на горячем пути.
+_CACHE_LOOKUP_COUNTERS = {
+    (tier, result): PREDICTION_CACHE_LOOKUPS_TOTAL.labels(tier=tier, result=result)
+    for tier in ("local", "redis")
+    for result in ("hit", "miss")
+}
+
+
+def observe_cache_lookups(tier: str, hits: int, misses: int) -> None:
+    if hits:
+        _CACHE_LOOKUP_COUNTERS[tier, "hit"].inc(hits)
+    if misses:
+        _CACHE_LOOKUP_COUNTERS[tier, "miss"].inc(misses)
+
+
+def observe_coalesced_request(scope: str) -> None:
+    PREDICTION_COALESCED_REQUESTS_TOTAL.labels(scope=scope).inc()
+
+
+def observe_background_refresh(result: str) -> None:
+    PREDICTION_CACHE_BACKGROUND_REFRESHES_TOTAL.labels(result=result).inc()
+
+
+def observe_cache_warmup_batch(warmed: int, skipped: int, processed: int, total: int) -> None:
+    if warmed:
+        CACHE_WARMUP_ITEMS_TOTAL.labels(result="warmed").inc(warmed)
+    if skipped:
+        CACHE_WARMUP_ITEMS_TOTAL.labels(result="skipped").inc(skipped)
+    CACHE_WARMUP_PROGRESS.set(processed / total if total else 1.0)
+
+
+def observe_redis_shard_up(shard: str, up: bool) -> None:
+    REDIS_SHARD_UP.labels(shard=shard).set(1 if up else 0)
+
+
+def observe_worker_in_flight(in_flight: int) -> None:
+    MODERATION_WORKER_IN_FLIGHT.set(in_flight)
+
+
+def observe_worker_commit_lag(partition: str, lag: int) -> None:
+    MODERATION_WORKER_COMMIT_LAG.labels(partition=partition).set(lag)
+
+
+def observe_retry_queue(size: int) -> None:
+    MODERATION_RETRY_QUEUE_SIZE.set(size)
+
+
+def observe_model_version(version: Optional[str], previous: Optional[str] = None) -> None:
+    if previous is not None and previous != version:
+        try:
+            MODEL_INFO.remove(previous)
+        except KeyError:
+            pass
+    MODEL_INFO.labels(version=version or "unknown").set(1)
+
+
+def observe_model_reload(result: str) -> None:
+    MODEL_RELOADS_TOTAL.labels(result=result).inc()
+
+
 @contextmanager
 def track_prediction_duration() -> Iterator[None]:
     started_at = time.perf_counter()
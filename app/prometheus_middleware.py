@@ -1,20 +1,37 @@
 from __future__ import annotations
 import time
-from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.metrics import REQUEST_COUNT, REQUEST_DURATION
 
 
-class PrometheusMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next) -> Response:
+class PrometheusMiddleware:
+    # Чистый ASGI вместо BaseHTTPMiddleware: тот оборачивает ответ в
+    # StreamingResponse, который вычитывает receive() и ломает ручки,
+    # читающие тело запроса во время отдачи ответа (/predict/stream).
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
         method = request.method
         endpoint = request.url.path
         started_at = time.perf_counter()
+        status_code = 500
 
-        response = await call_next(request)
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-        duration = time.perf_counter() - started_at
-        REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=str(response.status_code)).inc()
-        REQUEST_DURATION.labels(method=method, endpoint=endpoint).observe(duration)
-        return response
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started_at
+            REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=str(status_code)).inc()
+            REQUEST_DURATION.labels(method=method, endpoint=endpoint).observe(duration)
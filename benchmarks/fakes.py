@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Iterable, Optional
+
+from models.accounts import AccountModel
+
+
+class InMemoryRedis:
+    """Минимальная in-memory замена redis.asyncio.Redis для бенчмарков."""
+
+    def __init__(self) -> None:
+        self._values: dict[str, Any] = {}
+        self._expires_at: dict[str, float] = {}
+
+    def _alive(self, key: str) -> bool:
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._values.pop(key, None)
+            self._expires_at.pop(key, None)
+            return False
+        return key in self._values
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._values.get(key) if self._alive(key) else None
+
+    async def mget(self, keys: Iterable[str]) -> list[Optional[Any]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: Any, ex: Optional[int] = None) -> bool:
+        self._values[key] = value
+        if ex is not None:
+            self._expires_at[key] = time.monotonic() + ex
+        else:
+            self._expires_at.pop(key, None)
+        return True
+
+    async def sadd(self, key: str, *members: str) -> int:
+        if not self._alive(key):
+            self._values[key] = set()
+        current = self._values[key]
+        before = len(current)
+        current.update(members)
+        return len(current) - before
+
+    async def smembers(self, key: str) -> set[str]:
+        return set(self._values.get(key, set())) if self._alive(key) else set()
+
+    async def expire(self, key: str, seconds: int) -> bool:
+        if not self._alive(key):
+            return False
+        self._expires_at[key] = time.monotonic() + seconds
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            if self._values.pop(key, None) is not None:
+                deleted += 1
+            self._expires_at.pop(key, None)
+        return deleted
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryPipeline":
+        return InMemoryPipeline(self)
+
+
+class InMemoryPipeline:
+    def __init__(self, client: InMemoryRedis) -> None:
+        self._client = client
+        self._commands: list[tuple[str, tuple[Any, ...], dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> Any:
+        def _queue(*args: Any, **kwargs: Any) -> "InMemoryPipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return _queue
+
+    async def execute(self) -> list[Any]:
+        commands, self._commands = self._commands, []
+        return [await getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class InMemoryAccountRepository:
+    def __init__(self, account: AccountModel) -> None:
+        self.account = account
+
+    async def get(self, account_id: int) -> AccountModel:
+        return self.account
@@ -0,0 +1,369 @@
+"""Бенчмарки горячего пути предсказаний.
+
+Запуск из корня репозитория::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --update-baseline
+
+Результаты пишутся в JSON и сравниваются с сохранённым baseline по медиане;
+замедление больше порога считается регрессией (код выхода 1). Baseline
+зависит от машины и в репозиторий не коммитится: его снимают локально
+(``--update-baseline``) до изменения и сравнивают после. Baseline из другой
+среды сравнивается только для информации, без ошибки, если не передан
+``--enforce-baseline``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+import numpy as np
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+DEFAULT_OUTPUT = BENCHMARKS_DIR / "results.json"
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+DEFAULT_THRESHOLD = 0.25
+# Baseline локальный (не в git): сравнивать имеет смысл только замеры одной среды.
+ENVIRONMENT_FIELDS = ("python", "numpy", "platform", "machine", "processor")
+
+PAYLOAD = {
+    "seller_id": 1,
+    "is_verified_seller": False,
+    "item_id": 100,
+    "name": "Sample item",
+    "description": "Sample description",
+    "category": 10,
+    "images_qty": 1,
+}
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    rounds: int
+    mean_us: float
+    median_us: float
+    p95_us: float
+    min_us: float
+
+
+def _summarize(name: str, timings_ns: Sequence[int]) -> BenchmarkResult:
+    timings_us = sorted(timing / 1000.0 for timing in timings_ns)
+    return BenchmarkResult(
+        name=name,
+        rounds=len(timings_us),
+        mean_us=statistics.fmean(timings_us),
+        median_us=statistics.median(timings_us),
+        p95_us=timings_us[min(len(timings_us) - 1, int(len(timings_us) * 0.95))],
+        min_us=timings_us[0],
+    )
+
+
+def _measure(name: str, func: Callable[[], Any], rounds: int, warmup: int) -> BenchmarkResult:
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(rounds):
+        started_at = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - started_at)
+    return _summarize(name, timings)
+
+
+async def _ameasure(
+    name: str,
+    func: Callable[[], Awaitable[Any]],
+    rounds: int,
+    warmup: int,
+) -> BenchmarkResult:
+    for _ in range(warmup):
+        await func()
+    timings = []
+    for _ in range(rounds):
+        started_at = time.perf_counter_ns()
+        await func()
+        timings.append(time.perf_counter_ns() - started_at)
+    return _summarize(name, timings)
+
+
+def _load_model() -> Any:
+    from models.model import InferenceModel, train_model
+
+    return InferenceModel(estimator=train_model())
+
+
+def bench_build_features(rounds: int, warmup: int) -> list[BenchmarkResult]:
+    from services.predict import build_features
+
+    return [
+        _measure(
+            "build_features",
+            lambda: build_features(
+                is_verified_seller=PAYLOAD["is_verified_seller"],
+                images_qty=PAYLOAD["images_qty"],
+                description=PAYLOAD["description"],
+                category=PAYLOAD["category"],
+            ),
+            rounds,
+            warmup,
+        )
+    ]
+
+
+def bench_predict_violation(rounds: int, warmup: int) -> list[BenchmarkResult]:
+    from services.predict import predict_violation
+
+    model = _load_model()
+    return [
+        _measure(
+            "predict_violation",
+            lambda: predict_violation(
+                model=model,
+                seller_id=PAYLOAD["seller_id"],
+                item_id=PAYLOAD["item_id"],
+                is_verified_seller=PAYLOAD["is_verified_seller"],
+                images_qty=PAYLOAD["images_qty"],
+                description=PAYLOAD["description"],
+                category=PAYLOAD["category"],
+            ),
+            rounds,
+            warmup,
+        )
+    ]
+
+
+def bench_sync_key(rounds: int, warmup: int) -> list[BenchmarkResult]:
+    from storages.prediction_cache import PredictionCacheStorage
+
+    return [
+        _measure(
+            "prediction_cache_sync_key",
+            lambda: PredictionCacheStorage._sync_key(PAYLOAD),
+            rounds,
+            warmup,
+        )
+    ]
+
+
+def bench_predict_service(rounds: int, warmup: int) -> list[BenchmarkResult]:
+    from benchmarks.fakes import InMemoryRedis
+    from services.predict import PredictService
+    from storages.local_cache import LocalCache
+    from storages.prediction_cache import PredictionCacheStorage
+
+    model = _load_model()
+    service = PredictService()
+
+    async def _run() -> list[BenchmarkResult]:
+        # Установившийся режим после миграции ключей: без дочитывания старых sync-ключей.
+        cache = PredictionCacheStorage(InMemoryRedis(), read_legacy_sync_keys=False)
+        two_tier_cache = PredictionCacheStorage(
+            InMemoryRedis(),
+            local_cache=LocalCache(),
+            read_legacy_sync_keys=False,
+        )
+        item_ids = iter(range(1_000_000))
+
+        async def _miss() -> Any:
+            # Ключ строится по признакам, поэтому промах требует новых признаков, а не нового item_id.
+            item_id = next(item_ids)
+            payload = {**PAYLOAD, "item_id": item_id, "category": item_id}
+            return await service.predict_from_payload(payload=payload, model=model, cache_storage=cache)
+
+        async def _hit() -> Any:
+            return await service.predict_from_payload(payload=PAYLOAD, model=model, cache_storage=cache)
+
+        async def _local_hit() -> Any:
+            return await service.predict_from_payload(payload=PAYLOAD, model=model, cache_storage=two_tier_cache)
+
+        return [
+            await _ameasure("predict_from_payload_cache_miss", _miss, rounds, warmup),
+            await _ameasure("predict_from_payload_cache_hit", _hit, rounds, warmup),
+            await _ameasure("predict_from_payload_local_cache_hit", _local_hit, rounds, warmup),
+        ]
+
+    return asyncio.run(_run())
+
+
+def bench_predict_route(rounds: int, warmup: int) -> list[BenchmarkResult]:
+    import httpx
+
+    import dependencies.auth
+    from benchmarks.fakes import InMemoryAccountRepository, InMemoryRedis
+    from main import app
+    from models.accounts import AccountModel
+    from services.auth import AUTH_COOKIE_NAME, AuthService
+    from storages.prediction_cache import PredictionCacheStorage
+
+    account = AccountModel(id=1, login="bench", password="bench", is_blocked=False)
+    auth_service = AuthService(account_repo=InMemoryAccountRepository(account))
+    token = auth_service.create_access_token(account)
+    original_auth_service = dependencies.auth.auth_service
+    dependencies.auth.auth_service = auth_service
+
+    # Lifespan не запускается: состояние приложения собирается вручную без БД, Kafka и Redis.
+    app.state.model = _load_model()
+    app.state.prediction_cache = None
+    app.state.prediction_batcher = None
+    app.state.inference_executor = None
+
+    async def _run() -> list[BenchmarkResult]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            cookies={AUTH_COOKIE_NAME: token},
+        ) as client:
+            async def _request() -> None:
+                response = await client.post("/predict/", json=PAYLOAD)
+                response.raise_for_status()
+
+            no_cache = await _ameasure("predict_route_no_cache", _request, rounds, warmup)
+            app.state.prediction_cache = PredictionCacheStorage(InMemoryRedis(), read_legacy_sync_keys=False)
+            cached = await _ameasure("predict_route_cache_hit", _request, rounds, warmup)
+            return [no_cache, cached]
+
+    try:
+        return asyncio.run(_run())
+    finally:
+        dependencies.auth.auth_service = original_auth_service
+        app.state.prediction_cache = None
+
+
+BENCHMARKS: dict[str, Callable[[int, int], list[BenchmarkResult]]] = {
+    "build_features": bench_build_features,
+    "predict_violation": bench_predict_violation,
+    "sync_key": bench_sync_key,
+    "predict_service": bench_predict_service,
+    "predict_route": bench_predict_route,
+}
+
+
+def run_benchmarks(
+    rounds: int,
+    warmup: int,
+    only: Optional[Sequence[str]] = None,
+) -> list[BenchmarkResult]:
+    results = []
+    for group, bench in BENCHMARKS.items():
+        if only and group not in only:
+            continue
+        results.extend(bench(rounds, warmup))
+    return results
+
+
+def compare_with_baseline(
+    results: Sequence[BenchmarkResult],
+    baseline: dict[str, Any],
+    threshold: float,
+) -> list[dict[str, Any]]:
+    baseline_results = baseline.get("benchmarks", {})
+    comparisons = []
+    for result in results:
+        previous = baseline_results.get(result.name)
+        if previous is None:
+            continue
+        ratio = result.median_us / previous["median_us"] if previous["median_us"] else float("inf")
+        comparisons.append({
+            "name": result.name,
+            "baseline_median_us": previous["median_us"],
+            "median_us": result.median_us,
+            "ratio": ratio,
+            "regression": ratio > 1.0 + threshold,
+        })
+    return comparisons
+
+
+def baseline_environment_mismatch(baseline_meta: dict[str, Any], meta: dict[str, Any]) -> list[str]:
+    return [field for field in ENVIRONMENT_FIELDS if baseline_meta.get(field) != meta.get(field)]
+
+
+def _report(results: Sequence[BenchmarkResult], comparisons: Sequence[dict[str, Any]]) -> None:
+    by_name = {comparison["name"]: comparison for comparison in comparisons}
+    print(f"{'benchmark':36} {'median us':>11} {'p95 us':>11} {'baseline':>11} {'ratio':>7}")
+    for result in results:
+        comparison = by_name.get(result.name)
+        baseline = f"{comparison['baseline_median_us']:.2f}" if comparison else "-"
+        ratio = f"{comparison['ratio']:.2f}" if comparison else "-"
+        flag = "  REGRESSION" if comparison and comparison["regression"] else ""
+        print(f"{result.name:36} {result.median_us:11.2f} {result.p95_us:11.2f} {baseline:>11} {ratio:>7}{flag}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prediction hot path benchmarks")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="benchmark groups to run")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--enforce-baseline",
+        action="store_true",
+        help="fail on regressions even if the baseline was recorded in another environment",
+    )
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    results = run_benchmarks(args.rounds, args.warmup, args.only)
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "rounds": args.rounds,
+        },
+        "benchmarks": {result.name: asdict(result) for result in results},
+    }
+
+    comparisons: list[dict[str, Any]] = []
+    enforced = True
+    if args.baseline.exists() and not args.update_baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        mismatched = baseline_environment_mismatch(baseline.get("meta", {}), report["meta"])
+        if mismatched:
+            # Абсолютные времена с другой машины не сравнимы: сравнение только
+            # для информации, замедление не считается регрессией.
+            enforced = args.enforce_baseline
+            print(
+                f"Baseline was recorded in a different environment ({', '.join(mismatched)}), "
+                "re-create it with --update-baseline",
+                file=sys.stderr,
+            )
+        comparisons = compare_with_baseline(results, baseline, args.threshold)
+        report["comparison"] = {
+            "baseline": str(args.baseline),
+            "threshold": args.threshold,
+            "enforced": enforced,
+            "results": comparisons,
+        }
+
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    _report(results, comparisons)
+    regressions = [comparison["name"] for comparison in comparisons if comparison["regression"]]
+    if regressions:
+        note = "" if enforced else " (not enforced: different environment)"
+        print(f"Regressions over {args.threshold:.0%}{note}: {', '.join(regressions)}", file=sys.stderr)
+        return 1 if enforced else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,53 +1,137 @@
-import json
+import asyncio
+import logging
+import time
 from datetime import datetime, timezone
 import os
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Optional, Sequence
 from aiokafka import AIOKafkaProducer
+from aiokafka import codec as kafka_codec
+from clients.message_codecs import SCHEMA_HEADER, MessageCodec, get_message_codec
 
+logger = logging.getLogger(__name__)
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 MODERATION_TOPIC = os.getenv("KAFKA_MODERATION_TOPIC", "moderation")
 MODERATION_DLQ_TOPIC = os.getenv("KAFKA_MODERATION_DLQ_TOPIC", "moderation_dlq")
+# Сколько продюсер копит сообщения в пачку перед отправкой; 0 — отправлять сразу.
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "0"))
+KAFKA_MAX_BATCH_SIZE = int(os.getenv("KAFKA_MAX_BATCH_SIZE", "16384"))
+# gzip, snappy, lz4, zstd; пусто — без сжатия.
+KAFKA_COMPRESSION_TYPE = os.getenv("KAFKA_COMPRESSION_TYPE", "").lower() or None
+# true — отправка возвращается, как только сообщение в буфере продюсера, не
+# дожидаясь подтверждения брокера; ошибки доставки уходят в on_delivery_error.
+KAFKA_FIRE_AND_FORGET = os.getenv("KAFKA_FIRE_AND_FORGET", "false").lower() == "true"
+
+_COMPRESSION_AVAILABLE = {
+    "gzip": kafka_codec.has_gzip,
+    "snappy": kafka_codec.has_snappy,
+    "lz4": kafka_codec.has_lz4,
+    "zstd": kafka_codec.has_zstd,
+}
+
+DeliveryErrorCallback = Callable[[dict[str, Any], BaseException], Awaitable[Any]]
+
+
+def _compression_type(name: Optional[str]) -> Optional[str]:
+    if name is None:
+        return None
+    if name not in _COMPRESSION_AVAILABLE:
+        raise ValueError(f"Unsupported Kafka compression: {name}")
+    if not _COMPRESSION_AVAILABLE[name]():
+        logger.warning("Kafka %s compression is not available, sending uncompressed", name)
+        return None
+    return name
 
 
 class KafkaClient:
-    def __init__(self, bootstrap_servers: str = KAFKA_BOOTSTRAP_SERVERS) -> None:
+    def __init__(
+        self,
+        bootstrap_servers: str = KAFKA_BOOTSTRAP_SERVERS,
+        linger_ms: int = KAFKA_LINGER_MS,
+        max_batch_size: int = KAFKA_MAX_BATCH_SIZE,
+        compression_type: Optional[str] = KAFKA_COMPRESSION_TYPE,
+        fire_and_forget: bool = KAFKA_FIRE_AND_FORGET,
+        codec: Optional[MessageCodec] = None,
+    ) -> None:
         self.bootstrap_servers = bootstrap_servers
+        self.linger_ms = linger_ms
+        self.max_batch_size = max_batch_size
+        self.compression_type = _compression_type(compression_type)
+        self.fire_and_forget = fire_and_forget
+        self.codec = codec or get_message_codec()
         self._producer: Optional[AIOKafkaProducer] = None
+        self._callbacks: set[asyncio.Task] = set()
 
     async def start(self) -> None:
         if self._producer is None:
-            self._producer = AIOKafkaProducer(bootstrap_servers=self.bootstrap_servers)
+            self._producer = AIOKafkaProducer(
+                bootstrap_servers=self.bootstrap_servers,
+                linger_ms=self.linger_ms,
+                max_batch_size=self.max_batch_size,
+                compression_type=self.compression_type,
+            )
             await self._producer.start()
 
     async def stop(self) -> None:
         if self._producer is not None:
+            # stop() дожидается отправки буфера, после этого досрабатывают колбэки.
             await self._producer.stop()
             self._producer = None
+        # Колбэки доставки запускаются на следующей итерации цикла.
+        await asyncio.sleep(0)
+        if self._callbacks:
+            await asyncio.gather(*self._callbacks, return_exceptions=True)
 
     async def send_moderation_request(
         self,
         item_id: int,
         task_id: int,
         retry_count: int = 0,
+        on_delivery_error: Optional[DeliveryErrorCallback] = None,
     ) -> None:
-        await self._send_json(
+        """Без ``fire_and_forget`` ждёт подтверждения брокера и пробрасывает
+        ошибку; с ним — возвращается после буферизации, а об ошибке доставки
+        узнаёт ``on_delivery_error``."""
+        await self._send(
             MODERATION_TOPIC,
-            {
-                "item_id": item_id,
-                "task_id": task_id,
-                "retry_count": retry_count,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            },
+            self._moderation_request(item_id, task_id, retry_count),
+            on_delivery_error,
         )
 
+    async def send_moderation_requests(
+        self,
+        requests: Sequence[tuple[int, int]],
+        retry_count: int = 0,
+        on_delivery_error: Optional[DeliveryErrorCallback] = None,
+    ) -> None:
+        """Пачка пар ``(item_id, task_id)``: все сообщения сначала попадают в
+        буфер продюсера и уходят общими батчами, подтверждения ждутся разом.
+
+        ``on_delivery_error`` вызывается для каждого недоставленного сообщения
+        (без ``fire_and_forget`` — до возврата). Если колбэка нет, без
+        ``fire_and_forget`` пробрасывается первая ошибка.
+        """
+        payloads = [self._moderation_request(item_id, task_id, retry_count) for item_id, task_id in requests]
+        futures = [await self._buffer(MODERATION_TOPIC, payload) for payload in payloads]
+        if self.fire_and_forget:
+            for payload, future in zip(payloads, futures):
+                self._watch_delivery(payload, future, on_delivery_error)
+            return
+
+        delivered = await asyncio.gather(*futures, return_exceptions=True)
+        failed = [(payload, result) for payload, result in zip(payloads, delivered) if isinstance(result, BaseException)]
+        if failed and on_delivery_error is None:
+            raise failed[0][1]
+        for payload, exc in failed:
+            await on_delivery_error(payload, exc)
+
     async def send_to_dlq(
         self,
         original_message: dict[str, Any],
         error: str,
         retry_count: int = 1,
     ) -> None:
-        await self._send_json(
+        await self._send(
             MODERATION_DLQ_TOPIC,
             {
                 "original_message": original_message,
@@ -57,7 +141,58 @@ class KafkaClient:
             },
         )
 
-    async def _send_json(self, topic: str, payload: dict[str, Any]) -> None:
+    def _moderation_request(self, item_id: int, task_id: int, retry_count: int) -> dict[str, Any]:
+        payload: dict[str, Any] = {"item_id": item_id, "task_id": task_id, "retry_count": retry_count}
+        if self.codec.epoch_timestamps:
+            payload["timestamp_ms"] = time.time_ns() // 1_000_000
+        else:
+            payload["timestamp"] = datetime.now(timezone.utc).isoformat()
+        return payload
+
+    async def _send(
+        self,
+        topic: str,
+        payload: dict[str, Any],
+        on_delivery_error: Optional[DeliveryErrorCallback] = None,
+    ) -> None:
+        future = await self._buffer(topic, payload)
+        if self.fire_and_forget:
+            self._watch_delivery(payload, future, on_delivery_error)
+        else:
+            await future
+
+    async def _buffer(self, topic: str, payload: dict[str, Any]) -> "asyncio.Future[Any]":
         if self._producer is None:
             raise RuntimeError("Kafka producer is not started")
-        await self._producer.send_and_wait(topic, json.dumps(payload).encode("utf-8"))
+        value, schema = self.codec.encode(payload)
+        # send() ждёт только места в буфере; доставку подтверждает future.
+        return await self._producer.send(topic, value, headers=[(SCHEMA_HEADER, schema)])
+
+    def _watch_delivery(
+        self,
+        payload: dict[str, Any],
+        future: "asyncio.Future[Any]",
+        on_delivery_error: Optional[DeliveryErrorCallback],
+    ) -> None:
+        def _done(done: "asyncio.Future[Any]") -> None:
+            exc = asyncio.CancelledError() if done.cancelled() else done.exception()
+            if exc is None:
+                return
+            logger.warning("kafka_delivery_failed task_id=%s", payload.get("task_id"), exc_info=exc)
+            if on_delivery_error is not None:
+                task = asyncio.ensure_future(self._run_callback(on_delivery_error, payload, exc))
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+
+        future.add_done_callback(_done)
+
+    @staticmethod
+    async def _run_callback(
+        on_delivery_error: DeliveryErrorCallback,
+        payload: dict[str, Any],
+        exc: BaseException,
+    ) -> None:
+        try:
+            await on_delivery_error(payload, exc)
+        except Exception:
+            logger.exception("kafka_delivery_callback_failed task_id=%s", payload.get("task_id"))
@@ -1,20 +1,37 @@
 from __future__ import annotations
 import os
-from typing import Optional
+from typing import Any, Optional, Sequence
 import redis.asyncio as redis
 
+from clients.sharded_redis import ShardedRedis
+
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+# Несколько URL через запятую — кэш шардируется между ними (clients.sharded_redis).
+REDIS_URLS = [url.strip() for url in os.getenv("REDIS_URLS", "").split(",") if url.strip()]
 
 
 class RedisClient:
-    def __init__(self, redis_url: str = REDIS_URL) -> None:
+    def __init__(
+        self,
+        redis_url: str = REDIS_URL,
+        decode_responses: bool = True,
+        shard_urls: Sequence[str] = REDIS_URLS,
+    ) -> None:
         self.redis_url = redis_url
-        self._client: Optional[redis.Redis] = None
+        self.decode_responses = decode_responses
+        self.shard_urls = list(shard_urls)
+        self._client: Optional[Any] = None
 
     async def start(self) -> None:
-        if self._client is None:
-            self._client = redis.from_url(self.redis_url, decode_responses=True)
+        if self._client is not None:
+            return
+        if len(self.shard_urls) > 1:
+            self._client = ShardedRedis.from_urls(self.shard_urls, decode_responses=self.decode_responses)
+            await self._client.start()
+        else:
+            url = self.shard_urls[0] if self.shard_urls else self.redis_url
+            self._client = redis.from_url(url, decode_responses=self.decode_responses)
             await self._client.ping()
 
     async def stop(self) -> None:
@@ -23,7 +40,8 @@ class RedisClient:
             self._client = None
 
     @property
-    def client(self) -> redis.Redis:
+    def client(self) -> Any:
+        """``redis.asyncio.Redis`` или ``ShardedRedis`` с тем же подмножеством API."""
         if self._client is None:
             raise RuntimeError("Redis client is not started")
         return self._client
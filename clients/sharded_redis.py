@@ -0,0 +1,387 @@
+"""Клиентский шардинг кэша по нескольким Redis с консистентным хешированием.
+
+Ключ попадает на шард по своему hash tag, как в Redis Cluster: если в ключе
+есть ``{...}``, хешируется только содержимое скобок. Ключи объявления
+заканчиваются на ``{<item_id>}`` (``prediction:simple:item:model:<версия>:{42}``,
+``prediction:item:index:{42}``, ``prediction:lock:simple:model:<версия>:{42}``),
+поэтому значения, индекс и блокировка лежат на одном шарде, и Lua-скрипт
+удаления по индексу работает в пределах одного узла.
+
+Недоступный шард исключается из кольца: его ключи уходят на следующий узел
+по кольцу (для кэша это промах, а не ошибка) и возвращаются, когда фоновая
+проверка снова видит узел живым. Записи, сделанные на резервном узле,
+доживают там до TTL. Перед возвращением в кольцо с узла удаляются ключи
+кэша (``REDIS_SHARD_RECOVERY_FLUSH_PATTERN``): пока он был недоступен,
+удаления и перезаписи его ключей уходили на резервный узел, и старые
+значения иначе снова отдавались бы до истечения TTL.
+"""
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+from typing import Any, Awaitable, Callable, Optional, Sequence, TypeVar, Union
+from urllib.parse import urlsplit
+
+import redis.asyncio as redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+
+from app.metrics import observe_redis_shard_up
+
+logger = logging.getLogger(__name__)
+
+REDIS_SHARD_VNODES = int(os.getenv("REDIS_SHARD_VNODES", "160"))
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", "1"))
+REDIS_HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("REDIS_HEALTH_CHECK_TIMEOUT_SECONDS", "0.5"))
+# Ключи, которые удаляются с вернувшегося шарда; пусто — не удалять. По
+# умолчанию — все ключи кэша предсказаний (storages.prediction_cache).
+REDIS_SHARD_RECOVERY_FLUSH_PATTERN = os.getenv("REDIS_SHARD_RECOVERY_FLUSH_PATTERN", "prediction:*") or None
+REDIS_SHARD_RECOVERY_FLUSH_BATCH = 1000
+
+SHARD_ERRORS = (RedisConnectionError, RedisTimeoutError, ConnectionError, TimeoutError, OSError)
+# pub/sub не привязан к ключу: подписчик слушает один узел, выбранный по этому
+# ключу, а публикация идёт на все живые узлы, чтобы дойти при любом выборе.
+PUBSUB_ROUTING_KEY = "pubsub"
+
+Key = Union[str, bytes]
+T = TypeVar("T")
+
+
+def hash_tag(key: Key) -> bytes:
+    """Часть ключа, по которой выбирается шард (правила Redis Cluster)."""
+    if isinstance(key, str):
+        key = key.encode()
+    start = key.find(b"{")
+    if start != -1:
+        end = key.find(b"}", start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def _point(data: bytes) -> int:
+    return int.from_bytes(hashlib.md5(data).digest()[:8], "big")
+
+
+def shard_name(url: str) -> str:
+    """Имя шарда для логов и метрик, без пароля из URL."""
+    parts = urlsplit(url)
+    return f"{parts.hostname}:{parts.port or 6379}{parts.path or '/0'}"
+
+
+class HashRing:
+    def __init__(self, nodes: Sequence[str], vnodes: int = REDIS_SHARD_VNODES) -> None:
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted(
+            (_point(f"{node}#{index}".encode()), node)
+            for node in nodes
+            for index in range(vnodes)
+        )
+        self.nodes = tuple(nodes)
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def get_node(self, key: Key, exclude: Union[set[str], frozenset[str]] = frozenset()) -> Optional[str]:
+        """Первый по часовой стрелке узел не из ``exclude``; None, если живых нет."""
+        index = bisect.bisect(self._hashes, _point(hash_tag(key)))
+        for offset in range(len(self._nodes)):
+            node = self._nodes[(index + offset) % len(self._nodes)]
+            if node not in exclude:
+                return node
+        return None
+
+
+class ShardedRedis:
+    """Подмножество API ``redis.asyncio.Redis``, которым пользуются кэши:
+    get/set/mget/delete, pipeline, register_script, publish и pubsub."""
+
+    def __init__(
+        self,
+        shards: dict[str, redis.Redis],
+        vnodes: int = REDIS_SHARD_VNODES,
+        health_check_interval: float = REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+        health_check_timeout: float = REDIS_HEALTH_CHECK_TIMEOUT_SECONDS,
+        recovery_flush_pattern: Optional[str] = REDIS_SHARD_RECOVERY_FLUSH_PATTERN,
+    ) -> None:
+        self.shards = shards
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.recovery_flush_pattern = recovery_flush_pattern
+        self._ring = HashRing(list(shards), vnodes)
+        self._down: set[str] = set()
+        self._recovering: set[str] = set()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_urls(cls, urls: Sequence[str], decode_responses: bool = True, **kwargs: Any) -> "ShardedRedis":
+        return cls({url: redis.from_url(url, decode_responses=decode_responses) for url in urls}, **kwargs)
+
+    @property
+    def healthy_nodes(self) -> list[str]:
+        return [node for node in self._ring.nodes if node not in self._down]
+
+    def node_for(self, key: Key) -> str:
+        node = self._ring.get_node(key, self._down)
+        if node is None:
+            raise RedisConnectionError("All Redis shards are down")
+        return node
+
+    def mark_down(self, node: str) -> None:
+        if node not in self._down:
+            self._down.add(node)
+            observe_redis_shard_up(shard_name(node), False)
+            logger.warning("redis_shard_down shard=%s", shard_name(node))
+
+    async def _mark_up(self, node: str) -> None:
+        if node not in self._down:
+            observe_redis_shard_up(shard_name(node), True)
+            return
+        if node in self._recovering:
+            return
+        # Узел остаётся вне кольца, пока с него не удалены устаревшие ключи;
+        # если очистка не удалась, следующая проверка попробует снова.
+        self._recovering.add(node)
+        try:
+            flushed = await self._flush_stale(node)
+        except Exception:
+            logger.exception("redis_shard_recovery_failed shard=%s", shard_name(node))
+            return
+        finally:
+            self._recovering.discard(node)
+        self._down.discard(node)
+        observe_redis_shard_up(shard_name(node), True)
+        logger.info("redis_shard_up shard=%s flushed=%s", shard_name(node), flushed)
+
+    async def _flush_stale(self, node: str) -> int:
+        if self.recovery_flush_pattern is None:
+            return 0
+        shard = self.shards[node]
+        flushed = 0
+        batch: list[Key] = []
+        async for key in shard.scan_iter(match=self.recovery_flush_pattern, count=REDIS_SHARD_RECOVERY_FLUSH_BATCH):
+            batch.append(key)
+            if len(batch) >= REDIS_SHARD_RECOVERY_FLUSH_BATCH:
+                flushed += await shard.unlink(*batch)
+                batch = []
+        if batch:
+            flushed += await shard.unlink(*batch)
+        return flushed
+
+    async def start(self) -> None:
+        await self.check_health()
+        if not self.healthy_nodes:
+            raise RedisConnectionError("All Redis shards are down")
+        if self._health_task is None and self.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._run_health_checks())
+
+    async def check_health(self) -> None:
+        async def _check(node: str) -> None:
+            try:
+                await asyncio.wait_for(self.shards[node].ping(), self.health_check_timeout)
+            except Exception:
+                self.mark_down(node)
+            else:
+                await self._mark_up(node)
+
+        await asyncio.gather(*(_check(node) for node in self._ring.nodes))
+
+    async def _run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+    async def ping(self) -> bool:
+        await self.check_health()
+        if not self.healthy_nodes:
+            raise RedisConnectionError("All Redis shards are down")
+        return True
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await asyncio.gather(*(shard.aclose() for shard in self.shards.values()))
+
+    async def _routed(self, key: Key, call: Callable[[str], Awaitable[T]]) -> T:
+        # Одна повторная попытка на следующем узле кольца: упавший шард
+        # исключается сразу, не дожидаясь фоновой проверки.
+        node = self.node_for(key)
+        try:
+            return await call(node)
+        except SHARD_ERRORS:
+            self.mark_down(node)
+            return await call(self.node_for(key))
+
+    def _group(self, keys: Sequence[Key]) -> dict[str, list[int]]:
+        groups: dict[str, list[int]] = {}
+        for index, key in enumerate(keys):
+            groups.setdefault(self.node_for(key), []).append(index)
+        return groups
+
+    async def get(self, key: Key) -> Any:
+        return await self._routed(key, lambda node: self.shards[node].get(key))
+
+    async def set(self, key: Key, value: Any, **kwargs: Any) -> Any:
+        return await self._routed(key, lambda node: self.shards[node].set(key, value, **kwargs))
+
+    async def mget(self, keys: Sequence[Key]) -> list[Any]:
+        results: list[Any] = [None] * len(keys)
+
+        async def _fetch(node: str, indices: list[int]) -> None:
+            group_keys = [keys[index] for index in indices]
+            try:
+                values = await self.shards[node].mget(group_keys)
+            except SHARD_ERRORS:
+                # Ключи упавшего шарда расходятся по разным узлам: группируем заново.
+                self.mark_down(node)
+                values = await self.mget(group_keys)
+            for index, value in zip(indices, values):
+                results[index] = value
+
+        await asyncio.gather(*(_fetch(node, indices) for node, indices in self._group(keys).items()))
+        return results
+
+    async def delete(self, *keys: Key) -> int:
+        async def _delete(node: str, indices: list[int]) -> int:
+            group_keys = [keys[index] for index in indices]
+            try:
+                return await self.shards[node].delete(*group_keys)
+            except SHARD_ERRORS:
+                self.mark_down(node)
+                return await self.delete(*group_keys)
+
+        return sum(await asyncio.gather(*(_delete(node, indices) for node, indices in self._group(keys).items())))
+
+    async def publish(self, channel: Key, message: Any) -> int:
+        receivers = await asyncio.gather(
+            *(self.shards[node].publish(channel, message) for node in self.healthy_nodes),
+            return_exceptions=True,
+        )
+        return sum(count for count in receivers if isinstance(count, int))
+
+    def pubsub(self, **kwargs: Any) -> Any:
+        return self.shards[self.node_for(PUBSUB_ROUTING_KEY)].pubsub(**kwargs)
+
+    def pipeline(self, transaction: bool = False) -> "ShardedPipeline":
+        if transaction:
+            raise ValueError("Transactions are not supported across shards")
+        return ShardedPipeline(self)
+
+    def register_script(self, script: str) -> "ShardedScript":
+        return ShardedScript(self, script)
+
+
+class ShardedPipeline:
+    """Команды раскладываются по шардам и уходят одним pipeline на каждый
+    затронутый шард, параллельно; результаты возвращаются в исходном порядке.
+
+    Многоключевой DEL делится по шардам, его результат — сумма; PUBLISH уходит
+    на все живые узлы.
+    """
+
+    def __init__(self, client: ShardedRedis) -> None:
+        self._client = client
+        self._commands: list[tuple[str, tuple[Any, ...], dict[str, Any]]] = []
+
+    def __getattr__(self, name: str) -> Callable[..., "ShardedPipeline"]:
+        def _queue(*args: Any, **kwargs: Any) -> "ShardedPipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return _queue
+
+    def _plan(self) -> dict[str, list[tuple[int, str, tuple[Any, ...], dict[str, Any]]]]:
+        plan: dict[str, list[tuple[int, str, tuple[Any, ...], dict[str, Any]]]] = {}
+        for position, (name, args, kwargs) in enumerate(self._commands):
+            if name == "publish":
+                for node in self._client.healthy_nodes:
+                    plan.setdefault(node, []).append((position, name, args, kwargs))
+            elif name == "delete":
+                for node, indices in self._client._group(args).items():
+                    plan.setdefault(node, []).append((position, name, tuple(args[i] for i in indices), kwargs))
+            else:
+                plan.setdefault(self._client.node_for(args[0]), []).append((position, name, args, kwargs))
+        return plan
+
+    async def _execute_on(self, node: str, commands: list[tuple[int, str, tuple[Any, ...], dict[str, Any]]]) -> list[Any]:
+        pipe = self._client.shards[node].pipeline(transaction=False)
+        for _, name, args, kwargs in commands:
+            getattr(pipe, name)(*args, **kwargs)
+        return await pipe.execute()
+
+    async def execute(self) -> list[Any]:
+        if not self._commands:
+            return []
+        results: list[Any] = [None] * len(self._commands)
+        plan = self._plan()
+        outcomes = await asyncio.gather(
+            *(self._execute_on(node, commands) for node, commands in plan.items()),
+            return_exceptions=True,
+        )
+        failed = False
+        for (node, commands), outcome in zip(plan.items(), outcomes):
+            if isinstance(outcome, SHARD_ERRORS):
+                self._client.mark_down(node)
+                failed = True
+                continue
+            if isinstance(outcome, BaseException):
+                raise outcome
+            self._collect(results, commands, outcome)
+
+        if failed:
+            # Команды упавших шардов переезжают на новых владельцев ключей.
+            retry_positions = {
+                position
+                for (node, commands), outcome in zip(plan.items(), outcomes)
+                if isinstance(outcome, SHARD_ERRORS)
+                for position, *_ in commands
+            }
+            retry = ShardedPipeline(self._client)
+            retry._commands = [self._commands[position] for position in sorted(retry_positions)]
+            for position, value in zip(sorted(retry_positions), await retry.execute()):
+                results[position] = value
+        self._commands = []
+        return results
+
+    @staticmethod
+    def _collect(
+        results: list[Any],
+        commands: list[tuple[int, str, tuple[Any, ...], dict[str, Any]]],
+        values: list[Any],
+    ) -> None:
+        for (position, name, _, _), value in zip(commands, values):
+            if name in ("delete", "publish") and results[position] is not None:
+                results[position] += value
+            else:
+                results[position] = value
+
+
+class ShardedScript:
+    """Lua-скрипт выполняется на шарде своих ключей; все ключи одного вызова
+    должны иметь общий hash tag."""
+
+    def __init__(self, client: ShardedRedis, script: str) -> None:
+        self._client = client
+        self.script = script
+        self._scripts: dict[str, Any] = {}
+
+    def _on(self, node: str) -> Any:
+        script = self._scripts.get(node)
+        if script is None:
+            script = self._scripts[node] = self._client.shards[node].register_script(self.script)
+        return script
+
+    async def __call__(self, keys: Sequence[Key] = (), args: Sequence[Any] = ()) -> Any:
+        if not keys:
+            raise ValueError("Sharded scripts need at least one key")
+        if len({hash_tag(key) for key in keys}) > 1:
+            raise ValueError("All script keys must share one hash tag")
+        return await self._client._routed(keys[0], lambda node: self._on(node)(keys=keys, args=args))
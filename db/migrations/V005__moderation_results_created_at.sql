@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS moderation_results_created_at_item_id_idx
+ON moderation_results (created_at, item_id);
@@ -5,22 +5,69 @@ from routers.users import router as user_router, root_router
 from routers.predict import router as predict_router
 from routers.async_moderation import router as async_moderation_router
 import uvicorn
+import asyncio
 import logging
 import os
 from pathlib import Path
-from models.model import load_model, load_model_from_mlflow, train_and_save_model
+from models.model import InferenceModel, train_and_save_model
 from db.connection import DB_DSN, close_pg_pool, init_pg_pool
 from db.migrate import apply_migrations
 from clients.kafka import KafkaClient
 from clients.redis import RedisClient
+from storages.local_cache import LOCAL_CACHE_MAX_SIZE, LocalCache
 from storages.prediction_cache import PredictionCacheStorage
+from services.cache_warmup import CACHE_WARMUP_ON_STARTUP, warm_prediction_cache
+from services.inference_executor import EXECUTOR_MODES, INFERENCE_EXECUTOR_MODE, InferenceExecutor
+from services.model_registry import (
+    MODEL_RELOAD_INTERVAL_SECONDS,
+    FileModelSource,
+    MlflowModelSource,
+    ModelWatcher,
+    file_model_version,
+)
+from services.prediction_batcher import PredictionBatcher
 from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.metrics import observe_model_version
 from app.prometheus_middleware import PrometheusMiddleware
 from app.sentry import init_sentry, report_exception
 
 logging.basicConfig(level=logging.INFO)
 init_sentry()
 
+
+async def _install_model(app: FastAPI, model: InferenceModel) -> None:
+    app.state.model = model
+    if app.state.inference_executor is not None:
+        await app.state.inference_executor.reload(model)
+    # Ключи кэша версионированы: после подмены модели кэш пуст.
+    _start_cache_warmup(app)
+
+
+async def _warm_cache(model: InferenceModel, cache_storage: PredictionCacheStorage, executor: object) -> None:
+    try:
+        await warm_prediction_cache(model=model, cache_storage=cache_storage, executor=executor)
+    except Exception as exc:
+        logging.exception("Cache warm-up failed: %s", exc)
+        report_exception(exc)
+
+
+def _start_cache_warmup(app: FastAPI) -> None:
+    if not CACHE_WARMUP_ON_STARTUP or app.state.prediction_cache is None or app.state.model is None:
+        return
+    # Прогрев идёт в фоне и не задерживает старт; прогрев для старой модели больше не нужен.
+    _stop_cache_warmup(app)
+    app.state.cache_warmup_task = asyncio.create_task(
+        _warm_cache(app.state.model, app.state.prediction_cache, app.state.inference_executor)
+    )
+
+
+def _stop_cache_warmup(app: FastAPI) -> None:
+    task = getattr(app.state, "cache_warmup_task", None)
+    if task is not None and not task.done():
+        task.cancel()
+    app.state.cache_warmup_task = None
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     model_path = Path(__file__).resolve().parent / "model.pkl"
@@ -28,11 +75,19 @@ async def lifespan(app: FastAPI):
     use_mlflow = os.getenv("USE_MLFLOW", "false").lower() == "true"
     disable_kafka = os.getenv("DISABLE_KAFKA", "false").lower() == "true"
     disable_redis = os.getenv("DISABLE_REDIS", "false").lower() == "true"
+    enable_batching = os.getenv("PREDICTION_BATCHING_ENABLED", "false").lower() == "true"
     kafka_client = None if disable_kafka else KafkaClient()
-    redis_client = None if disable_redis else RedisClient()
+    # Значения кэша бинарные (storages.codecs), поэтому ответы не декодируются в str.
+    redis_client = None if disable_redis else RedisClient(decode_responses=False)
     app.state.kafka_client = kafka_client
     app.state.redis_client = redis_client
     app.state.prediction_cache = None
+    cache_invalidation_task = None
+    app.state.prediction_batcher = None
+    app.state.inference_executor = None
+    app.state.model_watcher = None
+    app.state.cache_warmup_task = None
+    model_source = MlflowModelSource() if use_mlflow else FileModelSource(model_path)
     try:
         await init_pg_pool(DB_DSN)
         await apply_migrations(migrations_dir, DB_DSN)
@@ -45,7 +100,12 @@ async def lifespan(app: FastAPI):
         if redis_client is not None:
             try:
                 await redis_client.start()
-                app.state.prediction_cache = PredictionCacheStorage(redis_client.client)
+                local_cache = LocalCache() if LOCAL_CACHE_MAX_SIZE > 0 else None
+                app.state.prediction_cache = PredictionCacheStorage(redis_client.client, local_cache=local_cache)
+                if local_cache is not None:
+                    cache_invalidation_task = asyncio.create_task(
+                        app.state.prediction_cache.listen_invalidations()
+                    )
             except Exception as exc:
                 logging.exception("Failed to start Redis client: %s", exc)
                 report_exception(exc)
@@ -62,18 +122,56 @@ async def lifespan(app: FastAPI):
 
         if use_mlflow:
             try:
-                app.state.model = load_model_from_mlflow("moderation-model", "Production")
+                app.state.model = model_source.load()
             except Exception:
-                app.state.model = train_and_save_model(model_path, use_mlflow=True)
-        elif model_path.exists():
-            app.state.model = load_model(model_path)
+                estimator = train_and_save_model(model_path, use_mlflow=True)
+                app.state.model = InferenceModel(
+                    estimator=estimator,
+                    version=file_model_version(model_path.read_bytes()),
+                )
         else:
-            app.state.model = train_and_save_model(model_path)
+            if not model_path.exists():
+                train_and_save_model(model_path)
+            app.state.model = model_source.load()
+        observe_model_version(app.state.model.version)
     except Exception as exc:
         logging.exception("Failed to load model: %s", exc)
         report_exception(exc)
         app.state.model = None
+
+    if INFERENCE_EXECUTOR_MODE in EXECUTOR_MODES and app.state.model is not None:
+        inference_executor = InferenceExecutor(app.state.model, mode=INFERENCE_EXECUTOR_MODE)
+        inference_executor.start()
+        app.state.inference_executor = inference_executor
+
+    if enable_batching:
+        prediction_batcher = PredictionBatcher(executor=app.state.inference_executor)
+        await prediction_batcher.start()
+        app.state.prediction_batcher = prediction_batcher
+
+    if MODEL_RELOAD_INTERVAL_SECONDS > 0 and app.state.model is not None:
+        model_watcher = ModelWatcher(
+            model_source,
+            app.state.model,
+            on_swap=lambda model: _install_model(app, model),
+        )
+        await model_watcher.start()
+        app.state.model_watcher = model_watcher
+    _start_cache_warmup(app)
     yield
+    if app.state.model_watcher is not None:
+        await app.state.model_watcher.stop()
+    _stop_cache_warmup(app)
+    if app.state.prediction_batcher is not None:
+        await app.state.prediction_batcher.stop()
+    if app.state.inference_executor is not None:
+        await app.state.inference_executor.stop()
+    if cache_invalidation_task is not None:
+        cache_invalidation_task.cancel()
+        try:
+            await cache_invalidation_task
+        except asyncio.CancelledError:
+            pass
     if redis_client is not None:
         await redis_client.stop()
     if kafka_client is not None:
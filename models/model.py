@@ -1,7 +1,8 @@
 from __future__ import annotations
 import os
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, Tuple
 import joblib
 import numpy as np
 from sklearn.linear_model import LogisticRegression
@@ -13,6 +14,90 @@ except ImportError:
     mlflow = None
     log_model = None
 
+# Порог, с которым модель обучали, хранится в самом эстиматоре (и попадает в
+# pickle и в MLflow вместе с ним); переменная — только для моделей без него.
+DECISION_THRESHOLD = float(os.getenv("MODEL_DECISION_THRESHOLD", "0.5"))
+THRESHOLD_ATTRIBUTE = "decision_threshold_"
+
+
+@dataclass(frozen=True)
+class CompiledLogisticRegression:
+    """Бинарная логистическая регрессия без валидации и диспатча sklearn:
+    скалярное произведение с ``coef_`` плюс сигмоида."""
+
+    coef: np.ndarray
+    intercept: float
+
+    def positive_proba(self, features: np.ndarray) -> np.ndarray:
+        logits = np.atleast_2d(np.asarray(features, dtype=np.float64)) @ self.coef + self.intercept
+        # exp(-log(1 + exp(-z))) == 1 / (1 + exp(-z)) без переполнения на больших |z|
+        return np.exp(-np.logaddexp(0.0, -logits))
+
+
+def compile_model(estimator: Any) -> Optional[CompiledLogisticRegression]:
+    if not isinstance(estimator, LogisticRegression):
+        return None
+    coef = getattr(estimator, "coef_", None)
+    classes = getattr(estimator, "classes_", None)
+    if coef is None or classes is None or len(classes) != 2 or coef.shape[0] != 1:
+        return None
+    if getattr(estimator, "multi_class", "auto") not in ("auto", "ovr", "deprecated"):
+        return None
+    return CompiledLogisticRegression(
+        coef=np.ascontiguousarray(coef[0], dtype=np.float64),
+        intercept=float(estimator.intercept_[0]),
+    )
+
+
+@dataclass(frozen=True)
+class InferenceModel:
+    """Обёртка над загруженной моделью: вероятности считаются один раз,
+    метка нарушения получается сравнением с порогом этой модели.
+
+    Логистическая регрессия компилируется в NumPy-скорер при создании,
+    остальные модели считаются через ``predict_proba`` исходного эстиматора.
+    Без явного ``threshold`` берётся порог, сохранённый вместе с эстиматором.
+    ``version`` идентифицирует загруженную модель в ответах, метриках и ключах кэша.
+    """
+
+    estimator: Any
+    threshold: Optional[float] = None
+    version: Optional[str] = None
+    compiled: Optional[CompiledLogisticRegression] = field(
+        default=None, init=False, repr=False, compare=False,
+    )
+
+    def __post_init__(self) -> None:
+        if self.threshold is None:
+            object.__setattr__(self, "threshold", model_threshold(self.estimator))
+        object.__setattr__(self, "compiled", compile_model(self.estimator))
+
+    def score(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.compiled is not None:
+            probabilities = self.compiled.positive_proba(features)
+        else:
+            probabilities = np.asarray(
+                self.estimator.predict_proba(np.atleast_2d(features)),
+                dtype=float,
+            )[:, 1]
+        return probabilities > self.threshold, probabilities
+
+
+def model_threshold(estimator: Any) -> float:
+    threshold = getattr(estimator, THRESHOLD_ATTRIBUTE, None)
+    return DECISION_THRESHOLD if threshold is None else float(threshold)
+
+
+def as_inference_model(model: Any) -> InferenceModel:
+    if isinstance(model, InferenceModel):
+        return model
+    return InferenceModel(estimator=model)
+
+
+def get_model_version(model: Any) -> Optional[str]:
+    return getattr(model, "version", None)
+
+
 def train_model() -> LogisticRegression:
     """Обучает простую модель на синтетических данных."""
     np.random.seed(42)
@@ -26,7 +111,13 @@ def train_model() -> LogisticRegression:
     model.fit(X, y)
     return model
 
-def save_model(model: LogisticRegression, path: Path | str = "model.pkl") -> None:
+def save_model(
+    model: LogisticRegression,
+    path: Path | str = "model.pkl",
+    threshold: Optional[float] = None,
+) -> None:
+    if threshold is not None:
+        setattr(model, THRESHOLD_ATTRIBUTE, threshold)
     path = Path(path)
     if path.parent != Path("."):
         path.parent.mkdir(parents=True, exist_ok=True)
@@ -38,9 +129,10 @@ def train_and_save_model(
     mlflow_tracking_uri: str | None = None,
     mlflow_experiment: str | None = None,
     mlflow_model_name: str | None = None,
+    threshold: float = DECISION_THRESHOLD,
 ) -> LogisticRegression:
     model = train_model()
-    save_model(model, path)
+    save_model(model, path, threshold=threshold)
     if use_mlflow:
         register_model_in_mlflow(
             model,
@@ -56,6 +148,7 @@ def load_model(path: Path | str = "model.pkl") -> LogisticRegression:
 
 
 def load_model_from_mlflow(model_name: str, stage: str = "Production") -> Any:
+    """Загружает модель из реестра; ``stage`` может быть и номером версии."""
     if mlflow is None:
         raise RuntimeError("MLflow is not available")
     tracking_uri = os.getenv("MLFLOW_TRACKING_URI")
@@ -65,6 +158,19 @@ def load_model_from_mlflow(model_name: str, stage: str = "Production") -> Any:
     return mlflow.sklearn.load_model(model_uri)
 
 
+def get_mlflow_model_version(model_name: str, stage: str = "Production") -> Optional[str]:
+    """Номер версии модели, которая сейчас находится в ``stage``."""
+    if mlflow is None:
+        raise RuntimeError("MLflow is not available")
+    tracking_uri = os.getenv("MLFLOW_TRACKING_URI")
+    if tracking_uri:
+        mlflow.set_tracking_uri(tracking_uri)
+    versions = mlflow.tracking.MlflowClient().get_latest_versions(model_name, stages=[stage])
+    if not versions:
+        return None
+    return str(max(int(version.version) for version in versions))
+
+
 def register_model_in_mlflow(
     model: LogisticRegression,
     tracking_uri: str,
@@ -77,6 +183,8 @@ def register_model_in_mlflow(
     mlflow.set_tracking_uri(tracking_uri)
     mlflow.set_experiment(experiment)
     with mlflow.start_run():
+        # Сам порог едет внутри эстиматора, параметр — чтобы видеть его в UI.
+        mlflow.log_param("decision_threshold", model_threshold(model))
         log_model(
             model,
             name="model",
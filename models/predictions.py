@@ -0,0 +1,11 @@
+from pydantic import BaseModel, Field
+
+
+class PredictRequest(BaseModel):
+    seller_id: int = Field(..., description='Unique seller identifier')
+    is_verified_seller: bool = Field(..., description='Seller verification status')
+    item_id: int = Field(..., description='Unique item identifier')
+    name: str = Field(..., min_length=1, description='Item name')
+    description: str = Field(..., min_length=1, description='Item description')
+    category: int = Field(..., description='Category identifier')
+    images_qty: int = Field(..., ge=0, description='Number of attached images')
@@ -1,6 +1,7 @@
 from dataclasses import dataclass
+from datetime import timedelta
 import time
-from typing import Any
+from typing import Any, Sequence
 
 from app.metrics import observe_db_query_duration
 from db.connection import get_connection, DB_DSN
@@ -78,6 +79,55 @@ class AddRepository:
             raise AddNotFoundError()
         return dict(row)
 
+    async def get_many_with_seller(self, add_ids: Sequence[int]) -> dict[int, dict[str, Any]]:
+        if not add_ids:
+            return {}
+        async with self.connection_provider(self.dsn) as conn:
+            started_at = time.perf_counter()
+            rows = await conn.fetch(
+                """
+                SELECT
+                    a.id AS add_id,
+                    a.description,
+                    a.category,
+                    a.images_qty,
+                    u.id AS seller_id,
+                    u.is_verified_seller
+                FROM adds a
+                JOIN users u ON u.id = a.seller_id
+                WHERE a.id = ANY($1::int[])
+                """,
+                list(add_ids),
+            )
+            observe_db_query_duration("select", started_at)
+        return {int(row["add_id"]): dict(row) for row in rows}
+
+    async def get_recently_active_ids(self, limit: int, active_within: timedelta) -> list[int]:
+        """Открытые объявления: сначала отправленные на модерацию за последние
+        ``active_within``, затем новые. Окно ограничивает агрегацию
+        ``moderation_results`` диапазоном по индексу ``created_at``."""
+        async with self.connection_provider(self.dsn) as conn:
+            started_at = time.perf_counter()
+            rows = await conn.fetch(
+                """
+                SELECT a.id
+                FROM adds a
+                LEFT JOIN (
+                    SELECT item_id, MAX(created_at) AS last_activity
+                    FROM moderation_results
+                    WHERE created_at > NOW() - $2::interval
+                    GROUP BY item_id
+                ) m ON m.item_id = a.id
+                WHERE NOT a.is_closed
+                ORDER BY m.last_activity DESC NULLS LAST, a.id DESC
+                LIMIT $1
+                """,
+                limit,
+                active_within,
+            )
+            observe_db_query_duration("select", started_at)
+        return [int(row["id"]) for row in rows]
+
     async def delete(self, add_id: int) -> AddModel:
         add = await self.get(add_id)
         async with self.connection_provider(self.dsn) as conn:
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 import time
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
 
 from app.metrics import observe_db_query_duration
 from db.connection import DB_DSN, get_connection
@@ -84,6 +84,35 @@ class ModerationResultRepository:
             observe_db_query_duration("update", started_at)
         return _row_to_result(row)
 
+    async def mark_completed_many(
+        self,
+        results: Sequence[tuple[int, bool, float]],
+    ) -> list[ModerationResultModel]:
+        """Пачка ``(task_id, is_violation, probability)`` одним UPDATE."""
+        if not results:
+            return []
+        task_ids, violations, probabilities = zip(*results)
+        async with self.connection_provider(self.dsn) as conn:
+            started_at = time.perf_counter()
+            rows = await conn.fetch(
+                """
+                UPDATE moderation_results AS m
+                SET status = 'completed',
+                    is_violation = u.is_violation,
+                    probability = u.probability,
+                    error_message = NULL,
+                    processed_at = NOW()
+                FROM unnest($1::int[], $2::bool[], $3::float8[]) AS u(id, is_violation, probability)
+                WHERE m.id = u.id
+                RETURNING m.*
+                """,
+                list(task_ids),
+                list(violations),
+                list(probabilities),
+            )
+            observe_db_query_duration("update", started_at)
+        return [_row_to_result(row) for row in rows]
+
     async def mark_failed(self, task_id: int, error_message: str) -> ModerationResultModel:
         async with self.connection_provider(self.dsn) as conn:
             started_at = time.perf_counter()
@@ -1,4 +1,3 @@
-import json
 import os
 import time
 from dataclasses import dataclass
@@ -9,6 +8,7 @@ from app.metrics import observe_db_query_duration
 from db.connection import get_connection, DB_DSN
 from errors import UserNotFoundError
 from models.users import UserModel
+from storages.codecs import CacheCodec, decode_value, get_codec
 
 USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "3600"))
 
@@ -22,9 +22,15 @@ def _row_to_user(row: Any) -> UserModel:
     return UserModel(**data)
 
 class UserRedisStorage:
-    def __init__(self, client: redis.Redis, ttl_seconds: int = USER_CACHE_TTL_SECONDS) -> None:
+    def __init__(
+        self,
+        client: redis.Redis,
+        ttl_seconds: int = USER_CACHE_TTL_SECONDS,
+        codec: Optional[CacheCodec] = None,
+    ) -> None:
         self.client = client
         self.ttl_seconds = ttl_seconds
+        self.codec = codec or get_codec()
 
     @staticmethod
     def _key(user_id: int) -> str:
@@ -34,13 +40,14 @@ class UserRedisStorage:
         raw = await self.client.get(self._key(user_id))
         if raw is None:
             return None
-        return UserModel(**json.loads(raw))
+        # Значение записано нами же из валидной модели, повторная валидация не нужна.
+        return UserModel.model_construct(**decode_value(raw))
 
     async def set_user(self, user: UserModel) -> None:
         payload = user.model_dump() if hasattr(user, "model_dump") else user.dict()
         await self.client.set(
             self._key(user.id),
-            json.dumps(payload, ensure_ascii=True),
+            self.codec.encode(payload),
             ex=self.ttl_seconds,
         )
 
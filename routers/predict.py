@@ -1,22 +1,23 @@
+import os
+from typing import Any, Optional
+
 from fastapi import APIRouter, Depends, HTTPException, Request
-from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from pydantic import BaseModel, Field, ValidationError
 
 from app.metrics import observe_prediction_error
 from app.sentry import report_exception
 from dependencies.auth import get_current_account
 from models.accounts import AccountModel
+from models.model import get_model_version
+from models.predictions import PredictRequest
+from services.bulk_scoring import iter_ndjson_lines, score_ndjson_lines, validation_error_message
 from services.predict import PredictService
 from errors import AddNotFoundError
 
 
-class PredictRequest(BaseModel):
-    seller_id: int = Field(..., description='Unique seller identifier')
-    is_verified_seller: bool = Field(..., description='Seller verification status')
-    item_id: int = Field(..., description='Unique item identifier')
-    name: str = Field(..., min_length=1, description='Item name')
-    description: str = Field(..., min_length=1, description='Item description')
-    category: int = Field(..., description='Category identifier')
-    images_qty: int = Field(..., ge=0, description='Number of attached images')
+PREDICT_BATCH_MAX_ITEMS = int(os.getenv("PREDICT_BATCH_MAX_ITEMS", "1000"))
 
 
 router = APIRouter(prefix='/predict')
@@ -26,6 +27,59 @@ predict_service = PredictService()
 class PredictResponse(BaseModel):
     is_violation: bool
     probability: float
+    model_version: Optional[str] = None
+
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    # Тело запроса читается, пока отдаётся ответ. Стандартный StreamingResponse
+    # параллельно слушает receive() ради disconnect и забирал бы чанки тела.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+class BatchPredictRequest(BaseModel):
+    items: list[dict[str, Any]] = Field(
+        ...,
+        min_length=1,
+        max_length=PREDICT_BATCH_MAX_ITEMS,
+        description='PredictRequest payloads',
+    )
+
+
+class BatchPredictItemResponse(BaseModel):
+    index: int
+    item_id: Optional[int] = None
+    is_violation: Optional[bool] = None
+    probability: Optional[float] = None
+    error: Optional[str] = None
+
+
+class BatchPredictResponse(BaseModel):
+    results: list[BatchPredictItemResponse]
+    model_version: Optional[str] = None
+
+
+class SimplePredictBatchRequest(BaseModel):
+    item_ids: list[int] = Field(
+        ...,
+        min_length=1,
+        max_length=PREDICT_BATCH_MAX_ITEMS,
+        description='Add ids',
+    )
+
+
+class SimplePredictBatchItemResponse(BaseModel):
+    item_id: int
+    is_violation: Optional[bool] = None
+    probability: Optional[float] = None
+    error: Optional[str] = None
+
+
+class SimplePredictBatchResponse(BaseModel):
+    results: list[SimplePredictBatchItemResponse]
+    model_version: Optional[str] = None
 
 
 @router.post('/', response_model=PredictResponse, summary='Predict if listing is violating')
@@ -38,6 +92,8 @@ async def predict(
         _ = current_account
         model = getattr(http_request.app.state, "model", None)
         cache_storage = getattr(http_request.app.state, "prediction_cache", None)
+        batcher = getattr(http_request.app.state, "prediction_batcher", None)
+        executor = getattr(http_request.app.state, "inference_executor", None)
         if model is None:
             observe_prediction_error("model_unavailable")
             report_exception(RuntimeError("Model is not loaded"))
@@ -48,9 +104,15 @@ async def predict(
             payload=payload,
             model=model,
             cache_storage=cache_storage,
+            batcher=batcher,
+            executor=executor,
         )
 
-        return PredictResponse(is_violation=is_violation, probability=probability)
+        return PredictResponse(
+            is_violation=is_violation,
+            probability=probability,
+            model_version=get_model_version(model),
+        )
     except Exception as exc:
         if isinstance(exc, HTTPException):
             raise
@@ -69,6 +131,8 @@ async def simple_predict(
         _ = current_account
         model = getattr(http_request.app.state, "model", None)
         cache_storage = getattr(http_request.app.state, "prediction_cache", None)
+        batcher = getattr(http_request.app.state, "prediction_batcher", None)
+        executor = getattr(http_request.app.state, "inference_executor", None)
         if model is None:
             observe_prediction_error("model_unavailable")
             report_exception(RuntimeError("Model is not loaded"))
@@ -78,9 +142,15 @@ async def simple_predict(
             item_id=item_id,
             model=model,
             cache_storage=cache_storage,
+            batcher=batcher,
+            executor=executor,
         )
 
-        return PredictResponse(is_violation=is_violation, probability=probability)
+        return PredictResponse(
+            is_violation=is_violation,
+            probability=probability,
+            model_version=get_model_version(model),
+        )
     except AddNotFoundError as exc:
         report_exception(exc)
         raise HTTPException(status_code=404, detail="Add or seller not found")
@@ -91,3 +161,126 @@ async def simple_predict(
         report_exception(exc)
         raise HTTPException(status_code=500, detail='Prediction failed') from exc
 
+
+@router.post('/batch', response_model=BatchPredictResponse, summary='Predict many listings at once')
+async def predict_batch(
+    request: BatchPredictRequest,
+    http_request: Request,
+    current_account: AccountModel = Depends(get_current_account),
+) -> BatchPredictResponse:
+    try:
+        _ = current_account
+        model = getattr(http_request.app.state, "model", None)
+        cache_storage = getattr(http_request.app.state, "prediction_cache", None)
+        executor = getattr(http_request.app.state, "inference_executor", None)
+        if model is None:
+            observe_prediction_error("model_unavailable")
+            report_exception(RuntimeError("Model is not loaded"))
+            raise HTTPException(status_code=503, detail="Model is not loaded")
+
+        results = [BatchPredictItemResponse(index=index) for index in range(len(request.items))]
+        valid_indexes = []
+        payloads = []
+        for index, item in enumerate(request.items):
+            try:
+                payload = PredictRequest.model_validate(item).model_dump()
+            except ValidationError as exc:
+                observe_prediction_error("validation_error")
+                results[index].error = validation_error_message(exc)
+                continue
+            results[index].item_id = payload["item_id"]
+            valid_indexes.append(index)
+            payloads.append(payload)
+
+        predictions = await predict_service.predict_many_from_payloads(
+            payloads=payloads,
+            model=model,
+            cache_storage=cache_storage,
+            executor=executor,
+        )
+        for index, (is_violation, probability) in zip(valid_indexes, predictions):
+            results[index].is_violation = is_violation
+            results[index].probability = probability
+
+        return BatchPredictResponse(results=results, model_version=get_model_version(model))
+    except Exception as exc:
+        if isinstance(exc, HTTPException):
+            raise
+        observe_prediction_error("prediction_error")
+        report_exception(exc)
+        raise HTTPException(status_code=500, detail='Prediction failed') from exc
+
+
+@router.post(
+    '/simple_predict/batch',
+    response_model=SimplePredictBatchResponse,
+    summary='Predict many listings by item_id',
+)
+async def simple_predict_batch(
+    request: SimplePredictBatchRequest,
+    http_request: Request,
+    current_account: AccountModel = Depends(get_current_account),
+) -> SimplePredictBatchResponse:
+    try:
+        _ = current_account
+        model = getattr(http_request.app.state, "model", None)
+        cache_storage = getattr(http_request.app.state, "prediction_cache", None)
+        executor = getattr(http_request.app.state, "inference_executor", None)
+        if model is None:
+            observe_prediction_error("model_unavailable")
+            report_exception(RuntimeError("Model is not loaded"))
+            raise HTTPException(status_code=503, detail="Model is not loaded")
+
+        predictions = await predict_service.predict_many_by_item_ids(
+            item_ids=request.item_ids,
+            model=model,
+            cache_storage=cache_storage,
+            executor=executor,
+        )
+
+        results = []
+        for item_id in request.item_ids:
+            prediction = predictions.get(item_id)
+            if prediction is None:
+                results.append(SimplePredictBatchItemResponse(item_id=item_id, error="Add or seller not found"))
+                continue
+            is_violation, probability = prediction
+            results.append(
+                SimplePredictBatchItemResponse(
+                    item_id=item_id,
+                    is_violation=is_violation,
+                    probability=probability,
+                )
+            )
+        return SimplePredictBatchResponse(results=results, model_version=get_model_version(model))
+    except Exception as exc:
+        if isinstance(exc, HTTPException):
+            raise
+        observe_prediction_error("prediction_error")
+        report_exception(exc)
+        raise HTTPException(status_code=500, detail='Prediction failed') from exc
+
+
+@router.post(
+    '/stream',
+    response_class=RequestBodyStreamingResponse,
+    summary='Score NDJSON stream of listings',
+)
+async def predict_stream(
+    http_request: Request,
+    current_account: AccountModel = Depends(get_current_account),
+) -> RequestBodyStreamingResponse:
+    _ = current_account
+    model = getattr(http_request.app.state, "model", None)
+    executor = getattr(http_request.app.state, "inference_executor", None)
+    if model is None:
+        observe_prediction_error("model_unavailable")
+        report_exception(RuntimeError("Model is not loaded"))
+        raise HTTPException(status_code=503, detail="Model is not loaded")
+
+    results = score_ndjson_lines(
+        iter_ndjson_lines(http_request.stream()),
+        model=model,
+        executor=executor,
+    )
+    return RequestBodyStreamingResponse(results, media_type="application/x-ndjson")
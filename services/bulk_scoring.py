@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from typing import Any, AsyncIterable, AsyncIterator, Optional
+
+from pydantic import ValidationError
+
+from app.metrics import observe_prediction_error, observe_prediction_result
+from models.model import get_model_version
+from models.predictions import PredictRequest
+from services.inference_executor import InferenceExecutor
+from services.predict import build_features_from_records, predict_violations_batch
+
+logger = logging.getLogger(__name__)
+
+BULK_SCORING_CHUNK_SIZE = int(os.getenv("BULK_SCORING_CHUNK_SIZE", "1000"))
+BULK_SCORING_MAX_LINE_BYTES = int(os.getenv("BULK_SCORING_MAX_LINE_BYTES", "65536"))
+
+
+class LineTooLongError(ValueError):
+    ...
+
+
+def validation_error_message(exc: ValidationError) -> str:
+    messages = []
+    for error in exc.errors():
+        location = ".".join(str(part) for part in error["loc"])
+        messages.append(f"{location}: {error['msg']}" if location else error["msg"])
+    return "; ".join(messages)
+
+
+def _dump_line(result: dict[str, Any]) -> bytes:
+    return json.dumps(result, ensure_ascii=True).encode("utf-8") + b"\n"
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterable[bytes],
+    max_line_bytes: int = BULK_SCORING_MAX_LINE_BYTES,
+) -> AsyncIterator[bytes]:
+    """Режет поток байтов на строки, держа в памяти не больше одной строки."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"NDJSON line exceeds {max_line_bytes} bytes")
+    if buffer:
+        yield buffer
+
+
+async def score_ndjson_lines(
+    lines: AsyncIterable[bytes],
+    model: Any,
+    chunk_size: int = BULK_SCORING_CHUNK_SIZE,
+    executor: Optional[InferenceExecutor] = None,
+) -> AsyncIterator[bytes]:
+    """Скорит NDJSON-строки с ``PredictRequest`` кусками по ``chunk_size``.
+
+    Результаты отдаются NDJSON-строками в порядке входа, как только
+    посчитан очередной кусок; номер строки во входе лежит в поле ``line``.
+    Слишком длинная строка завершает поток строкой с ошибкой.
+    """
+    pending: list[dict[str, Any]] = []
+    payloads: list[dict[str, Any]] = []
+    line_number = 0
+    stream_error: Optional[dict[str, Any]] = None
+
+    try:
+        async for raw_line in lines:
+            line_number += 1
+            if not raw_line.strip():
+                continue
+            try:
+                payload = PredictRequest.model_validate_json(raw_line).model_dump()
+            except ValidationError as exc:
+                observe_prediction_error("validation_error")
+                pending.append({"line": line_number, "error": validation_error_message(exc)})
+            else:
+                pending.append({"line": line_number, "item_id": payload["item_id"]})
+                payloads.append(payload)
+
+            # pending включает и строки с ошибками, поэтому ограничивает память целиком
+            if len(pending) >= chunk_size:
+                for result in await _score_chunk(pending, payloads, model, executor):
+                    yield _dump_line(result)
+                pending, payloads = [], []
+    except LineTooLongError as exc:
+        observe_prediction_error("validation_error")
+        stream_error = {"line": line_number + 1, "error": str(exc)}
+
+    for result in await _score_chunk(pending, payloads, model, executor):
+        yield _dump_line(result)
+    if stream_error is not None:
+        yield _dump_line(stream_error)
+
+
+async def _score_chunk(
+    pending: list[dict[str, Any]],
+    payloads: list[dict[str, Any]],
+    model: Any,
+    executor: Optional[InferenceExecutor],
+) -> list[dict[str, Any]]:
+    if not payloads:
+        return pending
+
+    model_version = get_model_version(model)
+    features = build_features_from_records(payloads)
+    try:
+        predictions = iter(await predict_violations_batch(model, features, executor))
+    except Exception:
+        logger.exception("bulk_scoring_chunk_failed size=%s", len(payloads))
+        observe_prediction_error("prediction_error")
+        return [
+            result if "error" in result else {**result, "error": "Prediction failed"}
+            for result in pending
+        ]
+
+    for result in pending:
+        if "error" in result:
+            continue
+        is_violation, probability = next(predictions)
+        observe_prediction_result(is_violation, probability, model_version)
+        result["is_violation"] = is_violation
+        result["probability"] = probability
+        if model_version is not None:
+            result["model_version"] = model_version
+    return pending
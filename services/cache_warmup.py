@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Optional
+
+from app.metrics import observe_cache_warmup_batch
+from models.model import get_model_version
+from repositories.adds import AddRepository
+from services.inference_executor import InferenceExecutor
+from services.predict import build_features_from_records, predict_violations_batch
+from storages.prediction_cache import PredictionCacheStorage
+
+logger = logging.getLogger(__name__)
+
+CACHE_WARMUP_ON_STARTUP = os.getenv("CACHE_WARMUP_ON_STARTUP", "false").lower() == "true"
+CACHE_WARMUP_LIMIT = int(os.getenv("CACHE_WARMUP_LIMIT", "10000"))
+# Недавняя активность — отправка на модерацию за столько часов.
+CACHE_WARMUP_ACTIVE_HOURS = float(os.getenv("CACHE_WARMUP_ACTIVE_HOURS", "24"))
+CACHE_WARMUP_BATCH_SIZE = int(os.getenv("CACHE_WARMUP_BATCH_SIZE", "500"))
+# Не больше стольких пачек (запросов в БД) в секунду; 0 — без ограничения.
+CACHE_WARMUP_MAX_BATCHES_PER_SECOND = float(os.getenv("CACHE_WARMUP_MAX_BATCHES_PER_SECOND", "5"))
+
+
+@dataclass(frozen=True)
+class CacheWarmupStats:
+    total: int
+    warmed: int
+    skipped: int
+
+
+async def warm_prediction_cache(
+    *,
+    model: Any,
+    cache_storage: PredictionCacheStorage,
+    add_repo: AddRepository = AddRepository(),
+    limit: int = CACHE_WARMUP_LIMIT,
+    active_hours: float = CACHE_WARMUP_ACTIVE_HOURS,
+    batch_size: int = CACHE_WARMUP_BATCH_SIZE,
+    max_batches_per_second: float = CACHE_WARMUP_MAX_BATCHES_PER_SECOND,
+    executor: Optional[InferenceExecutor] = None,
+) -> CacheWarmupStats:
+    """Заполняет кэш простых предсказаний для недавно активных объявлений.
+
+    Пачка: MGET уже закэшированных, один запрос в БД за промахами, один
+    векторный вызов модели и одна pipeline-запись. Объявления, уже лежащие в
+    кэше под текущей версией модели, пропускаются.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+    model_version = get_model_version(model)
+    item_ids = await add_repo.get_recently_active_ids(limit, timedelta(hours=active_hours))
+    total = len(item_ids)
+    warmed = skipped = 0
+    interval = 1.0 / max_batches_per_second if max_batches_per_second > 0 else 0.0
+    logger.info("cache_warmup_started items=%s model_version=%s", total, model_version)
+
+    for start in range(0, total, batch_size):
+        batch_started_at = time.monotonic()
+        batch = item_ids[start:start + batch_size]
+        cached = await cache_storage.get_simple_predictions(batch, model_version)
+        misses = [item_id for item_id, entry in zip(batch, cached) if entry is None]
+        compute_started_at = time.perf_counter()
+        adds_with_sellers = await add_repo.get_many_with_seller(misses) if misses else {}
+        found = [item_id for item_id in misses if item_id in adds_with_sellers]
+        if found:
+            features = build_features_from_records([adds_with_sellers[item_id] for item_id in found])
+            predictions = await predict_violations_batch(model, features, executor)
+            await cache_storage.set_simple_predictions(
+                {
+                    item_id: {"is_violation": is_violation, "probability": probability}
+                    for item_id, (is_violation, probability) in zip(found, predictions)
+                },
+                model_version,
+                compute_seconds=(time.perf_counter() - compute_started_at) / len(found),
+            )
+        warmed += len(found)
+        skipped += len(batch) - len(found)
+        observe_cache_warmup_batch(len(found), len(batch) - len(found), start + len(batch), total)
+
+        delay = interval - (time.monotonic() - batch_started_at)
+        if delay > 0 and start + batch_size < total:
+            await asyncio.sleep(delay)
+
+    logger.info("cache_warmup_finished warmed=%s skipped=%s", warmed, skipped)
+    return CacheWarmupStats(total=total, warmed=warmed, skipped=skipped)
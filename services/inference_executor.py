@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from app.metrics import observe_inference_executor_load
+from models.model import InferenceModel, as_inference_model
+
+INFERENCE_EXECUTOR_MODE = os.getenv("INFERENCE_EXECUTOR", "none").lower()
+INFERENCE_EXECUTOR_WORKERS = int(os.getenv("INFERENCE_EXECUTOR_WORKERS", "2"))
+EXECUTOR_MODES = ("thread", "process")
+
+# Модель, загруженная в процесс пула один раз при старте воркера.
+_worker_model: Optional[InferenceModel] = None
+
+
+def _init_process_worker(model: InferenceModel) -> None:
+    global _worker_model
+    _worker_model = model
+
+
+def _score_in_process_worker(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if _worker_model is None:
+        raise RuntimeError("Inference worker model is not loaded")
+    return _worker_model.score(features)
+
+
+def _noop() -> None:
+    return None
+
+
+def _score_with_model(model: InferenceModel, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return model.score(features)
+
+
+class InferenceExecutor:
+    """Выносит инференс из event loop в пул потоков или процессов.
+
+    В режиме ``process`` модель передаётся в каждый процесс пула один раз
+    через initializer, а в задачах пересылаются только признаки.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        mode: str = INFERENCE_EXECUTOR_MODE,
+        max_workers: int = INFERENCE_EXECUTOR_WORKERS,
+    ) -> None:
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unsupported inference executor mode: {mode}")
+        if max_workers < 1:
+            raise ValueError("max_workers must be positive")
+        self.model = as_inference_model(model)
+        self.mode = mode
+        self.max_workers = max_workers
+        self._pool: Optional[Executor] = None
+        self._in_flight = 0
+
+    def start(self) -> None:
+        if self._pool is None:
+            self._pool = self._create_pool(self.model)
+
+    def _create_pool(self, model: InferenceModel) -> Executor:
+        if self.mode == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_process_worker,
+                initargs=(model,),
+            )
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="inference",
+        )
+
+    def _create_started_pool(self, model: InferenceModel) -> Executor:
+        pool = self._create_pool(model)
+        # Процессы пула запускаются (и получают модель) на первой задаче:
+        # пусть это случится здесь, а не на первом запросе в event loop.
+        pool.submit(_noop).result()
+        return pool
+
+    async def reload(self, model: Any) -> None:
+        """Переключает исполнитель на новую модель без остановки сервиса.
+
+        В режиме ``process`` новый пул с новой моделью в initializer
+        поднимается, а старый закрывается в отдельном потоке, не блокируя
+        event loop; задачи, уже отправленные в старый пул, дорабатывают на
+        старой модели.
+        """
+        inference_model = as_inference_model(model)
+        if self.mode != "process" or self._pool is None:
+            self.model = inference_model
+            return
+        pool = await asyncio.to_thread(self._create_started_pool, inference_model)
+        # Модель подменяется вместе с пулом: до этого новая модель
+        # пересылается в старый пул целиком, а не считается предзагруженной.
+        previous_pool, self._pool, self.model = self._pool, pool, inference_model
+        await asyncio.to_thread(previous_pool.shutdown, wait=False)
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+
+    async def score(self, model: Any, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self._pool is None:
+            raise RuntimeError("Inference executor is not started")
+        loop = asyncio.get_running_loop()
+        inference_model = as_inference_model(model)
+
+        if self.mode == "process" and inference_model is self.model:
+            call = (_score_in_process_worker, features)
+        elif self.mode == "process":
+            call = (_score_with_model, inference_model, features)
+        else:
+            call = (inference_model.score, features)
+
+        self._in_flight += 1
+        observe_inference_executor_load(self._in_flight, self.max_workers)
+        try:
+            return await loop.run_in_executor(self._pool, *call)
+        finally:
+            self._in_flight -= 1
+            observe_inference_executor_load(self._in_flight, self.max_workers)
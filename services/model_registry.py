@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import inspect
+import io
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Optional, Protocol
+
+import joblib
+import numpy as np
+
+from app.metrics import observe_model_reload, observe_model_version
+from app.sentry import report_exception
+from models.model import InferenceModel, get_mlflow_model_version, load_model_from_mlflow
+
+logger = logging.getLogger(__name__)
+
+MODEL_RELOAD_INTERVAL_SECONDS = float(os.getenv("MODEL_RELOAD_INTERVAL_SECONDS", "0"))
+MLFLOW_MODEL_NAME = os.getenv("MLFLOW_MODEL_NAME", "moderation-model")
+MLFLOW_MODEL_STAGE = os.getenv("MLFLOW_MODEL_STAGE", "Production")
+
+# Одна строка признаков: [is_verified_seller, images_qty, description_length, category]
+WARMUP_FEATURES = np.zeros((1, 4), dtype=np.float64)
+
+
+class ModelSource(Protocol):
+    def fingerprint(self) -> Optional[str]:
+        """Дешёвый признак того, что модель в источнике поменялась."""
+        ...
+
+    def load(self) -> InferenceModel:
+        ...
+
+
+def file_model_version(data: bytes) -> str:
+    # Версия считается по содержимому, а не по mtime: у всех подов с одним и тем
+    # же файлом она совпадает, и общий кэш в Redis остаётся общим.
+    return "file-" + hashlib.sha256(data).hexdigest()[:12]
+
+
+@dataclass(frozen=True)
+class FileModelSource:
+    path: Path
+
+    def fingerprint(self) -> Optional[str]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def load(self) -> InferenceModel:
+        data = self.path.read_bytes()
+        return InferenceModel(
+            estimator=joblib.load(io.BytesIO(data)),
+            version=file_model_version(data),
+        )
+
+
+@dataclass(frozen=True)
+class MlflowModelSource:
+    model_name: str = MLFLOW_MODEL_NAME
+    stage: str = MLFLOW_MODEL_STAGE
+
+    def fingerprint(self) -> Optional[str]:
+        return get_mlflow_model_version(self.model_name, self.stage)
+
+    def load(self) -> InferenceModel:
+        registry_version = self.fingerprint()
+        if registry_version is None:
+            raise RuntimeError(f"No model {self.model_name} in stage {self.stage}")
+        return InferenceModel(
+            estimator=load_model_from_mlflow(self.model_name, registry_version),
+            version=f"mlflow-{self.model_name}-{registry_version}",
+        )
+
+
+def load_and_warm(source: ModelSource) -> InferenceModel:
+    """Загружает модель и прогоняет через неё одну строку до подмены."""
+    model = source.load()
+    model.score(WARMUP_FEATURES)
+    return model
+
+
+class ModelWatcher:
+    """Опрашивает источник модели и подменяет текущую модель без рестарта.
+
+    Загрузка и прогрев идут в потоке, вне event loop; подмена — одно
+    присваивание ``self.model``, так что запрос видит либо старую модель,
+    либо новую целиком. ``on_swap`` вызывается с новой моделью перед
+    подменой (например, чтобы положить её в ``app.state`` и перезапустить пул);
+    если он возвращает корутину, её дожидаются. Если ``on_swap`` падает,
+    остаётся старая модель, а подмена повторяется на следующем опросе.
+    """
+
+    def __init__(
+        self,
+        source: ModelSource,
+        model: InferenceModel,
+        poll_interval: float = MODEL_RELOAD_INTERVAL_SECONDS,
+        on_swap: Optional[Callable[[InferenceModel], Any]] = None,
+    ) -> None:
+        self.source = source
+        self.model = model
+        self.poll_interval = poll_interval
+        self.on_swap = on_swap
+        self._fingerprint: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._fingerprint = await asyncio.to_thread(self.source.fingerprint)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def check(self) -> bool:
+        """Один опрос источника; возвращает True, если модель подменена."""
+        try:
+            fingerprint = await asyncio.to_thread(self.source.fingerprint)
+            if fingerprint is None or fingerprint == self._fingerprint:
+                return False
+            model = await asyncio.to_thread(load_and_warm, self.source)
+        except Exception:
+            logger.exception("model_reload_failed version=%s", self.model.version)
+            observe_model_reload("failed")
+            return False
+
+        previous_fingerprint, self._fingerprint = self._fingerprint, fingerprint
+        if model.version is not None and model.version == self.model.version:
+            return False
+
+        previous = self.model
+        if self.on_swap is not None:
+            # Модель считается подменённой, только когда её установил on_swap:
+            # при ошибке остаётся старая, и следующий опрос попробует снова.
+            try:
+                swapped = self.on_swap(model)
+                if inspect.isawaitable(swapped):
+                    await swapped
+            except Exception as exc:
+                logger.exception("model_swap_failed version=%s previous=%s", model.version, previous.version)
+                report_exception(exc)
+                observe_model_reload("failed")
+                self._fingerprint = previous_fingerprint
+                return False
+        self.model = model
+        observe_model_version(model.version, previous.version)
+        observe_model_reload("swapped")
+        logger.info("model_reloaded version=%s previous=%s", model.version, previous.version)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Один неудачный опрос не должен останавливать наблюдение.
+                logger.exception("model_watch_failed version=%s", self.model.version)
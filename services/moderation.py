@@ -27,6 +27,7 @@ class ModerationService:
             await kafka_client.send_moderation_request(
                 item_id=item_id,
                 task_id=moderation_task.id,
+                on_delivery_error=self._mark_enqueue_failed,
             )
         except Exception as exc:
             await self.moderation_repo.mark_failed(moderation_task.id, str(exc))
@@ -34,6 +35,10 @@ class ModerationService:
 
         return moderation_task.id, moderation_task.status
 
+    async def _mark_enqueue_failed(self, message: dict[str, Any], exc: BaseException) -> None:
+        # Сообщение не дошло до брокера после ответа клиенту (KAFKA_FIRE_AND_FORGET).
+        await self.moderation_repo.mark_failed(int(message["task_id"]), str(exc) or type(exc).__name__)
+
     async def get_result(
         self,
         task_id: int,
@@ -46,7 +51,8 @@ class ModerationService:
 
         result = await self.moderation_repo.get(task_id)
         if cache_storage is not None:
-            await cache_storage.set_moderation_result(task_id, result.dict())
+            # mode="json": даты в строки, иначе кодеки кэша их не сериализуют.
+            await cache_storage.set_moderation_result(task_id, result.model_dump(mode="json"))
         return result
 
     async def close_item(
@@ -60,5 +66,4 @@ class ModerationService:
 
         if cache_storage is not None:
             await cache_storage.delete_item_predictions(item_id)
-            for task_id in task_ids:
-                await cache_storage.delete_moderation_result(task_id)
+            await cache_storage.delete_moderation_results(task_ids)
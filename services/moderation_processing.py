@@ -1,16 +1,23 @@
-import asyncio
+import logging
 import os
-from typing import Any
+import time
+from typing import Any, Optional, Sequence
 
 from app.sentry import report_exception
 from clients.kafka import KafkaClient
 from repositories.adds import AddRepository
 from repositories.moderation_results import ModerationResultRepository
 from repositories.users import UserRepository
-from services.predict import predict_violation
+from models.model import get_model_version
+from models.moderation_results import ModerationResultModel
+from services.inference_executor import InferenceExecutor
+from services.predict import build_features_from_records, predict_violation_async, predict_violations_batch
+from services.retry_scheduler import RetryScheduler
+from storages.prediction_cache import PredictionCacheStorage
+
+logger = logging.getLogger(__name__)
 
 MAX_RETRY_COUNT = int(os.getenv("MODERATION_MAX_RETRY_COUNT", "3"))
-RETRY_DELAY_SECONDS = float(os.getenv("MODERATION_RETRY_DELAY_SECONDS", "1"))
 TEMPORARY_ERRORS = (RuntimeError, ConnectionError, TimeoutError)
 
 
@@ -21,15 +28,26 @@ async def process_moderation_message(
     add_repo: AddRepository,
     user_repo: UserRepository,
     kafka_client: KafkaClient,
+    executor: Optional[InferenceExecutor] = None,
+    cache_storage: Optional[PredictionCacheStorage] = None,
+    retry_scheduler: Optional[RetryScheduler] = None,
 ) -> None:
+    """Обрабатывает одно сообщение модерации.
+
+    Повтор после временной ошибки не ждёт здесь: он отдаётся в
+    ``retry_scheduler`` с экспоненциальной задержкой, а обработчик сразу
+    свободен для следующего сообщения. Без планировщика повтор уходит в
+    Kafka немедленно.
+    """
     task_id = int(payload["task_id"])
     item_id = int(payload["item_id"])
     retry_count = int(payload.get("retry_count", 0))
 
     try:
+        started_at = time.perf_counter()
         add = await add_repo.get(item_id)
         user = await user_repo.get(add.seller_id)
-        is_violation, probability = predict_violation(
+        is_violation, probability = await predict_violation_async(
             model=model,
             seller_id=user.id,
             item_id=add.id,
@@ -37,24 +55,135 @@ async def process_moderation_message(
             images_qty=add.images_qty,
             description=add.description,
             category=add.category,
+            executor=executor,
         )
-        await moderation_repo.mark_completed(task_id, is_violation, probability)
+        compute_seconds = time.perf_counter() - started_at
+        result = await moderation_repo.mark_completed(task_id, is_violation, probability)
     except Exception as exc:
         report_exception(exc)
         is_temporary = isinstance(exc, TEMPORARY_ERRORS)
         if is_temporary and retry_count < MAX_RETRY_COUNT:
-            await moderation_repo.mark_retry(task_id, str(exc))
-            await asyncio.sleep(RETRY_DELAY_SECONDS)
-            await kafka_client.send_moderation_request(
-                item_id=item_id,
-                task_id=task_id,
-                retry_count=retry_count + 1,
-            )
+            pending = await moderation_repo.mark_retry(task_id, str(exc))
+            if cache_storage is not None:
+                await _update_cache(cache_storage, pending)
+            if retry_scheduler is not None:
+                await retry_scheduler.schedule(item_id=item_id, task_id=task_id, retry_count=retry_count + 1)
+            else:
+                await kafka_client.send_moderation_request(
+                    item_id=item_id,
+                    task_id=task_id,
+                    retry_count=retry_count + 1,
+                )
             return
 
-        await moderation_repo.mark_failed(task_id, str(exc))
+        failed = await moderation_repo.mark_failed(task_id, str(exc))
+        if cache_storage is not None:
+            await _update_cache(cache_storage, failed)
         await kafka_client.send_to_dlq(
             payload,
             str(exc),
             retry_count=retry_count + 1,
         )
+        return
+
+    if cache_storage is not None:
+        await _update_cache(cache_storage, result, model, compute_seconds)
+
+
+async def process_moderation_batch(
+    payloads: Sequence[dict[str, Any]],
+    model: Any,
+    moderation_repo: ModerationResultRepository,
+    add_repo: AddRepository,
+    user_repo: UserRepository,
+    kafka_client: KafkaClient,
+    executor: Optional[InferenceExecutor] = None,
+    cache_storage: Optional[PredictionCacheStorage] = None,
+    retry_scheduler: Optional[RetryScheduler] = None,
+) -> None:
+    """Пачка сообщений: один запрос за объявлениями с продавцами, один
+    векторный вызов модели, один UPDATE и одна запись в кэш.
+
+    Сообщения, которые не удалось обработать пачкой (объявления нет, ошибка
+    БД или модели), проходят через ``process_moderation_message`` — там
+    повторы и DLQ.
+    """
+    if not payloads:
+        return
+    single_kwargs = dict(
+        model=model,
+        moderation_repo=moderation_repo,
+        add_repo=add_repo,
+        user_repo=user_repo,
+        kafka_client=kafka_client,
+        executor=executor,
+        cache_storage=cache_storage,
+        retry_scheduler=retry_scheduler,
+    )
+    try:
+        started_at = time.perf_counter()
+        adds_with_sellers = await add_repo.get_many_with_seller(
+            list(dict.fromkeys(int(payload["item_id"]) for payload in payloads))
+        )
+        found = [payload for payload in payloads if int(payload["item_id"]) in adds_with_sellers]
+        missing = [payload for payload in payloads if int(payload["item_id"]) not in adds_with_sellers]
+        predictions = await predict_violations_batch(
+            model,
+            build_features_from_records([adds_with_sellers[int(payload["item_id"])] for payload in found]),
+            executor,
+        )
+        compute_seconds = (time.perf_counter() - started_at) / max(len(found), 1)
+        results = await moderation_repo.mark_completed_many([
+            (int(payload["task_id"]), is_violation, probability)
+            for payload, (is_violation, probability) in zip(found, predictions)
+        ])
+    except Exception as exc:
+        report_exception(exc)
+        logger.warning("moderation_batch_failed size=%s, falling back to single messages", len(payloads), exc_info=True)
+        for payload in payloads:
+            await process_moderation_message(payload=payload, **single_kwargs)
+        return
+
+    for payload in missing:
+        await process_moderation_message(payload=payload, **single_kwargs)
+    if cache_storage is not None and results:
+        try:
+            await cache_storage.set_completed_moderations(
+                [
+                    (
+                        result.id,
+                        result.model_dump(mode="json"),
+                        result.item_id,
+                        {"is_violation": bool(result.is_violation), "probability": float(result.probability)},
+                    )
+                    for result in results
+                ],
+                get_model_version(model),
+                compute_seconds,
+            )
+        except Exception:
+            logger.warning("moderation_cache_write_failed tasks=%s", len(results), exc_info=True)
+
+
+async def _update_cache(
+    cache_storage: PredictionCacheStorage,
+    result: ModerationResultModel,
+    model: Any = None,
+    compute_seconds: float = 0.0,
+) -> None:
+    # Каждая смена статуса перезаписывает задачу в кэше. Результат уже в БД:
+    # сбой Redis не должен превращать задачу в ошибку, опрос просто уйдёт в Postgres.
+    try:
+        if result.status == "completed":
+            await cache_storage.set_completed_moderation(
+                task_id=result.id,
+                result=result.model_dump(mode="json"),
+                item_id=result.item_id,
+                prediction={"is_violation": bool(result.is_violation), "probability": float(result.probability)},
+                model_version=get_model_version(model),
+                compute_seconds=compute_seconds,
+            )
+        else:
+            await cache_storage.set_moderation_result(result.id, result.model_dump(mode="json"))
+    except Exception:
+        logger.warning("moderation_cache_write_failed task_id=%s", result.id, exc_info=True)
@@ -1,15 +1,34 @@
+import asyncio
 import logging
-from dataclasses import dataclass
-from typing import Tuple, Any, Optional
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Tuple, Any, Awaitable, Callable, Hashable, Mapping, Optional, Sequence, Union
 
 import numpy as np
-from app.metrics import observe_prediction_result, track_prediction_duration
+from app.metrics import (
+    observe_background_refresh,
+    observe_coalesced_request,
+    observe_prediction_result,
+    track_prediction_duration,
+)
 from errors import AddNotFoundError
+from models.model import as_inference_model, get_model_version
 from repositories.adds import AddRepository
-from storages.prediction_cache import PredictionCacheStorage
+from services.inference_executor import InferenceExecutor
+from services.prediction_batcher import PredictionBatcher
+from services.single_flight import SingleFlight
+from storages.prediction_cache import PredictionCacheStorage, needs_refresh
 
 logger = logging.getLogger(__name__)
 
+# Необязательная блокировка в Redis, чтобы пересчёт одного объявления после
+# истечения кэша шёл в одном процессе на весь кластер, а не в каждом.
+PREDICTION_CACHE_LOCK_ENABLED = os.getenv("PREDICTION_CACHE_LOCK_ENABLED", "false").lower() == "true"
+PREDICTION_CACHE_LOCK_TTL_MS = int(os.getenv("PREDICTION_CACHE_LOCK_TTL_MS", "2000"))
+PREDICTION_CACHE_LOCK_WAIT_MS = int(os.getenv("PREDICTION_CACHE_LOCK_WAIT_MS", "200"))
+PREDICTION_CACHE_LOCK_POLL_MS = int(os.getenv("PREDICTION_CACHE_LOCK_POLL_MS", "10"))
+
 
 def build_features(
     is_verified_seller: bool,
@@ -25,6 +44,34 @@ def build_features(
     ]], dtype=float)
 
 
+ColumnLike = Union[Sequence[Any], np.ndarray]
+
+
+def build_features_batch(
+    is_verified_seller: ColumnLike,
+    images_qty: ColumnLike,
+    description_lengths: ColumnLike,
+    category: ColumnLike,
+) -> np.ndarray:
+    """Колоночный вариант ``build_features``: строка i матрицы совпадает
+    с ``build_features`` для i-го объявления."""
+    features = np.empty((len(images_qty), 4), dtype=np.float64)
+    features[:, 0] = np.asarray(is_verified_seller, dtype=bool)
+    np.divide(np.asarray(images_qty, dtype=np.float64), 10.0, out=features[:, 1])
+    np.divide(np.asarray(description_lengths, dtype=np.float64), 1000.0, out=features[:, 2])
+    np.divide(np.asarray(category, dtype=np.float64), 100.0, out=features[:, 3])
+    return features
+
+
+def build_features_from_records(records: Sequence[Mapping[str, Any]]) -> np.ndarray:
+    return build_features_batch(
+        is_verified_seller=[record["is_verified_seller"] for record in records],
+        images_qty=[record["images_qty"] for record in records],
+        description_lengths=[len(record["description"]) for record in records],
+        category=[record["category"] for record in records],
+    )
+
+
 def predict_violation(
     model: Any,
     seller_id: int,
@@ -49,8 +96,9 @@ def predict_violation(
     )
 
     with track_prediction_duration():
-        probability = float(model.predict_proba(features)[0][1])
-        is_violation = bool(model.predict(features)[0])
+        labels, probabilities = as_inference_model(model).score(features)
+    is_violation = bool(labels[0])
+    probability = float(probabilities[0])
 
     logger.info(
         "predict_response is_violation=%s probability=%.6f",
@@ -61,9 +109,81 @@ def predict_violation(
     return is_violation, probability
 
 
+async def predict_violation_async(
+    model: Any,
+    seller_id: int,
+    item_id: int,
+    is_verified_seller: bool,
+    images_qty: int,
+    description: str,
+    category: int,
+    batcher: Optional[PredictionBatcher] = None,
+    executor: Optional[InferenceExecutor] = None,
+) -> Tuple[bool, float]:
+    if batcher is None and executor is None:
+        return predict_violation(
+            model=model,
+            seller_id=seller_id,
+            item_id=item_id,
+            is_verified_seller=is_verified_seller,
+            images_qty=images_qty,
+            description=description,
+            category=category,
+        )
+
+    features = build_features(
+        is_verified_seller=is_verified_seller,
+        images_qty=images_qty,
+        description=description,
+        category=category,
+    )
+    logger.info(
+        "predict_request seller_id=%s item_id=%s features=%s",
+        seller_id,
+        item_id,
+        features.tolist()[0],
+    )
+
+    if batcher is not None:
+        is_violation, probability = await batcher.predict(model, features)
+    else:
+        with track_prediction_duration():
+            labels, probabilities = await executor.score(model, features)
+        is_violation = bool(labels[0])
+        probability = float(probabilities[0])
+
+    logger.info(
+        "predict_response is_violation=%s probability=%.6f",
+        is_violation,
+        probability,
+    )
+    return is_violation, probability
+
+
+async def predict_violations_batch(
+    model: Any,
+    features: np.ndarray,
+    executor: Optional[InferenceExecutor] = None,
+) -> list[Tuple[bool, float]]:
+    if len(features) == 0:
+        return []
+    with track_prediction_duration():
+        if executor is not None:
+            labels, probabilities = await executor.score(model, features)
+        else:
+            labels, probabilities = as_inference_model(model).score(features)
+    logger.info("predict_batch size=%s", len(features))
+    return [
+        (bool(is_violation), float(probability))
+        for is_violation, probability in zip(labels, probabilities)
+    ]
+
+
 @dataclass(frozen=True)
 class PredictService:
     add_repo: AddRepository = AddRepository()
+    cache_lock_enabled: bool = PREDICTION_CACHE_LOCK_ENABLED
+    single_flight: SingleFlight = field(default_factory=SingleFlight, repr=False, compare=False)
 
     @staticmethod
     def _result_dict(is_violation: bool, probability: float) -> dict[str, Any]:
@@ -78,49 +198,238 @@ class PredictService:
         item_id: int,
         model: Any,
         cache_storage: Optional[PredictionCacheStorage] = None,
+        batcher: Optional[PredictionBatcher] = None,
+        executor: Optional[InferenceExecutor] = None,
     ) -> Tuple[bool, float]:
+        model_version = get_model_version(model)
+
+        def compute() -> Awaitable[Tuple[bool, float]]:
+            return self._compute_simple_prediction(
+                item_id=item_id,
+                model=model,
+                model_version=model_version,
+                cache_storage=cache_storage,
+                batcher=batcher,
+                executor=executor,
+            )
+
+        flight_key = ("simple", item_id, model_version)
         if cache_storage is not None:
-            cached = await cache_storage.get_simple_prediction(item_id)
+            cached = await cache_storage.get_simple_prediction(item_id, model_version)
             if cached is not None:
+                # Устаревшая запись отдаётся сразу, а пересчёт идёт в фоне — один на ключ.
+                if needs_refresh(cached):
+                    self._refresh_in_background(flight_key, compute)
                 return bool(cached["is_violation"]), float(cached["probability"])
 
-        add_with_seller = await self.add_repo.get_with_seller(item_id)
+        # Конкурентные промахи по одному объявлению ждут один запрос в БД и один вызов модели.
+        return await self.single_flight.do(flight_key, compute)
 
-        is_violation, probability = predict_violation(
-            model=model,
-            seller_id=int(add_with_seller["seller_id"]),
-            item_id=int(add_with_seller["add_id"]),
-            is_verified_seller=bool(add_with_seller["is_verified_seller"]),
-            images_qty=int(add_with_seller["images_qty"]),
-            description=str(add_with_seller["description"]),
-            category=int(add_with_seller["category"]),
-        )
-        if cache_storage is not None:
-            await cache_storage.set_simple_prediction(
+    def _refresh_in_background(
+        self,
+        flight_key: Hashable,
+        compute: Callable[[], Awaitable[Tuple[bool, float]]],
+    ) -> None:
+        async def refresh() -> Tuple[bool, float]:
+            try:
+                return await compute()
+            except Exception:
+                logger.exception("background_refresh_failed key=%s", flight_key)
+                observe_background_refresh("failed")
+                raise
+
+        if self.single_flight.start(flight_key, refresh) is not None:
+            observe_background_refresh("started")
+
+    async def _compute_simple_prediction(
+        self,
+        *,
+        item_id: int,
+        model: Any,
+        model_version: Optional[str],
+        cache_storage: Optional[PredictionCacheStorage],
+        batcher: Optional[PredictionBatcher],
+        executor: Optional[InferenceExecutor],
+    ) -> Tuple[bool, float]:
+        lock_token = None
+        if cache_storage is not None and self.cache_lock_enabled:
+            lock_token = await cache_storage.acquire_simple_prediction_lock(
                 item_id,
-                self._result_dict(is_violation, probability),
+                model_version,
+                PREDICTION_CACHE_LOCK_TTL_MS,
+            )
+            if lock_token is None:
+                cached = await self._wait_for_simple_prediction(item_id, model_version, cache_storage)
+                if cached is not None:
+                    observe_coalesced_request("redis_lock")
+                    return cached
+
+        started_at = time.perf_counter()
+        try:
+            add_with_seller = await self.add_repo.get_with_seller(item_id)
+
+            is_violation, probability = await predict_violation_async(
+                model=model,
+                batcher=batcher,
+                executor=executor,
+                seller_id=int(add_with_seller["seller_id"]),
+                item_id=int(add_with_seller["add_id"]),
+                is_verified_seller=bool(add_with_seller["is_verified_seller"]),
+                images_qty=int(add_with_seller["images_qty"]),
+                description=str(add_with_seller["description"]),
+                category=int(add_with_seller["category"]),
             )
-        observe_prediction_result(is_violation, probability)
+            if cache_storage is not None:
+                await cache_storage.set_simple_prediction(
+                    item_id,
+                    self._result_dict(is_violation, probability),
+                    model_version,
+                    compute_seconds=time.perf_counter() - started_at,
+                )
+        finally:
+            if lock_token is not None:
+                await cache_storage.release_simple_prediction_lock(item_id, lock_token, model_version)
+        observe_prediction_result(is_violation, probability, model_version)
         return is_violation, probability
 
+    @staticmethod
+    async def _wait_for_simple_prediction(
+        item_id: int,
+        model_version: Optional[str],
+        cache_storage: PredictionCacheStorage,
+    ) -> Optional[Tuple[bool, float]]:
+        # Блокировку держит другой процесс: ждём его результат в кэше, но не
+        # дольше PREDICTION_CACHE_LOCK_WAIT_MS, затем считаем сами.
+        deadline = time.monotonic() + PREDICTION_CACHE_LOCK_WAIT_MS / 1000
+        while time.monotonic() < deadline:
+            await asyncio.sleep(PREDICTION_CACHE_LOCK_POLL_MS / 1000)
+            cached = await cache_storage.get_simple_prediction(item_id, model_version)
+            if cached is not None:
+                return bool(cached["is_violation"]), float(cached["probability"])
+        return None
+
+    async def predict_many_by_item_ids(
+        self,
+        *,
+        item_ids: Sequence[int],
+        model: Any,
+        cache_storage: Optional[PredictionCacheStorage] = None,
+        executor: Optional[InferenceExecutor] = None,
+    ) -> dict[int, Tuple[bool, float]]:
+        model_version = get_model_version(model)
+        unique_ids = list(dict.fromkeys(int(item_id) for item_id in item_ids))
+        results: dict[int, Tuple[bool, float]] = {}
+        if cache_storage is not None:
+            cached_results = await cache_storage.get_simple_predictions(unique_ids, model_version)
+            stale = []
+            for item_id, cached in zip(unique_ids, cached_results):
+                if cached is not None:
+                    results[item_id] = bool(cached["is_violation"]), float(cached["probability"])
+                    if needs_refresh(cached):
+                        stale.append(item_id)
+            if stale:
+                self._refresh_many_in_background(
+                    stale,
+                    model=model,
+                    model_version=model_version,
+                    cache_storage=cache_storage,
+                    executor=executor,
+                )
+
+        misses = [item_id for item_id in unique_ids if item_id not in results]
+        if misses:
+            results.update(await self._compute_simple_predictions(
+                misses,
+                model=model,
+                model_version=model_version,
+                cache_storage=cache_storage,
+                executor=executor,
+            ))
+        return results
+
+    def _refresh_many_in_background(
+        self,
+        item_ids: Sequence[int],
+        *,
+        model: Any,
+        model_version: Optional[str],
+        cache_storage: PredictionCacheStorage,
+        executor: Optional[InferenceExecutor],
+    ) -> None:
+        # Ключи те же, что у predict_by_item_id: объявление, которое уже
+        # пересчитывается по одиночному запросу, второй раз не считается.
+        async def refresh(keys: list[tuple[str, int, Optional[str]]]) -> dict[Hashable, Tuple[bool, float]]:
+            try:
+                computed = await self._compute_simple_predictions(
+                    [key[1] for key in keys],
+                    model=model,
+                    model_version=model_version,
+                    cache_storage=cache_storage,
+                    executor=executor,
+                )
+            except Exception:
+                logger.exception("background_refresh_failed items=%s", len(keys))
+                observe_background_refresh("failed")
+                raise
+            return {key: computed[key[1]] for key in keys if key[1] in computed}
+
+        keys = [("simple", item_id, model_version) for item_id in item_ids]
+        if self.single_flight.start_many(keys, refresh) is not None:
+            observe_background_refresh("started")
+
+    async def _compute_simple_predictions(
+        self,
+        item_ids: Sequence[int],
+        *,
+        model: Any,
+        model_version: Optional[str],
+        cache_storage: Optional[PredictionCacheStorage],
+        executor: Optional[InferenceExecutor],
+    ) -> dict[int, Tuple[bool, float]]:
+        started_at = time.perf_counter()
+        adds_with_sellers = await self.add_repo.get_many_with_seller(list(item_ids))
+        found = [item_id for item_id in item_ids if item_id in adds_with_sellers]
+        if not found:
+            return {}
+        features = build_features_from_records([adds_with_sellers[item_id] for item_id in found])
+        predictions = await predict_violations_batch(model, features, executor)
+        results: dict[int, Tuple[bool, float]] = {}
+        for item_id, (is_violation, probability) in zip(found, predictions):
+            results[item_id] = is_violation, probability
+            observe_prediction_result(is_violation, probability, model_version)
+        if cache_storage is not None:
+            # Цена пересчёта для XFetch — доля пачки на одно объявление.
+            await cache_storage.set_simple_predictions(
+                {item_id: self._result_dict(*results[item_id]) for item_id in found},
+                model_version,
+                compute_seconds=(time.perf_counter() - started_at) / len(found),
+            )
+        return results
+
     async def predict_from_payload(
         self,
         *,
         payload: dict[str, Any],
         model: Any,
         cache_storage: Optional[PredictionCacheStorage] = None,
+        batcher: Optional[PredictionBatcher] = None,
+        executor: Optional[InferenceExecutor] = None,
     ) -> Tuple[bool, float]:
         item_id = int(payload["item_id"])
+        model_version = get_model_version(model)
         if cache_storage is not None:
             cached = await cache_storage.get_sync_prediction(
                 item_id=item_id,
                 payload=payload,
+                model_version=model_version,
             )
             if cached is not None:
                 return bool(cached["is_violation"]), float(cached["probability"])
 
-        is_violation, probability = predict_violation(
+        is_violation, probability = await predict_violation_async(
             model=model,
+            batcher=batcher,
+            executor=executor,
             seller_id=int(payload["seller_id"]),
             item_id=item_id,
             is_verified_seller=bool(payload["is_verified_seller"]),
@@ -133,6 +442,41 @@ class PredictService:
                 item_id=item_id,
                 payload=payload,
                 result=self._result_dict(is_violation, probability),
+                model_version=model_version,
             )
-        observe_prediction_result(is_violation, probability)
+        observe_prediction_result(is_violation, probability, model_version)
         return is_violation, probability
+
+    async def predict_many_from_payloads(
+        self,
+        *,
+        payloads: Sequence[dict[str, Any]],
+        model: Any,
+        cache_storage: Optional[PredictionCacheStorage] = None,
+        executor: Optional[InferenceExecutor] = None,
+    ) -> list[Tuple[bool, float]]:
+        model_version = get_model_version(model)
+        results: list[Optional[Tuple[bool, float]]] = [None] * len(payloads)
+        cache_items = [(int(payload["item_id"]), payload) for payload in payloads]
+        if cache_storage is not None:
+            cached_results = await cache_storage.get_sync_predictions(cache_items, model_version)
+            for index, cached in enumerate(cached_results):
+                if cached is not None:
+                    results[index] = bool(cached["is_violation"]), float(cached["probability"])
+
+        misses = [index for index, result in enumerate(results) if result is None]
+        if misses:
+            features = build_features_from_records([payloads[index] for index in misses])
+            predictions = await predict_violations_batch(model, features, executor)
+            for index, (is_violation, probability) in zip(misses, predictions):
+                results[index] = is_violation, probability
+                observe_prediction_result(is_violation, probability, model_version)
+            if cache_storage is not None:
+                await cache_storage.set_sync_predictions(
+                    [
+                        (cache_items[index][0], payloads[index], self._result_dict(*results[index]))
+                        for index in misses
+                    ],
+                    model_version,
+                )
+        return results
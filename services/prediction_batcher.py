@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional, Tuple
+
+import numpy as np
+
+from app.metrics import observe_prediction_batch, track_prediction_duration
+from models.model import as_inference_model
+
+if TYPE_CHECKING:
+    from services.inference_executor import InferenceExecutor
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_BATCH_MAX_SIZE = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "64"))
+PREDICTION_BATCH_MAX_WAIT_MS = float(os.getenv("PREDICTION_BATCH_MAX_WAIT_MS", "2"))
+# Сколько батчей одновременно считается в executor; остальные ждут в очереди.
+PREDICTION_BATCH_MAX_IN_FLIGHT = int(os.getenv("PREDICTION_BATCH_MAX_IN_FLIGHT", "4"))
+
+
+@dataclass
+class _PendingPrediction:
+    model: Any
+    features: np.ndarray
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+def _fail_stopped(batch: list[_PendingPrediction]) -> None:
+    for pending in batch:
+        if not pending.future.done():
+            pending.future.set_exception(RuntimeError("Prediction batcher is stopped"))
+
+
+class PredictionBatcher:
+    """Собирает одиночные запросы на инференс в батчи.
+
+    Батч отправляется в модель, когда набралось ``max_batch_size`` строк
+    или с момента первого запроса прошло ``max_wait_ms`` миллисекунд.
+    Если передан ``executor``, батчи считаются в нём, и сбор следующего
+    батча не ждёт окончания инференса предыдущего — но одновременно не
+    больше ``max_in_flight``. Очередь ограничена ``max_batch_size *
+    max_in_flight`` запросами: при перегрузке ``predict`` ждёт места в ней.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = PREDICTION_BATCH_MAX_SIZE,
+        max_wait_ms: float = PREDICTION_BATCH_MAX_WAIT_MS,
+        executor: Optional[InferenceExecutor] = None,
+        max_in_flight: int = PREDICTION_BATCH_MAX_IN_FLIGHT,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be positive")
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max(max_wait_ms, 0.0) / 1000.0
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self._flush_slots: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[asyncio.Queue[_PendingPrediction]] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._flush_tasks: set[asyncio.Task[None]] = set()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_batch_size * self.max_in_flight)
+            self._flush_slots = asyncio.Semaphore(self.max_in_flight)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        if self._queue is not None:
+            # Каждое извлечение будит одного вызывающего, ждавшего места в
+            # очереди: он докладывает запрос на следующей итерации цикла.
+            while not self._queue.empty():
+                while not self._queue.empty():
+                    _fail_stopped([self._queue.get_nowait()])
+                await asyncio.sleep(0)
+            self._queue = None
+
+    async def predict(self, model: Any, features: np.ndarray) -> Tuple[bool, float]:
+        if self._queue is None:
+            raise RuntimeError("Prediction batcher is not started")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingPrediction(model=model, features=features, future=future))
+        return await future
+
+    async def _run(self) -> None:
+        assert self._queue is not None and self._flush_slots is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                deadline = loop.time() + self.max_wait_seconds
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        while len(batch) < self.max_batch_size and not self._queue.empty():
+                            batch.append(self._queue.get_nowait())
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                if self.executor is None:
+                    await self._flush(batch)
+                else:
+                    # Все слоты заняты — новые батчи не собираются, очередь заполняется
+                    # и притормаживает вызывающих.
+                    await self._flush_slots.acquire()
+                    flush_task = asyncio.create_task(self._flush(batch))
+                    self._flush_tasks.add(flush_task)
+                    flush_task.add_done_callback(self._flush_done)
+            except asyncio.CancelledError:
+                # stop() посреди сбора или инференса батча: его запросы уже
+                # сняты с очереди, и иначе их вызывающие ждали бы вечно.
+                _fail_stopped(batch)
+                raise
+
+    def _flush_done(self, task: asyncio.Task[None]) -> None:
+        self._flush_tasks.discard(task)
+        if self._flush_slots is not None:
+            self._flush_slots.release()
+
+    async def _score(self, model: Any, matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.executor is not None:
+            return await self.executor.score(model, matrix)
+        return as_inference_model(model).score(matrix)
+
+    async def _flush(self, batch: list[_PendingPrediction]) -> None:
+        flushed_at = time.perf_counter()
+        observe_prediction_batch(
+            len(batch),
+            (flushed_at - pending.enqueued_at for pending in batch),
+        )
+
+        groups: dict[int, list[_PendingPrediction]] = {}
+        for pending in batch:
+            groups.setdefault(id(pending.model), []).append(pending)
+
+        for group in groups.values():
+            try:
+                matrix = np.vstack([pending.features for pending in group])
+                with track_prediction_duration():
+                    labels, probabilities = await self._score(group[0].model, matrix)
+            except Exception as exc:
+                logger.exception("prediction_batch_failed size=%s", len(group))
+                for pending in group:
+                    if not pending.future.done():
+                        pending.future.set_exception(exc)
+                continue
+
+            logger.debug("prediction_batch size=%s", len(group))
+            for pending, label, probability in zip(group, labels, probabilities):
+                if not pending.future.done():
+                    pending.future.set_result((bool(label), float(probability)))
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Optional, Protocol
+
+from app.metrics import observe_retry_queue
+from clients.redis import REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+# Отдельный Redis без шардинга и вытеснения: очередь хранит задачи без TTL.
+MODERATION_RETRY_REDIS_URL = os.getenv("MODERATION_RETRY_REDIS_URL", REDIS_URL)
+MODERATION_RETRY_QUEUE_KEY = os.getenv("MODERATION_RETRY_QUEUE_KEY", "moderation:retry:queue")
+MODERATION_RETRY_BASE_DELAY_SECONDS = float(
+    os.getenv("MODERATION_RETRY_BASE_DELAY_SECONDS", os.getenv("MODERATION_RETRY_DELAY_SECONDS", "1"))
+)
+MODERATION_RETRY_MAX_DELAY_SECONDS = float(os.getenv("MODERATION_RETRY_MAX_DELAY_SECONDS", "60"))
+MODERATION_RETRY_POLL_SECONDS = float(os.getenv("MODERATION_RETRY_POLL_SECONDS", "0.5"))
+MODERATION_RETRY_DISPATCH_BATCH = int(os.getenv("MODERATION_RETRY_DISPATCH_BATCH", "100"))
+
+# Забирает готовые к повтору задачи и удаляет их из очереди атомарно, так что
+# при нескольких воркерах каждая задача уходит в Kafka один раз. Первый
+# элемент ответа — сколько задач осталось в очереди.
+POP_DUE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+if #due > 0 then
+    redis.call('ZREM', KEYS[1], unpack(due))
+end
+table.insert(due, 1, redis.call('ZCARD', KEYS[1]))
+return due
+"""
+
+
+def backoff_delay(
+    retry_count: int,
+    base_delay: float = MODERATION_RETRY_BASE_DELAY_SECONDS,
+    max_delay: float = MODERATION_RETRY_MAX_DELAY_SECONDS,
+) -> float:
+    """Экспоненциальная задержка перед повтором номер ``retry_count`` (с 1)
+    со случайной половиной: повторы после общего сбоя не приходят разом."""
+    delay = min(max_delay, base_delay * 2 ** max(retry_count - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryScheduler(Protocol):
+    async def schedule(self, item_id: int, task_id: int, retry_count: int) -> None:
+        ...
+
+
+class RedisRetryScheduler:
+    """Очередь отложенных повторов модерации в sorted set Redis (score —
+    время, когда повтор можно отправлять).
+
+    Обработчик сообщения только кладёт повтор в очередь и сразу берёт
+    следующее сообщение; ``run`` в фоне перекладывает созревшие повторы
+    обратно в топик модерации.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        key: str = MODERATION_RETRY_QUEUE_KEY,
+        base_delay: float = MODERATION_RETRY_BASE_DELAY_SECONDS,
+        max_delay: float = MODERATION_RETRY_MAX_DELAY_SECONDS,
+    ) -> None:
+        self.client = client
+        self.key = key
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._pop_due_script: Optional[Any] = None
+
+    async def schedule(self, item_id: int, task_id: int, retry_count: int, delay: Optional[float] = None) -> None:
+        if delay is None:
+            delay = backoff_delay(retry_count, self.base_delay, self.max_delay)
+        member = json.dumps({"item_id": item_id, "task_id": task_id, "retry_count": retry_count})
+        await self.client.zadd(self.key, {member: time.time() + delay})
+
+    async def pop_due(self, limit: int = MODERATION_RETRY_DISPATCH_BATCH) -> list[dict[str, int]]:
+        if self._pop_due_script is None:
+            self._pop_due_script = self.client.register_script(POP_DUE_SCRIPT)
+        remaining, *due = await self._pop_due_script(keys=[self.key], args=[time.time(), limit])
+        observe_retry_queue(int(remaining))
+        return [json.loads(member) for member in due]
+
+    async def dispatch_due(self, kafka_client: Any, limit: int = MODERATION_RETRY_DISPATCH_BATCH) -> int:
+        due = await self.pop_due(limit)
+        for index, retry in enumerate(due):
+            try:
+                await kafka_client.send_moderation_request(**retry)
+            except Exception:
+                # Повтор уже снят с очереди: возвращаем его и все неотправленные.
+                logger.exception("moderation_retry_dispatch_failed task_id=%s", retry["task_id"])
+                for pending in due[index:]:
+                    await self.schedule(**pending, delay=self.base_delay)
+                return index
+        return len(due)
+
+    async def run(self, kafka_client: Any, poll_interval: float = MODERATION_RETRY_POLL_SECONDS) -> None:
+        while True:
+            try:
+                dispatched = await self.dispatch_due(kafka_client)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("moderation_retry_queue_failed")
+                dispatched = 0
+            if dispatched < MODERATION_RETRY_DISPATCH_BATCH:
+                await asyncio.sleep(poll_interval)
+
+
+class LocalRetryScheduler:
+    """Повторы без Redis: отложенная отправка фоновой задачей процесса.
+
+    Потребление не блокируется, но отложенные повторы не переживают рестарт
+    воркера — как и прежний ``asyncio.sleep`` в обработчике.
+    """
+
+    def __init__(
+        self,
+        kafka_client: Any,
+        base_delay: float = MODERATION_RETRY_BASE_DELAY_SECONDS,
+        max_delay: float = MODERATION_RETRY_MAX_DELAY_SECONDS,
+    ) -> None:
+        self.kafka_client = kafka_client
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def schedule(self, item_id: int, task_id: int, retry_count: int) -> None:
+        delay = backoff_delay(retry_count, self.base_delay, self.max_delay)
+        task = asyncio.create_task(self._send_later(delay, item_id, task_id, retry_count))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_later(self, delay: float, item_id: int, task_id: int, retry_count: int) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.kafka_client.send_moderation_request(item_id=item_id, task_id=task_id, retry_count=retry_count)
+        except Exception:
+            logger.exception("moderation_retry_dispatch_failed task_id=%s", task_id)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
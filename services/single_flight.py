@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Hashable, Mapping, Optional, Sequence, TypeVar
+
+from app.metrics import observe_coalesced_request
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Схлопывает конкурентные вызовы с одним ключом в одно вычисление.
+
+    Первый вызов запускает задачу, остальные ждут её же результат. Задача
+    защищена ``asyncio.shield``: отмена одного из ожидающих (например,
+    отключился клиент) не отменяет вычисление для остальных.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = self._start(key, func)
+        else:
+            observe_coalesced_request("process")
+        return await asyncio.shield(task)
+
+    def start(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Optional[asyncio.Task]:
+        """Запускает вычисление в фоне, не дожидаясь его.
+
+        Если по ключу уже что-то выполняется, возвращает None: второй фоновый
+        пересчёт того же ключа не нужен.
+        """
+        if key in self._calls:
+            return None
+        return self._start(key, func)
+
+    def start_many(
+        self,
+        keys: Sequence[Hashable],
+        func: Callable[[list[Hashable]], Awaitable[Mapping[Hashable, T]]],
+    ) -> Optional[asyncio.Task]:
+        """Запускает в фоне одно вычисление сразу для нескольких ключей.
+
+        ``func`` получает только ключи, которые ещё не выполняются, и
+        возвращает значения по ключам; ожидающий ``do`` по любому из них
+        получает своё значение. Если свободных ключей нет, возвращает None.
+        """
+        free = [key for key in dict.fromkeys(keys) if key not in self._calls]
+        if not free:
+            return None
+        batch = asyncio.ensure_future(func(free))
+        for key in free:
+            self._start(key, lambda key=key: self._pick(batch, key))
+        return batch
+
+    @staticmethod
+    async def _pick(batch: "asyncio.Future[Mapping[Hashable, T]]", key: Hashable) -> T:
+        return (await batch)[key]
+
+    def _start(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        task = asyncio.ensure_future(func())
+        self._calls[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Если все ожидающие отменены, исключение никто не заберёт.
+        if not task.cancelled():
+            task.exception()
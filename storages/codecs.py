@@ -0,0 +1,135 @@
+"""Сериализация значений кэша в Redis.
+
+Первый байт значения — тег формата. Старые записи без тега — JSON, они
+начинаются с ``{`` и читаются как раньше, поэтому переключение кодека не
+требует сброса кэша. Читается любой формат, пишется — выбранный в
+``CACHE_CODEC``.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import struct
+from typing import Any, Optional, Protocol, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_CODEC = os.getenv("CACHE_CODEC", "struct").lower()
+CACHE_CODECS = ("json", "msgpack", "struct")
+
+PREDICTION_STRUCT_TAG = 0x01
+MSGPACK_TAG = 0x02
+PREDICTION_SOFT_TTL_STRUCT_TAG = 0x03
+JSON_PREFIX = ord("{")
+
+# тег, is_violation, probability: 10 байт вместо ~45 в JSON
+_PREDICTION_STRUCT = struct.Struct("<B?d")
+_PREDICTION_FIELDS = frozenset(("is_violation", "probability"))
+# то же плюс мягкий срок (unix-время) и время пересчёта для XFetch: 22 байта
+_PREDICTION_SOFT_TTL_STRUCT = struct.Struct("<B?ddf")
+_PREDICTION_SOFT_TTL_FIELDS = _PREDICTION_FIELDS | {"fresh_until", "delta"}
+
+
+class CacheCodec(Protocol):
+    def encode(self, value: dict[str, Any]) -> bytes:
+        ...
+
+    def decode(self, raw: Union[bytes, str]) -> dict[str, Any]:
+        ...
+
+
+def decode_value(raw: Union[bytes, str]) -> dict[str, Any]:
+    if isinstance(raw, str):
+        return json.loads(raw)
+    tag = raw[0]
+    if tag == PREDICTION_STRUCT_TAG:
+        _, is_violation, probability = _PREDICTION_STRUCT.unpack(raw)
+        return {"is_violation": is_violation, "probability": probability}
+    if tag == PREDICTION_SOFT_TTL_STRUCT_TAG:
+        _, is_violation, probability, fresh_until, delta = _PREDICTION_SOFT_TTL_STRUCT.unpack(raw)
+        return {
+            "is_violation": is_violation,
+            "probability": probability,
+            "fresh_until": fresh_until,
+            "delta": delta,
+        }
+    if tag == MSGPACK_TAG:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not available")
+        return msgpack.unpackb(raw[1:])
+    if tag == JSON_PREFIX:
+        return json.loads(raw)
+    raise ValueError(f"Unknown cache value format: {tag:#04x}")
+
+
+class JsonCodec:
+    def encode(self, value: dict[str, Any]) -> bytes:
+        return json.dumps(value, ensure_ascii=True).encode("ascii")
+
+    def decode(self, raw: Union[bytes, str]) -> dict[str, Any]:
+        return decode_value(raw)
+
+
+class MsgpackCodec:
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not available")
+        self._packer = msgpack.Packer()
+
+    def encode(self, value: dict[str, Any]) -> bytes:
+        return bytes((MSGPACK_TAG,)) + self._packer.pack(value)
+
+    def decode(self, raw: Union[bytes, str]) -> dict[str, Any]:
+        return decode_value(raw)
+
+
+class PredictionStructCodec:
+    """Пара ``{is_violation, probability}`` (в том числе с ``fresh_until`` и
+    ``delta``) пишется фиксированной структурой, остальные значения — через
+    ``fallback``."""
+
+    def __init__(self, fallback: CacheCodec) -> None:
+        self.fallback = fallback
+
+    def encode(self, value: dict[str, Any]) -> bytes:
+        keys = value.keys()
+        if keys == _PREDICTION_FIELDS:
+            return _PREDICTION_STRUCT.pack(
+                PREDICTION_STRUCT_TAG,
+                bool(value["is_violation"]),
+                float(value["probability"]),
+            )
+        if keys == _PREDICTION_SOFT_TTL_FIELDS:
+            return _PREDICTION_SOFT_TTL_STRUCT.pack(
+                PREDICTION_SOFT_TTL_STRUCT_TAG,
+                bool(value["is_violation"]),
+                float(value["probability"]),
+                float(value["fresh_until"]),
+                float(value["delta"]),
+            )
+        return self.fallback.encode(value)
+
+    def decode(self, raw: Union[bytes, str]) -> dict[str, Any]:
+        return decode_value(raw)
+
+
+def get_codec(name: Optional[str] = None) -> CacheCodec:
+    name = (name or CACHE_CODEC).lower()
+    if name not in CACHE_CODECS:
+        raise ValueError(f"Unsupported cache codec: {name}")
+    if name == "json":
+        return JsonCodec()
+    if msgpack is None:
+        logger.warning("msgpack is not installed, falling back to JSON for cache values")
+        generic: CacheCodec = JsonCodec()
+    else:
+        generic = MsgpackCodec()
+    if name == "struct":
+        return PredictionStructCodec(fallback=generic)
+    return generic
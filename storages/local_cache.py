@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+LOCAL_CACHE_MAX_SIZE = int(os.getenv("PREDICTION_LOCAL_CACHE_MAX_SIZE", "10000"))
+LOCAL_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_LOCAL_CACHE_TTL_SECONDS", "30"))
+
+
+class LocalCache:
+    """In-process LRU-кэш с TTL на запись.
+
+    Записи помечаются тегом (например, ``item:42``), чтобы инвалидировать
+    все ключи объявления разом, не зная их заранее.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LOCAL_CACHE_MAX_SIZE,
+        ttl_seconds: float = LOCAL_CACHE_TTL_SECONDS,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, Any, Optional[str]]] = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        tag: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+    ) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, tag)
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        self._remove(key)
+
+    def invalidate(self, tag: str) -> None:
+        for key in self._tags.pop(tag, ()):
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[2] is None:
+            return
+        keys = self._tags.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[entry[2]]
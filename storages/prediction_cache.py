@@ -1,48 +1,283 @@
 from __future__ import annotations
 
+import asyncio
 import hashlib
 import json
+import logging
+import math
 import os
-from typing import Any, Optional
+import random
+import time
+import uuid
+from typing import Any, Callable, Optional, Sequence
 
 import redis.asyncio as redis
 
+from app.metrics import observe_cache_lookups
+from storages.codecs import CacheCodec, decode_value, get_codec
+from storages.local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
 CACHE_TTL_SECONDS = int(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "3600"))
+# После мягкого срока запись ещё отдаётся, но пересчитывается в фоне;
+# жёсткий TTL (CACHE_TTL_SECONDS) по-прежнему ограничивает устаревание.
+CACHE_SOFT_TTL_SECONDS = int(os.getenv("PREDICTION_CACHE_SOFT_TTL_SECONDS", str(CACHE_TTL_SECONDS * 4 // 5)))
+XFETCH_BETA = float(os.getenv("PREDICTION_CACHE_XFETCH_BETA", "1.0"))
+# Задача в pending вот-вот сменит статус: кэшируем её ненадолго (0 — не кэшируем),
+# чтобы опрашивающий клиент не видел pending до истечения полного TTL.
+MODERATION_PENDING_CACHE_TTL_SECONDS = int(os.getenv("MODERATION_PENDING_CACHE_TTL_SECONDS", "2"))
+MODERATION_TERMINAL_STATUSES = frozenset(("completed", "failed"))
+CACHE_INVALIDATION_CHANNEL = os.getenv("PREDICTION_CACHE_INVALIDATION_CHANNEL", "prediction:cache:invalidate")
+# Пока живут записи со старыми ключами (не дольше TTL после выкатки), промах по
+# новому ключу дочитывается по старому в том же MGET.
+READ_LEGACY_SYNC_KEYS = os.getenv("PREDICTION_CACHE_READ_LEGACY_SYNC_KEYS", "true").lower() == "true"
+
+# Удаляет ключи из индекса объявления и сам индекс за один round trip. DEL
+# идёт пачками, чтобы не упереться в лимит unpack. Инвалидация публикуется
+# отдельно: при шардинге скрипт выполняется только на шарде объявления, а
+# подписчики слушают другой узел.
+DELETE_ITEM_PREDICTIONS_SCRIPT = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+for i = 1, #keys, 1000 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+end
+redis.call('DEL', KEYS[1])
+return #keys
+"""
+# Снимает блокировку, только если она всё ещё наша (а не перехвачена после TTL).
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def needs_refresh(entry: dict[str, Any], now: Optional[float] = None, beta: float = XFETCH_BETA) -> bool:
+    """Пора ли пересчитать запись простого предсказания.
+
+    XFetch: пересчёт начинается раньше мягкого срока с вероятностью, которая
+    растёт по мере приближения к нему и с ценой пересчёта ``delta``.
+    Записи без мягкого срока живут до жёсткого TTL.
+    """
+    fresh_until = entry.get("fresh_until")
+    if fresh_until is None:
+        return False
+    now = time.time() if now is None else now
+    delta = float(entry.get("delta", 0.0))
+    return now - delta * beta * math.log(1.0 - random.random()) >= fresh_until
 
 
 class PredictionCacheStorage:
-    def __init__(self, client: redis.Redis, ttl_seconds: int = CACHE_TTL_SECONDS) -> None:
+    """Кэш предсказаний в Redis с необязательным in-process L1 перед ним.
+
+    Ключи L1 совпадают с ключами Redis и помечаются тегами ``item:<id>`` и
+    ``task:<id>``; удаление публикует теги (через пробел) в pub/sub, и каждый
+    процесс сбрасывает свои записи в ``listen_invalidations``.
+
+    Каждая запись и каждое удаление — один round trip: несколько команд идут
+    одним pipeline, удаление по индексу объявления — Lua-скриптом.
+
+    ``publish_invalidations`` по умолчанию включён, только если есть свой L1;
+    процессу без L1 (воркеру) его включают, чтобы перезапись задачи сбросила
+    L1 в API.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        ttl_seconds: int = CACHE_TTL_SECONDS,
+        local_cache: Optional[LocalCache] = None,
+        codec: Optional[CacheCodec] = None,
+        read_legacy_sync_keys: bool = READ_LEGACY_SYNC_KEYS,
+        soft_ttl_seconds: int = CACHE_SOFT_TTL_SECONDS,
+        pending_ttl_seconds: int = MODERATION_PENDING_CACHE_TTL_SECONDS,
+        publish_invalidations: Optional[bool] = None,
+    ) -> None:
         self.client = client
         # TTL 1 час: снижает нагрузку на БД/модель при повторных запросах,
         # но не хранит результат слишком долго, чтобы кэш не устаревал.
         self.ttl_seconds = ttl_seconds
+        self.local_cache = local_cache
+        self.codec = codec or get_codec()
+        self.read_legacy_sync_keys = read_legacy_sync_keys
+        self.soft_ttl_seconds = min(soft_ttl_seconds, ttl_seconds)
+        self.pending_ttl_seconds = min(pending_ttl_seconds, ttl_seconds)
+        self.publish_invalidations = local_cache is not None if publish_invalidations is None else publish_invalidations
+        self._delete_item_predictions_script: Optional[Any] = None
+        self._release_lock_script: Optional[Any] = None
 
     @staticmethod
-    def _sync_key(item_id: int, payload: dict[str, Any]) -> str:
+    def _version_part(model_version: Optional[str]) -> str:
+        # Ключи разных версий модели не пересекаются: после подмены модели
+        # старые оценки не отдаются, а просто доживают свой TTL.
+        return f"model:{model_version}:" if model_version else ""
+
+    @classmethod
+    def _sync_key(cls, payload: dict[str, Any], model_version: Optional[str] = None) -> str:
+        # Модель видит только признаки из services.predict.build_features, а они
+        # однозначно задаются этими четырьмя целыми. Ключ — сами значения:
+        # короче и дешевле любого хэша, без коллизий и без name/item_id, так что
+        # одинаковые по признакам объявления делят одну запись.
+        return (
+            f"prediction:sync:{cls._version_part(model_version)}"
+            f"f:{int(bool(payload['is_verified_seller']))}:{int(payload['images_qty'])}:"
+            f"{len(str(payload['description']))}:{int(payload['category'])}"
+        )
+
+    @classmethod
+    def _legacy_sync_key(
+        cls,
+        item_id: int,
+        payload: dict[str, Any],
+        model_version: Optional[str] = None,
+    ) -> str:
         payload_str = json.dumps(payload, sort_keys=True, ensure_ascii=True)
         payload_hash = hashlib.sha256(payload_str.encode("utf-8")).hexdigest()
-        return f"prediction:sync:item:{item_id}:{payload_hash}"
+        return f"prediction:sync:item:{item_id}:{cls._version_part(model_version)}{payload_hash}"
 
     @staticmethod
-    def _simple_key(item_id: int) -> str:
-        return f"prediction:simple:item:{item_id}"
+    def _item_hash_tag(item_id: int) -> str:
+        # Hash tag: индекс, значения и блокировка объявления попадают на один
+        # шард (clients.sharded_redis, Redis Cluster), и скрипт удаления по
+        # индексу не выходит за его пределы.
+        return f"{{{item_id}}}"
+
+    @classmethod
+    def _simple_key(cls, item_id: int, model_version: Optional[str] = None) -> str:
+        return f"prediction:simple:item:{cls._version_part(model_version)}{cls._item_hash_tag(item_id)}"
 
     @staticmethod
     def _moderation_task_key(task_id: int) -> str:
         return f"prediction:moderation:task:{task_id}"
 
+    @classmethod
+    def _item_index_key(cls, item_id: int) -> str:
+        return f"prediction:item:index:{cls._item_hash_tag(item_id)}"
+
+    @classmethod
+    def _simple_lock_key(cls, item_id: int, model_version: Optional[str] = None) -> str:
+        return f"prediction:lock:simple:{cls._version_part(model_version)}{cls._item_hash_tag(item_id)}"
+
     @staticmethod
-    def _item_index_key(item_id: int) -> str:
-        return f"prediction:item:index:{item_id}"
+    def _item_tag(item_id: int) -> str:
+        return f"item:{item_id}"
+
+    @staticmethod
+    def _task_tag(task_id: int) -> str:
+        return f"task:{task_id}"
+
+    def _remember(
+        self,
+        key: str,
+        tag: Optional[str],
+        value: dict[str, Any],
+        ttl_seconds: Optional[int] = None,
+    ) -> None:
+        if self.local_cache is not None:
+            self.local_cache.set(key, value, tag, self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+
+    async def _get(
+        self,
+        key: str,
+        tag: Optional[str],
+        legacy_key: Optional[Callable[[], str]] = None,
+        ttl_for: Optional[Callable[[dict[str, Any]], int]] = None,
+    ) -> Optional[dict[str, Any]]:
+        if self.local_cache is not None:
+            value = self.local_cache.get(key)
+            observe_cache_lookups("local", hits=int(value is not None), misses=int(value is None))
+            if value is not None:
+                return value
+        if legacy_key is None:
+            raw = await self.client.get(key)
+        else:
+            raw, legacy_raw = await self.client.mget([key, legacy_key()])
+            raw = raw or legacy_raw
+        observe_cache_lookups("redis", hits=int(bool(raw)), misses=int(not raw))
+        if not raw:
+            return None
+        value = decode_value(raw)
+        self._remember(key, tag, value, ttl_for(value) if ttl_for is not None else None)
+        return value
+
+    async def _get_many(
+        self,
+        keys: Sequence[tuple[str, Optional[str]]],
+        legacy_keys: Optional[Callable[[int], str]] = None,
+    ) -> list[Optional[dict[str, Any]]]:
+        values: list[Optional[dict[str, Any]]] = [None] * len(keys)
+        missing = list(range(len(keys)))
+        if self.local_cache is not None:
+            for index, (key, _tag) in enumerate(keys):
+                values[index] = self.local_cache.get(key)
+            missing = [index for index, value in enumerate(values) if value is None]
+            observe_cache_lookups("local", hits=len(keys) - len(missing), misses=len(missing))
+            if not missing:
+                return values
+
+        request_keys = [keys[index][0] for index in missing]
+        if legacy_keys is not None:
+            request_keys.extend(legacy_keys(index) for index in missing)
+        raws = await self.client.mget(request_keys)
+        if legacy_keys is not None:
+            raws = [raw or legacy_raw for raw, legacy_raw in zip(raws, raws[len(missing):])]
+        redis_hits = 0
+        for index, raw in zip(missing, raws):
+            if not raw:
+                continue
+            redis_hits += 1
+            values[index] = decode_value(raw)
+            self._remember(*keys[index], values[index])
+        observe_cache_lookups("redis", hits=redis_hits, misses=len(missing) - redis_hits)
+        return values
+
+    def _invalidate_local(self, *tags: str) -> None:
+        if self.local_cache is None:
+            return
+        for tag in tags:
+            self.local_cache.invalidate(tag)
+
+    async def listen_invalidations(self, reconnect_delay: float = 1.0) -> None:
+        """Сбрасывает записи L1 по тегам, опубликованным любым процессом."""
+        if self.local_cache is None:
+            return
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        data = message["data"]
+                        if isinstance(data, bytes):
+                            data = data.decode("ascii")
+                        self._invalidate_local(*data.split())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("prediction_cache_invalidation_listener_failed")
+            finally:
+                await pubsub.aclose()
+            # Пока подписки не было, инвалидации могли потеряться.
+            self.local_cache.clear()
+            await asyncio.sleep(reconnect_delay)
 
     async def get_sync_prediction(
         self,
         *,
         item_id: int,
         payload: dict[str, Any],
+        model_version: Optional[str] = None,
     ) -> Optional[dict[str, Any]]:
-        raw = await self.client.get(self._sync_key(item_id, payload))
-        return json.loads(raw) if raw else None
+        def legacy_key() -> str:
+            return self._legacy_sync_key(item_id, payload, model_version)
+
+        return await self._get(
+            self._sync_key(payload, model_version),
+            None,
+            legacy_key if self.read_legacy_sync_keys else None,
+        )
 
     async def set_sync_prediction(
         self,
@@ -50,48 +285,213 @@ class PredictionCacheStorage:
         item_id: int,
         payload: dict[str, Any],
         result: dict[str, Any],
+        model_version: Optional[str] = None,
     ) -> None:
-        cache_key = self._sync_key(item_id, payload)
-        await self.client.set(
-            cache_key,
-            json.dumps(result, ensure_ascii=True),
-            ex=self.ttl_seconds,
-        )
-        await self.client.sadd(self._item_index_key(item_id), cache_key)
-        await self.client.expire(self._item_index_key(item_id), self.ttl_seconds)
-
-    async def get_simple_prediction(self, item_id: int) -> Optional[dict[str, Any]]:
-        raw = await self.client.get(self._simple_key(item_id))
-        return json.loads(raw) if raw else None
-
-    async def set_simple_prediction(self, item_id: int, result: dict[str, Any]) -> None:
-        cache_key = self._simple_key(item_id)
-        await self.client.set(
-            cache_key,
-            json.dumps(result, ensure_ascii=True),
-            ex=self.ttl_seconds,
+        await self.set_sync_predictions([(item_id, payload, result)], model_version)
+
+    async def get_sync_predictions(
+        self,
+        items: Sequence[tuple[int, dict[str, Any]]],
+        model_version: Optional[str] = None,
+    ) -> list[Optional[dict[str, Any]]]:
+        if not items:
+            return []
+        def legacy_key(index: int) -> str:
+            return self._legacy_sync_key(*items[index], model_version)
+
+        return await self._get_many(
+            [(self._sync_key(payload, model_version), None) for _item_id, payload in items],
+            legacy_key if self.read_legacy_sync_keys else None,
         )
-        await self.client.sadd(self._item_index_key(item_id), cache_key)
-        await self.client.expire(self._item_index_key(item_id), self.ttl_seconds)
+
+    async def set_sync_predictions(
+        self,
+        entries: Sequence[tuple[int, dict[str, Any], dict[str, Any]]],
+        model_version: Optional[str] = None,
+    ) -> None:
+        if not entries:
+            return
+        # Оценка по признакам не зависит от состояния объявления, поэтому
+        # в индекс объявления для инвалидации такие ключи не попадают.
+        written = []
+        pipe = self.client.pipeline(transaction=False)
+        for _item_id, payload, result in entries:
+            cache_key = self._sync_key(payload, model_version)
+            pipe.set(cache_key, self.codec.encode(result), ex=self.ttl_seconds)
+            written.append((cache_key, None, result))
+        await pipe.execute()
+        for cache_key, tag, result in written:
+            self._remember(cache_key, tag, result)
+
+    async def get_simple_prediction(
+        self,
+        item_id: int,
+        model_version: Optional[str] = None,
+    ) -> Optional[dict[str, Any]]:
+        return await self._get(self._simple_key(item_id, model_version), self._item_tag(item_id))
+
+    async def set_simple_prediction(
+        self,
+        item_id: int,
+        result: dict[str, Any],
+        model_version: Optional[str] = None,
+        compute_seconds: float = 0.0,
+    ) -> None:
+        await self.set_simple_predictions({item_id: result}, model_version, compute_seconds)
+
+    async def get_simple_predictions(
+        self,
+        item_ids: Sequence[int],
+        model_version: Optional[str] = None,
+    ) -> list[Optional[dict[str, Any]]]:
+        if not item_ids:
+            return []
+        return await self._get_many([
+            (self._simple_key(item_id, model_version), self._item_tag(item_id))
+            for item_id in item_ids
+        ])
+
+    async def set_simple_predictions(
+        self,
+        results: dict[int, dict[str, Any]],
+        model_version: Optional[str] = None,
+        compute_seconds: float = 0.0,
+    ) -> None:
+        if not results:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        written = self._queue_simple_predictions(pipe, results, model_version, compute_seconds)
+        await pipe.execute()
+        for cache_key, tag, result in written:
+            self._remember(cache_key, tag, result)
+
+    def _queue_simple_predictions(
+        self,
+        pipe: Any,
+        results: dict[int, dict[str, Any]],
+        model_version: Optional[str],
+        compute_seconds: float,
+    ) -> list[tuple[str, str, dict[str, Any]]]:
+        fresh_until = time.time() + self.soft_ttl_seconds
+        written = []
+        for item_id, result in results.items():
+            cache_key = self._simple_key(item_id, model_version)
+            index_key = self._item_index_key(item_id)
+            entry = {**result, "fresh_until": fresh_until, "delta": compute_seconds}
+            pipe.set(cache_key, self.codec.encode(entry), ex=self.ttl_seconds)
+            pipe.sadd(index_key, cache_key)
+            pipe.expire(index_key, self.ttl_seconds)
+            written.append((cache_key, self._item_tag(item_id), entry))
+        return written
+
+    async def acquire_simple_prediction_lock(
+        self,
+        item_id: int,
+        model_version: Optional[str] = None,
+        ttl_ms: int = 2000,
+    ) -> Optional[str]:
+        """Короткая блокировка пересчёта между процессами; возвращает токен или None."""
+        token = uuid.uuid4().hex
+        acquired = await self.client.set(self._simple_lock_key(item_id, model_version), token, nx=True, px=ttl_ms)
+        return token if acquired else None
+
+    async def release_simple_prediction_lock(
+        self,
+        item_id: int,
+        token: str,
+        model_version: Optional[str] = None,
+    ) -> None:
+        if self._release_lock_script is None:
+            self._release_lock_script = self.client.register_script(RELEASE_LOCK_SCRIPT)
+        await self._release_lock_script(keys=[self._simple_lock_key(item_id, model_version)], args=[token])
 
     async def get_moderation_result(self, task_id: int) -> Optional[dict[str, Any]]:
-        raw = await self.client.get(self._moderation_task_key(task_id))
-        return json.loads(raw) if raw else None
+        # L1 держит задачу не дольше, чем Redis: pending — лишь на короткий TTL.
+        return await self._get(self._moderation_task_key(task_id), self._task_tag(task_id), ttl_for=self._moderation_ttl)
+
+    def _moderation_ttl(self, result: dict[str, Any]) -> int:
+        if result.get("status") in MODERATION_TERMINAL_STATUSES:
+            return self.ttl_seconds
+        return self.pending_ttl_seconds
 
     async def set_moderation_result(self, task_id: int, result: dict[str, Any]) -> None:
-        await self.client.set(
-            self._moderation_task_key(task_id),
-            json.dumps(result, ensure_ascii=True),
-            ex=self.ttl_seconds,
+        """Кладёт задачу с TTL по статусу; pending при нулевом TTL стирает ключ,
+        чтобы после повтора задачи не остался прежний результат."""
+        cache_key = self._moderation_task_key(task_id)
+        tag = self._task_tag(task_id)
+        ttl_seconds = self._moderation_ttl(result)
+        pipe = self.client.pipeline(transaction=False)
+        if ttl_seconds > 0:
+            pipe.set(cache_key, self.codec.encode(result), ex=ttl_seconds)
+        else:
+            pipe.delete(cache_key)
+        if self.publish_invalidations:
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, tag)
+        await pipe.execute()
+        if ttl_seconds > 0:
+            self._remember(cache_key, tag, result, ttl_seconds)
+        else:
+            self._invalidate_local(tag)
+
+    async def set_completed_moderation(
+        self,
+        task_id: int,
+        result: dict[str, Any],
+        item_id: int,
+        prediction: dict[str, Any],
+        model_version: Optional[str] = None,
+        compute_seconds: float = 0.0,
+    ) -> None:
+        """Результат модерации и простое предсказание объявления за один round trip."""
+        await self.set_completed_moderations([(task_id, result, item_id, prediction)], model_version, compute_seconds)
+
+    async def set_completed_moderations(
+        self,
+        entries: Sequence[tuple[int, dict[str, Any], int, dict[str, Any]]],
+        model_version: Optional[str] = None,
+        compute_seconds: float = 0.0,
+    ) -> None:
+        """Пачка ``(task_id, result, item_id, prediction)`` одним pipeline."""
+        if not entries:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        tasks = []
+        for task_id, result, _, _ in entries:
+            cache_key = self._moderation_task_key(task_id)
+            pipe.set(cache_key, self.codec.encode(result), ex=self.ttl_seconds)
+            tasks.append((cache_key, self._task_tag(task_id), result))
+        written = self._queue_simple_predictions(
+            pipe,
+            {item_id: prediction for _, _, item_id, prediction in entries},
+            model_version,
+            compute_seconds,
         )
+        if self.publish_invalidations:
+            tags = [tag for _, tag, _ in tasks] + [self._item_tag(item_id) for _, _, item_id, _ in entries]
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, " ".join(tags))
+        await pipe.execute()
+        for cache_key, tag, value in tasks + written:
+            self._remember(cache_key, tag, value)
 
     async def delete_moderation_result(self, task_id: int) -> None:
-        await self.client.delete(self._moderation_task_key(task_id))
+        await self.delete_moderation_results([task_id])
+
+    async def delete_moderation_results(self, task_ids: Sequence[int]) -> None:
+        if not task_ids:
+            return
+        tags = [self._task_tag(task_id) for task_id in task_ids]
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*(self._moderation_task_key(task_id) for task_id in task_ids))
+        if self.publish_invalidations:
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, " ".join(tags))
+        await pipe.execute()
+        self._invalidate_local(*tags)
 
     async def delete_item_predictions(self, item_id: int) -> None:
-        index_key = self._item_index_key(item_id)
-        keys = list(await self.client.smembers(index_key))
-        if keys:
-            await self.client.delete(*keys, index_key)
-        else:
-            await self.client.delete(index_key)
+        if self._delete_item_predictions_script is None:
+            self._delete_item_predictions_script = self.client.register_script(DELETE_ITEM_PREDICTIONS_SCRIPT)
+        tag = self._item_tag(item_id)
+        await self._delete_item_predictions_script(keys=[self._item_index_key(item_id)])
+        if self.publish_invalidations:
+            await self.client.publish(CACHE_INVALIDATION_CHANNEL, tag)
+        self._invalidate_local(tag)
@@ -24,6 +24,7 @@ class _KafkaStub:
         item_id: int,
         task_id: int,
         retry_count: int = 0,
+        on_delivery_error: Any = None,
     ) -> None:
         self.sent_messages.append(
             {"item_id": item_id, "task_id": task_id, "retry_count": retry_count}
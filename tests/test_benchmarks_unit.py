@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+from benchmarks.run import BenchmarkResult, baseline_environment_mismatch, compare_with_baseline, main
+
+
+def _result(name: str, median_us: float) -> BenchmarkResult:
+    return BenchmarkResult(name=name, rounds=10, mean_us=median_us, median_us=median_us, p95_us=median_us, min_us=median_us)
+
+
+def test_compare_with_baseline_flags_regressions_over_threshold() -> None:
+    baseline = {"benchmarks": {"fast": {"median_us": 10.0}, "slow": {"median_us": 10.0}}}
+
+    comparisons = compare_with_baseline(
+        [_result("fast", 11.0), _result("slow", 13.0), _result("new", 1.0)],
+        baseline,
+        threshold=0.25,
+    )
+
+    by_name = {comparison["name"]: comparison for comparison in comparisons}
+    assert set(by_name) == {"fast", "slow"}
+    assert by_name["fast"]["regression"] is False
+    assert by_name["slow"]["regression"] is True
+
+
+def test_baseline_from_another_environment_is_detected() -> None:
+    meta = {"python": "3.11.7", "numpy": "1.26.4", "platform": "Linux", "machine": "x86_64", "processor": ""}
+
+    assert baseline_environment_mismatch(dict(meta), meta) == []
+    assert baseline_environment_mismatch({**meta, "machine": "arm64"}, meta) == ["machine"]
+
+
+def _write_baseline(path: Path, machine: str) -> None:
+    meta = {"python": "0.0.0", "numpy": "0.0.0", "platform": "other", "machine": machine, "processor": ""}
+    path.write_text(json.dumps({"meta": meta, "benchmarks": {"slow": {"median_us": 1.0}}}), encoding="utf-8")
+
+
+def test_regression_against_baseline_from_another_environment_is_informational(tmp_path: Path) -> None:
+    baseline = tmp_path / "baseline.json"
+    output = tmp_path / "results.json"
+    _write_baseline(baseline, machine="arm64")
+    argv = ["--baseline", str(baseline), "--output", str(output)]
+
+    with patch("benchmarks.run.run_benchmarks", return_value=[_result("slow", 10.0)]):
+        assert main(argv) == 0
+        report = json.loads(output.read_text(encoding="utf-8"))
+        assert main([*argv, "--enforce-baseline"]) == 1
+
+    assert report["comparison"]["enforced"] is False
+    assert report["comparison"]["results"][0]["regression"] is True
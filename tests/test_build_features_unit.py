@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import numpy as np
+
+from services.predict import build_features, build_features_batch, build_features_from_records
+
+RECORDS = [
+    {"is_verified_seller": False, "images_qty": 0, "description": "a", "category": 10},
+    {"is_verified_seller": True, "images_qty": 10, "description": "x" * 999, "category": 99},
+    {"is_verified_seller": True, "images_qty": 3, "description": "описание", "category": 0},
+    {"is_verified_seller": False, "images_qty": 7, "description": "y" * 4321, "category": 123},
+]
+
+
+def _scalar_matrix(records: list[dict]) -> np.ndarray:
+    return np.vstack([
+        build_features(
+            is_verified_seller=record["is_verified_seller"],
+            images_qty=record["images_qty"],
+            description=record["description"],
+            category=record["category"],
+        )
+        for record in records
+    ])
+
+
+def test_build_features_batch_matches_scalar_row_for_row() -> None:
+    features = build_features_batch(
+        is_verified_seller=[record["is_verified_seller"] for record in RECORDS],
+        images_qty=[record["images_qty"] for record in RECORDS],
+        description_lengths=[len(record["description"]) for record in RECORDS],
+        category=[record["category"] for record in RECORDS],
+    )
+
+    assert features.dtype == np.float64
+    np.testing.assert_array_equal(features, _scalar_matrix(RECORDS))
+
+
+def test_build_features_batch_accepts_numpy_columns() -> None:
+    rng = np.random.default_rng(0)
+    size = 1000
+    is_verified_seller = rng.integers(0, 2, size).astype(bool)
+    images_qty = rng.integers(0, 20, size)
+    description_lengths = rng.integers(1, 5000, size)
+    category = rng.integers(0, 200, size)
+    records = [
+        {
+            "is_verified_seller": bool(is_verified_seller[index]),
+            "images_qty": int(images_qty[index]),
+            "description": "d" * int(description_lengths[index]),
+            "category": int(category[index]),
+        }
+        for index in range(size)
+    ]
+
+    features = build_features_batch(is_verified_seller, images_qty, description_lengths, category)
+
+    np.testing.assert_array_equal(features, _scalar_matrix(records))
+
+
+def test_build_features_from_records_matches_scalar() -> None:
+    np.testing.assert_array_equal(build_features_from_records(RECORDS), _scalar_matrix(RECORDS))
+
+
+def test_build_features_batch_empty() -> None:
+    assert build_features_batch([], [], [], []).shape == (0, 4)
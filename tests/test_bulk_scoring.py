@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+from typing import AsyncIterator, Iterable
+
+import numpy as np
+import pytest
+
+from models.model import InferenceModel, train_model
+from services.bulk_scoring import iter_ndjson_lines, score_ndjson_lines
+from workers.bulk_predict import run_bulk_predict
+
+PAYLOAD = {
+    "seller_id": 1,
+    "is_verified_seller": False,
+    "item_id": 1,
+    "name": "item",
+    "description": "desc",
+    "category": 10,
+    "images_qty": 0,
+}
+
+
+class _CountingModel:
+    def __init__(self) -> None:
+        self.batch_sizes: list[int] = []
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(len(features))
+        return np.column_stack([np.full(len(features), 0.4), np.full(len(features), 0.6)])
+
+
+async def _chunks(parts: Iterable[bytes]) -> AsyncIterator[bytes]:
+    for part in parts:
+        yield part
+
+
+async def _collect(iterator: AsyncIterator[bytes]) -> list[bytes]:
+    return [item async for item in iterator]
+
+
+def test_iter_ndjson_lines_joins_lines_split_across_chunks() -> None:
+    lines = asyncio.run(_collect(iter_ndjson_lines(_chunks([b'{"a"', b': 1}\n{"b": 2', b"}\n", b"tail"]))))
+
+    assert lines == [b'{"a": 1}', b'{"b": 2}', b"tail"]
+
+
+def test_score_ndjson_lines_scores_in_chunks_and_keeps_order() -> None:
+    model = _CountingModel()
+    lines = [json.dumps({**PAYLOAD, "item_id": index}).encode() for index in range(5)]
+    lines.insert(2, b'{"item_id": "broken"}')
+    lines.insert(4, b"")
+
+    output = asyncio.run(_collect(score_ndjson_lines(_chunks(lines), model=model, chunk_size=2)))
+    results = [json.loads(line) for line in output]
+
+    assert model.batch_sizes == [2, 1, 2]
+    assert [result["line"] for result in results] == [1, 2, 3, 4, 6, 7]
+    assert "error" in results[2]
+    assert [result["item_id"] for result in results if "error" not in result] == [0, 1, 2, 3, 4]
+    assert all(result["probability"] == pytest.approx(0.6) for result in results if "error" not in result)
+
+
+def test_score_ndjson_lines_reports_too_long_line() -> None:
+    model = _CountingModel()
+    chunks = [json.dumps(PAYLOAD).encode() + b"\n", b"x" * 100]
+
+    output = asyncio.run(
+        _collect(score_ndjson_lines(iter_ndjson_lines(_chunks(chunks), max_line_bytes=10), model=model))
+    )
+    results = [json.loads(line) for line in output]
+
+    assert results[0]["item_id"] == 1
+    assert results[1]["line"] == 2
+    assert "exceeds" in results[1]["error"]
+
+
+def test_bulk_predict_cli_streams_file() -> None:
+    model = InferenceModel(train_model())
+    source = io.BytesIO(b"".join(json.dumps({**PAYLOAD, "item_id": index}).encode() + b"\n" for index in range(3)))
+    target = io.BytesIO()
+
+    asyncio.run(run_bulk_predict(source, target, model, chunk_size=2))
+
+    results = [json.loads(line) for line in target.getvalue().splitlines()]
+    assert [result["item_id"] for result in results] == [0, 1, 2]
+    assert all(result["is_violation"] is True for result in results)
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from storages.codecs import (
+    JsonCodec,
+    MsgpackCodec,
+    PredictionStructCodec,
+    decode_value,
+    get_codec,
+)
+
+PREDICTION = {"is_violation": True, "probability": 0.8123456789}
+MODERATION_RESULT = {
+    "id": 13,
+    "item_id": 5,
+    "status": "completed",
+    "is_violation": False,
+    "probability": 0.1,
+    "error_message": None,
+}
+
+
+@pytest.mark.parametrize("codec_name", ["json", "msgpack", "struct"])
+@pytest.mark.parametrize("value", [PREDICTION, MODERATION_RESULT])
+def test_codecs_roundtrip(codec_name: str, value: dict) -> None:
+    assert decode_value(get_codec(codec_name).encode(value)) == value
+
+
+def test_struct_codec_packs_prediction_into_ten_bytes() -> None:
+    codec = PredictionStructCodec(fallback=MsgpackCodec())
+
+    encoded = codec.encode(PREDICTION)
+
+    assert len(encoded) == 10
+    assert len(encoded) < len(JsonCodec().encode(PREDICTION))
+    assert codec.encode(MODERATION_RESULT)[0] != encoded[0]
+
+
+@pytest.mark.parametrize("codec_name", ["json", "msgpack", "struct"])
+def test_prediction_with_soft_expiry_roundtrip(codec_name: str) -> None:
+    value = {**PREDICTION, "fresh_until": 1_700_000_000.25, "delta": 0.5}
+
+    assert decode_value(get_codec(codec_name).encode(value)) == value
+
+
+@pytest.mark.parametrize("raw", [json.dumps(PREDICTION), json.dumps(PREDICTION).encode()])
+def test_legacy_json_entries_stay_readable(raw: object) -> None:
+    assert decode_value(raw) == PREDICTION
+
+
+def test_unknown_format_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        decode_value(b"\x7f\x00")
+
+
+def test_unknown_codec_name_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        get_codec("pickle")
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from models.model import InferenceModel, train_model
+from services.cache_warmup import warm_prediction_cache
+
+
+def _add(item_id: int) -> dict:
+    return {
+        "add_id": item_id,
+        "seller_id": 1,
+        "is_verified_seller": False,
+        "images_qty": 1,
+        "description": "desc",
+        "category": item_id,
+    }
+
+
+def _add_repo(item_ids: list[int]) -> AsyncMock:
+    add_repo = AsyncMock()
+    add_repo.get_recently_active_ids.return_value = item_ids
+    add_repo.get_many_with_seller.side_effect = lambda ids: {item_id: _add(item_id) for item_id in ids}
+    return add_repo
+
+
+def test_warmup_scores_only_uncached_items_in_batches() -> None:
+    add_repo = _add_repo([1, 2, 3, 4, 5])
+    cache = AsyncMock()
+    cached = {2: {"is_violation": False, "probability": 0.1}}
+    cache.get_simple_predictions.side_effect = lambda ids, version: [cached.get(item_id) for item_id in ids]
+    model = InferenceModel(estimator=train_model(), version="v2")
+
+    stats = asyncio.run(warm_prediction_cache(
+        model=model,
+        cache_storage=cache,
+        add_repo=add_repo,
+        limit=5,
+        active_hours=2,
+        batch_size=2,
+        max_batches_per_second=0,
+    ))
+
+    assert (stats.total, stats.warmed, stats.skipped) == (5, 4, 1)
+    add_repo.get_recently_active_ids.assert_awaited_once_with(5, timedelta(hours=2))
+    assert [call.args[0] for call in add_repo.get_many_with_seller.await_args_list] == [[1], [3, 4], [5]]
+    written = [call.args for call in cache.set_simple_predictions.await_args_list]
+    assert [sorted(results) for results, _ in written] == [[1], [3, 4], [5]]
+    assert all(version == "v2" for _, version in written)
+    assert all(call.kwargs["compute_seconds"] > 0 for call in cache.set_simple_predictions.await_args_list)
+
+
+def test_warmup_is_rate_limited_between_batches() -> None:
+    cache = AsyncMock()
+    cache.get_simple_predictions.side_effect = lambda ids, version: [None] * len(ids)
+    sleep = AsyncMock()
+
+    with patch("services.cache_warmup.asyncio.sleep", sleep):
+        asyncio.run(warm_prediction_cache(
+            model=train_model(),
+            cache_storage=cache,
+            add_repo=_add_repo([1, 2, 3]),
+            batch_size=1,
+            max_batches_per_second=2,
+        ))
+
+    assert sleep.await_count == 2
+    assert all(0 < call.args[0] <= 0.5 for call in sleep.await_args_list)
+
+
+def test_warmup_rejects_empty_batches() -> None:
+    with pytest.raises(ValueError):
+        asyncio.run(warm_prediction_cache(model=None, cache_storage=AsyncMock(), add_repo=AsyncMock(), batch_size=0))
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from models.model import InferenceModel, compile_model, train_model
+from services.predict import build_features
+
+
+@pytest.fixture(scope="module")
+def estimator() -> LogisticRegression:
+    return train_model()
+
+
+def test_compiled_batch_matches_predict_proba(estimator: LogisticRegression) -> None:
+    features = np.random.default_rng(1).random((1000, 4))
+
+    compiled = compile_model(estimator)
+
+    assert compiled is not None
+    np.testing.assert_allclose(
+        compiled.positive_proba(features),
+        estimator.predict_proba(features)[:, 1],
+        rtol=1e-12,
+        atol=1e-12,
+    )
+
+
+def test_compiled_single_row_matches_predict_proba(estimator: LogisticRegression) -> None:
+    features = build_features(
+        is_verified_seller=True,
+        images_qty=3,
+        description="x" * 250,
+        category=42,
+    )
+
+    compiled = compile_model(estimator)
+
+    assert compiled is not None
+    np.testing.assert_allclose(
+        compiled.positive_proba(features),
+        estimator.predict_proba(features)[:, 1],
+        rtol=1e-12,
+    )
+    np.testing.assert_allclose(
+        compiled.positive_proba(features[0]),
+        estimator.predict_proba(features)[:, 1],
+        rtol=1e-12,
+    )
+
+
+def test_compiled_handles_extreme_inputs(estimator: LogisticRegression) -> None:
+    features = np.array([[1e6, 1e6, 1e6, 1e6], [-1e6, -1e6, -1e6, -1e6], [0.0, 0.0, 0.0, 0.0]])
+
+    compiled = compile_model(estimator)
+
+    assert compiled is not None
+    probabilities = compiled.positive_proba(features)
+    assert np.all(np.isfinite(probabilities))
+    np.testing.assert_allclose(probabilities, estimator.predict_proba(features)[:, 1], atol=1e-12)
+
+
+def test_inference_model_labels_match_estimator(estimator: LogisticRegression) -> None:
+    features = np.random.default_rng(2).random((500, 4))
+
+    labels, _ = InferenceModel(estimator=estimator, threshold=0.5).score(features)
+
+    np.testing.assert_array_equal(labels, estimator.predict(features).astype(bool))
+
+
+def test_unsupported_estimator_falls_back_to_predict_proba() -> None:
+    rng = np.random.default_rng(3)
+    features = rng.random((200, 4))
+    target = (features[:, 0] < 0.3).astype(int)
+    tree = DecisionTreeClassifier(random_state=0).fit(features, target)
+
+    model = InferenceModel(estimator=tree)
+    _, probabilities = model.score(features)
+
+    assert model.compiled is None
+    np.testing.assert_allclose(probabilities, tree.predict_proba(features)[:, 1])
+
+
+def test_multiclass_logistic_regression_is_not_compiled() -> None:
+    rng = np.random.default_rng(4)
+    features = rng.random((300, 4))
+    target = (features[:, 0] * 3).astype(int)
+
+    estimator = LogisticRegression(max_iter=200).fit(features, target)
+
+    assert compile_model(estimator) is None
@@ -12,7 +12,15 @@ from routers.async_moderation import (
     close_add,
     moderation_result,
 )
-from routers.predict import PredictRequest, predict, simple_predict
+from routers.predict import (
+    BatchPredictRequest,
+    PredictRequest,
+    SimplePredictBatchRequest,
+    predict,
+    predict_batch,
+    simple_predict,
+    simple_predict_batch,
+)
 from models.accounts import AccountModel
 
 
@@ -20,7 +28,7 @@ ACCOUNT = AccountModel(id=1, login="test_login", password="hashed", is_blocked=F
 
 
 def test_predict_handler_uses_service_without_db(monkeypatch) -> None:
-    async def fake_predict_from_payload(self, *, payload, model, cache_storage):
+    async def fake_predict_from_payload(self, *, payload, model, cache_storage, batcher=None, executor=None):
         assert payload["item_id"] == 77
         return False, 0.1
 
@@ -40,10 +48,24 @@ def test_predict_handler_uses_service_without_db(monkeypatch) -> None:
 
     assert resp.is_violation is False
     assert resp.probability == 0.1
+    assert resp.model_version is None
+
+
+def test_predict_handler_returns_model_version(monkeypatch) -> None:
+    async def fake_predict_by_item_id(self, *, item_id, model, cache_storage, batcher=None, executor=None):
+        return True, 0.9
+
+    monkeypatch.setattr("services.predict.PredictService.predict_by_item_id", fake_predict_by_item_id)
+    model = SimpleNamespace(version="file-abc")
+    http_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(model=model, prediction_cache=None)))
+
+    resp = asyncio.run(simple_predict(1, http_request, ACCOUNT))
+
+    assert resp.model_version == "file-abc"
 
 
 def test_simple_predict_handler_returns_404_on_not_found(monkeypatch) -> None:
-    async def fake_predict_by_item_id(self, *, item_id, model, cache_storage):
+    async def fake_predict_by_item_id(self, *, item_id, model, cache_storage, batcher=None, executor=None):
         raise AddNotFoundError()
 
     monkeypatch.setattr("services.predict.PredictService.predict_by_item_id", fake_predict_by_item_id)
@@ -98,3 +120,55 @@ def test_moderation_result_handler_not_found(monkeypatch) -> None:
         assert False, "Expected HTTPException"
     except HTTPException as exc:
         assert exc.status_code == 404
+
+
+def test_predict_batch_handler_reports_per_item_errors(monkeypatch) -> None:
+    async def fake_predict_many_from_payloads(self, *, payloads, model, cache_storage, executor):
+        assert [payload["item_id"] for payload in payloads] == [1, 3]
+        return [(True, 0.9), (False, 0.2)]
+
+    monkeypatch.setattr(
+        "services.predict.PredictService.predict_many_from_payloads",
+        fake_predict_many_from_payloads,
+    )
+    item = {
+        "seller_id": 1,
+        "is_verified_seller": False,
+        "name": "item",
+        "description": "desc",
+        "category": 1,
+        "images_qty": 1,
+    }
+    req = BatchPredictRequest(items=[
+        {**item, "item_id": 1},
+        {**item, "item_id": 2, "images_qty": -1},
+        {**item, "item_id": 3},
+    ])
+    http_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(model=object(), prediction_cache=None)))
+
+    resp = asyncio.run(predict_batch(req, http_request, ACCOUNT))
+
+    assert [result.index for result in resp.results] == [0, 1, 2]
+    assert resp.results[0].is_violation is True
+    assert resp.results[1].error is not None and "images_qty" in resp.results[1].error
+    assert resp.results[1].probability is None
+    assert resp.results[2].probability == 0.2
+
+
+def test_simple_predict_batch_handler_marks_missing_items(monkeypatch) -> None:
+    async def fake_predict_many_by_item_ids(self, *, item_ids, model, cache_storage, executor):
+        return {1: (False, 0.3)}
+
+    monkeypatch.setattr(
+        "services.predict.PredictService.predict_many_by_item_ids",
+        fake_predict_many_by_item_ids,
+    )
+    http_request = SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(model=object(), prediction_cache=None)))
+
+    resp = asyncio.run(
+        simple_predict_batch(SimplePredictBatchRequest(item_ids=[1, 2]), http_request, ACCOUNT)
+    )
+
+    assert resp.results[0].probability == 0.3
+    assert resp.results[1].item_id == 2
+    assert resp.results[1].error == "Add or seller not found"
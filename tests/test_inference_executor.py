@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from models.model import InferenceModel, train_model
+from services.inference_executor import InferenceExecutor
+from services.predict import predict_violation, predict_violation_async
+from services.prediction_batcher import PredictionBatcher
+
+
+@pytest.fixture(scope="module")
+def model() -> InferenceModel:
+    return InferenceModel(estimator=train_model())
+
+
+@pytest.mark.parametrize("mode", ["thread", "process"])
+def test_executor_scores_like_inline_model(model: InferenceModel, mode: str) -> None:
+    features = np.random.default_rng(0).random((16, 4))
+    executor = InferenceExecutor(model, mode=mode, max_workers=1)
+    executor.start()
+    try:
+        labels, probabilities = asyncio.run(executor.score(model, features))
+    finally:
+        asyncio.run(executor.stop())
+
+    expected_labels, expected_probabilities = model.score(features)
+    np.testing.assert_array_equal(labels, expected_labels)
+    np.testing.assert_allclose(probabilities, expected_probabilities)
+
+
+def test_process_executor_accepts_model_other_than_preloaded(model: InferenceModel) -> None:
+    other = InferenceModel(estimator=model.estimator, threshold=0.0)
+    executor = InferenceExecutor(model, mode="process", max_workers=1)
+    executor.start()
+    try:
+        labels, _ = asyncio.run(executor.score(other, np.zeros((2, 4))))
+    finally:
+        asyncio.run(executor.stop())
+
+    assert labels.all()
+
+
+def test_predict_violation_async_with_executor(model: InferenceModel) -> None:
+    kwargs = dict(
+        seller_id=1,
+        item_id=2,
+        is_verified_seller=False,
+        images_qty=0,
+        description="desc",
+        category=10,
+    )
+    executor = InferenceExecutor(model, mode="thread", max_workers=1)
+    executor.start()
+    try:
+        result = asyncio.run(predict_violation_async(model=model, executor=executor, **kwargs))
+    finally:
+        asyncio.run(executor.stop())
+
+    assert result == predict_violation(model=model, **kwargs)
+
+
+def test_batcher_offloads_batches_to_executor(model: InferenceModel) -> None:
+    features = np.random.default_rng(1).random((4, 4))
+
+    async def _scenario() -> list[tuple[bool, float]]:
+        executor = InferenceExecutor(model, mode="thread", max_workers=1)
+        executor.start()
+        batcher = PredictionBatcher(max_batch_size=4, max_wait_ms=50, executor=executor)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.predict(model, row[np.newaxis, :]) for row in features))
+        finally:
+            await batcher.stop()
+            await executor.stop()
+
+    results = asyncio.run(_scenario())
+
+    _, expected_probabilities = model.score(features)
+    assert [probability for _, probability in results] == pytest.approx(list(expected_probabilities))
+
+
+def test_executor_rejects_unknown_mode(model: InferenceModel) -> None:
+    with pytest.raises(ValueError):
+        InferenceExecutor(model, mode="gpu")
+
+
+def test_process_executor_reload_switches_preloaded_model(model: InferenceModel) -> None:
+    reloaded = InferenceModel(estimator=model.estimator, threshold=0.0, version="v2")
+    executor = InferenceExecutor(model, mode="process", max_workers=1)
+    executor.start()
+    try:
+        asyncio.run(executor.reload(reloaded))
+        labels, _ = asyncio.run(executor.score(reloaded, np.zeros((2, 4))))
+    finally:
+        asyncio.run(executor.stop())
+
+    assert executor.model is reloaded
+    assert labels.all()
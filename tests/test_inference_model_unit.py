@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+import pytest
+
+from models.model import DECISION_THRESHOLD, InferenceModel, as_inference_model, train_model
+from services.predict import predict_violation
+
+
+class _ProbaOnlyModel:
+    def __init__(self, probability: float) -> None:
+        self.probability = probability
+        self.proba_calls = 0
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        self.proba_calls += 1
+        return np.array([[1.0 - self.probability, self.probability]] * len(features))
+
+    def predict(self, *_: Any) -> Any:
+        raise AssertionError("predict must not be called")
+
+
+def test_score_matches_sklearn_predict_with_default_threshold() -> None:
+    estimator = train_model()
+    features = np.random.default_rng(0).random((200, 4))
+
+    labels, probabilities = InferenceModel(estimator=estimator, threshold=0.5).score(features)
+
+    np.testing.assert_array_equal(labels, estimator.predict(features).astype(bool))
+    np.testing.assert_allclose(probabilities, estimator.predict_proba(features)[:, 1])
+
+
+@pytest.mark.parametrize("threshold,expected", [(0.5, True), (0.7, False)])
+def test_score_uses_model_threshold(threshold: float, expected: bool) -> None:
+    model = InferenceModel(estimator=_ProbaOnlyModel(0.6), threshold=threshold)
+
+    labels, probabilities = model.score(np.zeros((1, 4)))
+
+    assert bool(labels[0]) is expected
+    assert probabilities[0] == pytest.approx(0.6)
+
+
+def test_threshold_comes_from_estimator_with_env_fallback() -> None:
+    estimator = _ProbaOnlyModel(0.6)
+    assert InferenceModel(estimator=estimator).threshold == DECISION_THRESHOLD
+
+    estimator.decision_threshold_ = 0.7
+    assert InferenceModel(estimator=estimator).threshold == 0.7
+    assert bool(InferenceModel(estimator=estimator).score(np.zeros((1, 4)))[0][0]) is False
+    assert InferenceModel(estimator=estimator, threshold=0.5).threshold == 0.5
+
+
+def test_as_inference_model_keeps_existing_wrapper() -> None:
+    model = InferenceModel(estimator=_ProbaOnlyModel(0.1), threshold=0.3)
+
+    assert as_inference_model(model) is model
+    assert as_inference_model(model.estimator).estimator is model.estimator
+
+
+def test_predict_violation_calls_predict_proba_once() -> None:
+    estimator = _ProbaOnlyModel(0.8)
+
+    is_violation, probability = predict_violation(
+        model=estimator,
+        seller_id=1,
+        item_id=2,
+        is_verified_seller=False,
+        images_qty=0,
+        description="desc",
+        category=1,
+    )
+
+    assert estimator.proba_calls == 1
+    assert is_violation is True
+    assert probability == pytest.approx(0.8)
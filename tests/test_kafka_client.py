@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from clients.kafka import MODERATION_TOPIC, KafkaClient
+from clients.message_codecs import decode_message, get_message_codec
+
+
+class _Producer:
+    """Буфер продюсера: send() возвращает future доставки, которую тест завершает сам."""
+
+    def __init__(self) -> None:
+        self.sent: list[tuple[str, dict[str, Any], asyncio.Future]] = []
+
+    async def send(self, topic: str, value: bytes, headers: list[tuple[str, bytes]]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.sent.append((topic, decode_message(value, headers), future))
+        return future
+
+    async def stop(self) -> None:
+        pass
+
+
+def _client(fire_and_forget: bool) -> tuple[KafkaClient, _Producer]:
+    client = KafkaClient(fire_and_forget=fire_and_forget)
+    producer = _Producer()
+    client._producer = producer
+    return client, producer
+
+
+def test_fire_and_forget_returns_before_ack_and_reports_failed_delivery() -> None:
+    client, producer = _client(fire_and_forget=True)
+    on_delivery_error = AsyncMock()
+
+    async def _run() -> None:
+        await client.send_moderation_request(item_id=5, task_id=13, on_delivery_error=on_delivery_error)
+        ((topic, payload, future),) = producer.sent
+        assert topic == MODERATION_TOPIC
+        assert not future.done()
+        future.set_exception(ConnectionError("broker is down"))
+        await client.stop()
+
+    asyncio.run(_run())
+
+    message, exc = on_delivery_error.await_args.args
+    assert message["task_id"] == 13
+    assert isinstance(exc, ConnectionError)
+
+
+def test_ack_mode_waits_for_broker_and_raises() -> None:
+    client, producer = _client(fire_and_forget=False)
+
+    async def _run() -> None:
+        send = asyncio.ensure_future(client.send_moderation_request(item_id=5, task_id=13))
+        await asyncio.sleep(0)
+        assert not send.done()
+        producer.sent[0][2].set_exception(ConnectionError("broker is down"))
+        await send
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(_run())
+
+
+def test_bulk_send_buffers_all_messages_and_reports_each_failure() -> None:
+    client, producer = _client(fire_and_forget=False)
+    on_delivery_error = AsyncMock()
+
+    async def _run() -> None:
+        send = asyncio.ensure_future(
+            client.send_moderation_requests([(1, 11), (2, 12), (3, 13)], on_delivery_error=on_delivery_error)
+        )
+        while len(producer.sent) < 3:
+            await asyncio.sleep(0)
+        for _, payload, future in producer.sent:
+            if payload["task_id"] == 12:
+                future.set_exception(ConnectionError("broker is down"))
+            else:
+                future.set_result(None)
+        await send
+
+    asyncio.run(_run())
+
+    assert [payload["item_id"] for _, payload, _ in producer.sent] == [1, 2, 3]
+    assert [call.args[0]["task_id"] for call in on_delivery_error.await_args_list] == [12]
+
+
+def test_unavailable_compression_falls_back_to_uncompressed() -> None:
+    with patch("clients.kafka.kafka_codec.has_zstd", return_value=False):
+        assert KafkaClient(compression_type="zstd").compression_type is None
+    assert KafkaClient(compression_type="gzip").compression_type == "gzip"
+    with pytest.raises(ValueError):
+        KafkaClient(compression_type="brotli")
+
+
+def test_compact_codec_sends_epoch_timestamp_and_schema_header() -> None:
+    client = KafkaClient(fire_and_forget=True, codec=get_message_codec("struct"))
+    producer = _Producer()
+    client._producer = producer
+
+    asyncio.run(client.send_moderation_request(item_id=5, task_id=13, retry_count=1))
+
+    ((_, payload, _),) = producer.sent
+    assert payload.keys() == {"item_id", "task_id", "retry_count", "timestamp_ms"}
+    assert (payload["item_id"], payload["task_id"], payload["retry_count"]) == (5, 13, 1)
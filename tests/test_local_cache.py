@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from storages.local_cache import LocalCache
+
+
+def test_local_cache_evicts_least_recently_used() -> None:
+    cache = LocalCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_local_cache_entry_ttl_is_capped_by_cache_ttl(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = time.monotonic()
+    monkeypatch.setattr("storages.local_cache.time.monotonic", lambda: now)
+    cache = LocalCache(max_size=10, ttl_seconds=5)
+    cache.set("key", "value", ttl_seconds=3600)
+
+    monkeypatch.setattr("storages.local_cache.time.monotonic", lambda: now + 4)
+    assert cache.get("key") == "value"
+    monkeypatch.setattr("storages.local_cache.time.monotonic", lambda: now + 6)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_local_cache_invalidates_by_tag() -> None:
+    cache = LocalCache(max_size=10, ttl_seconds=60)
+    cache.set("prediction:simple:item:1", {"p": 1}, tag="item:1")
+    cache.set("prediction:sync:item:1:abc", {"p": 2}, tag="item:1")
+    cache.set("prediction:simple:item:2", {"p": 3}, tag="item:2")
+
+    cache.invalidate("item:1")
+
+    assert cache.get("prediction:simple:item:1") is None
+    assert cache.get("prediction:sync:item:1:abc") is None
+    assert cache.get("prediction:simple:item:2") == {"p": 3}
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from clients.message_codecs import (
+    JSON_SCHEMA,
+    MODERATION_STRUCT_SCHEMA,
+    MSGPACK_SCHEMA,
+    decode_message,
+    get_message_codec,
+)
+
+REQUEST = {"item_id": 5, "task_id": 13, "retry_count": 2, "timestamp_ms": 1700000000123}
+
+
+def test_moderation_request_is_written_as_fixed_struct() -> None:
+    value, schema = get_message_codec("struct").encode(REQUEST)
+
+    assert schema == MODERATION_STRUCT_SCHEMA
+    assert len(value) == 26
+    assert decode_message(value, [("schema", schema)]) == REQUEST
+
+
+def test_struct_codec_falls_back_for_other_messages() -> None:
+    dlq = {"original_message": REQUEST, "error": "boom", "retry_count": 3, "timestamp_ms": 1}
+
+    value, schema = get_message_codec("struct").encode(dlq)
+
+    assert schema == MSGPACK_SCHEMA
+    assert decode_message(value, [("schema", schema)]) == dlq
+
+
+@pytest.mark.parametrize("name", ["json", "msgpack"])
+def test_generic_codecs_round_trip(name: str) -> None:
+    value, schema = get_message_codec(name).encode(REQUEST)
+
+    assert decode_message(value, [("other", b"x"), ("schema", schema)]) == REQUEST
+
+
+def test_message_without_schema_header_is_legacy_json() -> None:
+    legacy = {"item_id": 5, "task_id": 13, "retry_count": 0, "timestamp": "2024-01-01T00:00:00+00:00"}
+
+    assert decode_message(json.dumps(legacy).encode("utf-8")) == legacy
+    assert decode_message(json.dumps(legacy).encode("utf-8"), [("schema", JSON_SCHEMA)]) == legacy
+
+
+def test_unknown_schema_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        decode_message(b"\x00", [("schema", b"avro/1")])
+    with pytest.raises(ValueError):
+        get_message_codec("avro")
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+
+from models.model import InferenceModel, save_model, train_model
+from services.model_registry import FileModelSource, ModelWatcher
+
+
+@pytest.fixture(scope="module")
+def estimator() -> LogisticRegression:
+    return train_model()
+
+
+def _rewrite(path: Path, estimator: object) -> None:
+    joblib.dump(estimator, path)
+    # mtime_ns на некоторых ФС грубее, поэтому меняем отпечаток явно.
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_file_source_version_depends_on_content(tmp_path: Path, estimator: LogisticRegression) -> None:
+    first = tmp_path / "first.pkl"
+    second = tmp_path / "second.pkl"
+    joblib.dump(estimator, first)
+    joblib.dump(estimator, second)
+
+    assert FileModelSource(first).load().version == FileModelSource(second).load().version
+    assert FileModelSource(first).load().version.startswith("file-")
+
+
+def test_file_source_loads_threshold_saved_with_model(tmp_path: Path) -> None:
+    path = tmp_path / "model.pkl"
+    save_model(train_model(), path, threshold=0.8)
+
+    assert FileModelSource(path).load().threshold == 0.8
+
+
+def test_watcher_swaps_model_when_file_changes(tmp_path: Path, estimator: LogisticRegression) -> None:
+    path = tmp_path / "model.pkl"
+    joblib.dump(estimator, path)
+    source = FileModelSource(path)
+    swapped: list[InferenceModel] = []
+
+    async def _run() -> tuple[bool, ModelWatcher]:
+        watcher = ModelWatcher(source, source.load(), poll_interval=3600, on_swap=swapped.append)
+        await watcher.start()
+        try:
+            retrained = LogisticRegression().fit(np.random.default_rng(1).random((50, 4)), [0, 1] * 25)
+            _rewrite(path, retrained)
+            return await watcher.check(), watcher
+        finally:
+            await watcher.stop()
+
+    changed, watcher = asyncio.run(_run())
+
+    assert changed is True
+    assert swapped == [watcher.model]
+    assert watcher.model.version == FileModelSource(path).load().version
+
+
+def test_watcher_keeps_model_when_content_is_the_same(tmp_path: Path, estimator: LogisticRegression) -> None:
+    path = tmp_path / "model.pkl"
+    joblib.dump(estimator, path)
+    source = FileModelSource(path)
+    model = source.load()
+
+    async def _run() -> bool:
+        watcher = ModelWatcher(source, model, poll_interval=3600)
+        await watcher.start()
+        try:
+            _rewrite(path, estimator)
+            return await watcher.check()
+        finally:
+            await watcher.stop()
+
+    assert asyncio.run(_run()) is False
+
+
+def test_watcher_keeps_serving_old_model_when_load_fails(tmp_path: Path, estimator: LogisticRegression) -> None:
+    path = tmp_path / "model.pkl"
+    joblib.dump(estimator, path)
+    source = FileModelSource(path)
+    model = source.load()
+
+    async def _run() -> tuple[bool, ModelWatcher]:
+        watcher = ModelWatcher(source, model, poll_interval=3600)
+        await watcher.start()
+        try:
+            path.write_bytes(b"not a pickle")
+            return await watcher.check(), watcher
+        finally:
+            await watcher.stop()
+
+    changed, watcher = asyncio.run(_run())
+
+    assert changed is False
+    assert watcher.model is model
+
+
+def test_watcher_awaits_async_on_swap(tmp_path: Path, estimator: LogisticRegression) -> None:
+    path = tmp_path / "model.pkl"
+    joblib.dump(estimator, path)
+    source = FileModelSource(path)
+    swapped: list[InferenceModel] = []
+
+    async def _on_swap(model: InferenceModel) -> None:
+        await asyncio.sleep(0)
+        swapped.append(model)
+
+    async def _run() -> ModelWatcher:
+        watcher = ModelWatcher(source, source.load(), poll_interval=3600, on_swap=_on_swap)
+        await watcher.start()
+        try:
+            _rewrite(path, LogisticRegression().fit(np.random.default_rng(2).random((50, 4)), [0, 1] * 25))
+            await watcher.check()
+            return watcher
+        finally:
+            await watcher.stop()
+
+    watcher = asyncio.run(_run())
+
+    assert swapped == [watcher.model]
+
+
+def test_watcher_survives_failed_on_swap_and_reloads_later(tmp_path: Path, estimator: LogisticRegression) -> None:
+    path = tmp_path / "model.pkl"
+    joblib.dump(estimator, path)
+    source = FileModelSource(path)
+    model = source.load()
+    failures: list[InferenceModel] = []
+    installed: list[InferenceModel] = []
+
+    async def _on_swap(new_model: InferenceModel) -> None:
+        if not installed and len(failures) < 1:
+            failures.append(new_model)
+            raise RuntimeError("pool failed to start")
+        installed.append(new_model)
+
+    async def _run() -> tuple[ModelWatcher, str]:
+        watcher = ModelWatcher(source, model, poll_interval=0.01, on_swap=_on_swap)
+        await watcher.start()
+        try:
+            _rewrite(path, LogisticRegression().fit(np.random.default_rng(3).random((50, 4)), [0, 1] * 25))
+            while not failures:
+                await asyncio.sleep(0.01)
+            assert watcher._task is not None and not watcher._task.done()
+
+            _rewrite(path, LogisticRegression().fit(np.random.default_rng(4).random((50, 4)), [0, 1] * 25))
+            expected = FileModelSource(path).load().version
+            while watcher.model.version != expected:
+                await asyncio.sleep(0.01)
+            return watcher, expected
+        finally:
+            await watcher.stop()
+
+    watcher, expected = asyncio.run(asyncio.wait_for(_run(), timeout=10))
+
+    assert failures[0].version != expected
+    assert installed[-1] is watcher.model
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+from models.model import InferenceModel, train_model
+from models.moderation_results import ModerationResultModel
+from errors import AddNotFoundError
+from services.moderation_processing import process_moderation_batch, process_moderation_message
+from storages.codecs import decode_value
+from storages.prediction_cache import PredictionCacheStorage
+
+
+def _repos() -> tuple[AsyncMock, AsyncMock, AsyncMock]:
+    add_repo = AsyncMock()
+    add_repo.get.return_value = SimpleNamespace(id=5, seller_id=1, images_qty=1, description="desc", category=10)
+    user_repo = AsyncMock()
+    user_repo.get.return_value = SimpleNamespace(id=1, is_verified_seller=False)
+    moderation_repo = AsyncMock()
+
+    async def _mark_completed(task_id: int, is_violation: bool, probability: float) -> ModerationResultModel:
+        return ModerationResultModel(
+            id=task_id,
+            item_id=5,
+            status="completed",
+            is_violation=is_violation,
+            probability=probability,
+            created_at=datetime(2024, 1, 1),
+            processed_at=datetime(2024, 1, 1, 0, 1),
+        )
+
+    moderation_repo.mark_completed.side_effect = _mark_completed
+    return add_repo, user_repo, moderation_repo
+
+
+def _process(cache_storage: object, model: object, **repos: object) -> None:
+    asyncio.run(process_moderation_message(
+        payload={"item_id": 5, "task_id": 13},
+        model=model,
+        kafka_client=AsyncMock(),
+        cache_storage=cache_storage,
+        **repos,
+    ))
+
+
+def test_completed_result_and_prediction_are_written_through_in_one_round_trip() -> None:
+    add_repo, user_repo, moderation_repo = _repos()
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    cache = PredictionCacheStorage(client=client)
+    model = InferenceModel(estimator=train_model(), version="v1")
+
+    _process(cache, model, add_repo=add_repo, user_repo=user_repo, moderation_repo=moderation_repo)
+
+    pipe.execute.assert_awaited_once()
+    written = {call.args[0]: decode_value(call.args[1]) for call in pipe.set.call_args_list}
+    task_result = written["prediction:moderation:task:13"]
+    assert task_result["status"] == "completed"
+    assert ModerationResultModel(**task_result).processed_at == datetime(2024, 1, 1, 0, 1)
+    prediction = written["prediction:simple:item:model:v1:{5}"]
+    assert prediction["is_violation"] == task_result["is_violation"]
+    assert prediction["probability"] == task_result["probability"]
+    pipe.sadd.assert_called_once_with("prediction:item:index:{5}", "prediction:simple:item:model:v1:{5}")
+
+
+def test_cache_failure_does_not_fail_completed_task() -> None:
+    add_repo, user_repo, moderation_repo = _repos()
+    cache = AsyncMock()
+    cache.set_completed_moderation.side_effect = ConnectionError("redis is down")
+
+    _process(cache, train_model(), add_repo=add_repo, user_repo=user_repo, moderation_repo=moderation_repo)
+
+    moderation_repo.mark_completed.assert_awaited_once()
+    moderation_repo.mark_failed.assert_not_awaited()
+    moderation_repo.mark_retry.assert_not_awaited()
+
+
+def test_retry_and_failure_overwrite_cached_task_status() -> None:
+    add_repo, user_repo, moderation_repo = _repos()
+    add_repo.get.side_effect = ConnectionError("db is down")
+
+    def _row(task_id: int, error_message: str, status: str) -> ModerationResultModel:
+        return ModerationResultModel(
+            id=task_id,
+            item_id=5,
+            status=status,
+            error_message=error_message,
+            created_at=datetime(2024, 1, 1),
+        )
+
+    moderation_repo.mark_retry.side_effect = lambda task_id, error: _row(task_id, error, "pending")
+    moderation_repo.mark_failed.side_effect = lambda task_id, error: _row(task_id, error, "failed")
+    cache = AsyncMock()
+
+    _process(cache, train_model(), add_repo=add_repo, user_repo=user_repo, moderation_repo=moderation_repo)
+    asyncio.run(process_moderation_message(
+        payload={"item_id": 5, "task_id": 13, "retry_count": 99},
+        model=train_model(),
+        kafka_client=AsyncMock(),
+        cache_storage=cache,
+        add_repo=add_repo,
+        user_repo=user_repo,
+        moderation_repo=moderation_repo,
+    ))
+
+    statuses = [call.args[1]["status"] for call in cache.set_moderation_result.await_args_list]
+    assert statuses == ["pending", "failed"]
+    cache.set_completed_moderation.assert_not_awaited()
+
+
+def test_temporary_error_schedules_retry_instead_of_sleeping() -> None:
+    add_repo, user_repo, moderation_repo = _repos()
+    add_repo.get.side_effect = ConnectionError("db is down")
+    kafka_client = AsyncMock()
+    retry_scheduler = AsyncMock()
+
+    asyncio.run(process_moderation_message(
+        payload={"item_id": 5, "task_id": 13, "retry_count": 1},
+        model=train_model(),
+        kafka_client=kafka_client,
+        add_repo=add_repo,
+        user_repo=user_repo,
+        moderation_repo=moderation_repo,
+        retry_scheduler=retry_scheduler,
+    ))
+
+    moderation_repo.mark_retry.assert_awaited_once_with(13, "db is down")
+    retry_scheduler.schedule.assert_awaited_once_with(item_id=5, task_id=13, retry_count=2)
+    kafka_client.send_moderation_request.assert_not_awaited()
+
+
+def _add_with_seller(item_id: int) -> dict:
+    return {
+        "add_id": item_id,
+        "seller_id": 1,
+        "is_verified_seller": False,
+        "images_qty": 1,
+        "description": "desc",
+        "category": item_id,
+    }
+
+
+def _completed(results: list) -> list[ModerationResultModel]:
+    return [
+        ModerationResultModel(
+            id=task_id,
+            item_id=task_id + 100,
+            status="completed",
+            is_violation=is_violation,
+            probability=probability,
+            created_at=datetime(2024, 1, 1),
+        )
+        for task_id, is_violation, probability in results
+    ]
+
+
+class _CountingEstimator:
+    def __init__(self) -> None:
+        self.estimator = train_model()
+        self.batch_sizes: list[int] = []
+
+    def predict_proba(self, features):
+        self.batch_sizes.append(len(features))
+        return self.estimator.predict_proba(features)
+
+
+def test_batch_is_scored_and_persisted_with_one_call_each() -> None:
+    add_repo = AsyncMock()
+    add_repo.get_many_with_seller.side_effect = lambda ids: {
+        item_id: _add_with_seller(item_id) for item_id in ids if item_id != 103
+    }
+    add_repo.get.side_effect = AddNotFoundError()
+    moderation_repo = AsyncMock()
+    moderation_repo.mark_completed_many.side_effect = _completed
+    moderation_repo.mark_failed.side_effect = lambda task_id, error: ModerationResultModel(
+        id=task_id,
+        item_id=103,
+        status="failed",
+        error_message=error,
+        created_at=datetime(2024, 1, 1),
+    )
+    kafka_client = AsyncMock()
+    cache = AsyncMock()
+    model = _CountingEstimator()
+    payloads = [{"item_id": task_id + 100, "task_id": task_id} for task_id in range(1, 5)]
+
+    asyncio.run(process_moderation_batch(
+        payloads,
+        model=model,
+        moderation_repo=moderation_repo,
+        add_repo=add_repo,
+        user_repo=AsyncMock(),
+        kafka_client=kafka_client,
+        cache_storage=cache,
+    ))
+
+    add_repo.get_many_with_seller.assert_awaited_once_with([101, 102, 103, 104])
+    assert model.batch_sizes == [3]
+    completed = moderation_repo.mark_completed_many.await_args.args[0]
+    assert [task_id for task_id, _, _ in completed] == [1, 2, 4]
+    cache.set_completed_moderations.assert_awaited_once()
+    assert [entry[0] for entry in cache.set_completed_moderations.await_args.args[0]] == [1, 2, 4]
+    moderation_repo.mark_failed.assert_awaited_once()
+    assert moderation_repo.mark_failed.await_args.args[0] == 3
+    kafka_client.send_to_dlq.assert_awaited_once()
+
+
+def test_failed_batch_falls_back_to_single_messages() -> None:
+    add_repo, user_repo, moderation_repo = _repos()
+    add_repo.get_many_with_seller.side_effect = lambda ids: {item_id: _add_with_seller(item_id) for item_id in ids}
+    moderation_repo.mark_completed_many.side_effect = ConnectionError("db failover")
+
+    asyncio.run(process_moderation_batch(
+        [{"item_id": 5, "task_id": 13}, {"item_id": 5, "task_id": 14}],
+        model=train_model(),
+        moderation_repo=moderation_repo,
+        add_repo=add_repo,
+        user_repo=user_repo,
+        kafka_client=AsyncMock(),
+    ))
+
+    assert [call.args[0] for call in moderation_repo.mark_completed.await_args_list] == [13, 14]
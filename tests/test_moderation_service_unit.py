@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+from models.moderation_results import ModerationResultModel
+from services.moderation import ModerationService
+from storages.codecs import get_codec
+
+
+def test_close_item_deletes_moderation_cache_in_one_call() -> None:
+    add_repo = AsyncMock()
+    moderation_repo = AsyncMock()
+    moderation_repo.get_task_ids_by_item_id.return_value = [3, 4, 5]
+    cache_storage = AsyncMock()
+    service = ModerationService(add_repo=add_repo, moderation_repo=moderation_repo)
+
+    asyncio.run(service.close_item(7, cache_storage=cache_storage))
+
+    add_repo.delete.assert_awaited_once_with(7)
+    cache_storage.delete_item_predictions.assert_awaited_once_with(7)
+    cache_storage.delete_moderation_results.assert_awaited_once_with([3, 4, 5])
+    cache_storage.delete_moderation_result.assert_not_awaited()
+
+
+def test_get_result_caches_json_safe_values() -> None:
+    moderation_repo = AsyncMock()
+    moderation_repo.get.return_value = ModerationResultModel(
+        id=3,
+        item_id=7,
+        status="completed",
+        is_violation=False,
+        probability=0.2,
+        created_at=datetime(2024, 1, 1),
+    )
+    cache_storage = AsyncMock()
+    cache_storage.get_moderation_result.return_value = None
+    service = ModerationService(moderation_repo=moderation_repo)
+
+    asyncio.run(service.get_result(3, cache_storage=cache_storage))
+
+    cached = cache_storage.set_moderation_result.await_args.args[1]
+    assert cached["created_at"] == "2024-01-01T00:00:00"
+    assert get_codec("msgpack").encode(cached)
+
+
+def test_failed_delivery_after_fire_and_forget_enqueue_marks_task_failed() -> None:
+    add_repo = AsyncMock()
+    moderation_repo = AsyncMock()
+    moderation_repo.create_pending.return_value = ModerationResultModel(
+        id=3,
+        item_id=7,
+        status="pending",
+        created_at=datetime(2024, 1, 1),
+    )
+    kafka_client = AsyncMock()
+    service = ModerationService(add_repo=add_repo, moderation_repo=moderation_repo)
+
+    assert asyncio.run(service.enqueue(7, kafka_client)) == (3, "pending")
+    moderation_repo.mark_failed.assert_not_awaited()
+
+    on_delivery_error = kafka_client.send_moderation_request.await_args.kwargs["on_delivery_error"]
+    asyncio.run(on_delivery_error({"item_id": 7, "task_id": 3}, ConnectionError("broker is down")))
+    moderation_repo.mark_failed.assert_awaited_once_with(3, "broker is down")
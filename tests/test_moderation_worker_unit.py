@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from aiokafka import TopicPartition
+
+from clients.message_codecs import get_message_codec
+from workers.moderation_worker import ConcurrentConsumer, OffsetTracker, consume_in_batches
+
+
+class _Stop(Exception):
+    ...
+
+
+def _record(payload: dict, codec: str = "") -> SimpleNamespace:
+    if not codec:
+        # Старый продюсер: JSON без заголовка schema.
+        return SimpleNamespace(value=json.dumps(payload).encode(), headers=())
+    value, schema = get_message_codec(codec).encode(payload)
+    return SimpleNamespace(value=value, headers=[("schema", schema)])
+
+
+def test_offsets_are_committed_after_each_processed_batch() -> None:
+    events: list[str] = []
+    batches = [
+        {
+            "tp0": [
+                _record({"task_id": 1}),
+                _record({"item_id": 5, "task_id": 2, "retry_count": 0, "timestamp_ms": 1700000000000}, "struct"),
+            ],
+            "tp1": [_record({"task_id": 3}, "msgpack")],
+        },
+        {},
+    ]
+
+    async def _getmany(timeout_ms: int, max_records: int) -> dict:
+        assert (timeout_ms, max_records) == (50, 100)
+        if not batches:
+            raise _Stop()
+        return batches.pop(0)
+
+    async def _handle(payloads: list[dict]) -> None:
+        events.append(f"handle:{[payload['task_id'] for payload in payloads]}")
+
+    consumer = AsyncMock()
+    consumer.getmany.side_effect = _getmany
+    consumer.commit.side_effect = lambda: events.append("commit")
+
+    with pytest.raises(_Stop):
+        asyncio.run(consume_in_batches(consumer, _handle, batch_size=100, linger_ms=50))
+
+    assert events == ["handle:[1, 2, 3]", "commit"]
+
+
+def test_offset_tracker_commits_only_contiguous_prefix() -> None:
+    tp = TopicPartition("moderation", 0)
+    tracker = OffsetTracker()
+    for offset in (10, 11, 12):
+        tracker.start(tp, offset)
+
+    tracker.done(tp, 11)
+    assert tracker.pop_committable() == {}
+    assert tracker.lag(tp) == 3
+
+    tracker.done(tp, 10)
+    assert tracker.pop_committable() == {tp: 12}
+    assert tracker.lag(tp) == 1
+
+    tracker.done(tp, 12)
+    assert tracker.pop_committable() == {tp: 13}
+    assert tracker.pop_committable() == {}
+
+
+class _Consumer:
+    def __init__(self, messages: list[SimpleNamespace]) -> None:
+        self.messages = messages
+        self.commits: list[dict] = []
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for message in self.messages:
+            yield message
+
+    async def commit(self, offsets: dict) -> None:
+        self.commits.append(dict(offsets))
+
+
+def _message(partition: int, offset: int, delay: float) -> SimpleNamespace:
+    record = _record({"delay": delay, "offset": offset})
+    return SimpleNamespace(topic="moderation", partition=partition, offset=offset, value=record.value, headers=record.headers)
+
+
+def test_concurrent_consumer_bounds_in_flight_and_commits_in_order() -> None:
+    consumer = _Consumer([
+        _message(0, 0, 0.03),
+        _message(0, 1, 0.0),
+        _message(1, 0, 0.0),
+        _message(0, 2, 0.01),
+    ])
+    in_flight = peak = 0
+
+    async def _handle(payload: dict) -> None:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(payload["delay"])
+        in_flight -= 1
+
+    runner = ConcurrentConsumer(consumer, _handle, concurrency=2, commit_interval=3600)
+    asyncio.run(runner.run())
+
+    assert peak == 2
+    assert consumer.commits == [{TopicPartition("moderation", 0): 3, TopicPartition("moderation", 1): 1}]
+
+
+def test_failed_message_is_not_committed_and_stops_consumption() -> None:
+    consumer = _Consumer([_message(0, offset, 0.0) for offset in range(5)])
+    handled: list[int] = []
+
+    async def _handle(payload: dict) -> None:
+        handled.append(payload["offset"])
+        if payload["offset"] == 1:
+            raise RuntimeError("db is down")
+
+    runner = ConcurrentConsumer(consumer, _handle, concurrency=1, commit_interval=3600)
+    with pytest.raises(RuntimeError):
+        asyncio.run(runner.run())
+
+    assert handled == [0, 1]
+    assert consumer.commits == [{TopicPartition("moderation", 0): 1}]
@@ -184,3 +184,29 @@ def test_predict_requires_authentication(app_client: TestClient, base_payload: M
 
     assert response.status_code == HTTPStatus.UNAUTHORIZED
 
+
+def test_predict_batch(
+    authorized_app_client: TestClient,
+    base_payload: Mapping[str, object],
+) -> None:
+    items = [
+        {**base_payload, 'item_id': 1, 'is_verified_seller': False, 'images_qty': 0},
+        {**base_payload, 'item_id': 2, 'seller_id': 'wrong-type'},
+        {**base_payload, 'item_id': 3, 'is_verified_seller': True, 'images_qty': 10},
+    ]
+
+    response = authorized_app_client.post('/predict/batch', json={'items': items})
+
+    assert response.status_code == HTTPStatus.OK
+    results = response.json()['results']
+    assert [result['index'] for result in results] == [0, 1, 2]
+    assert results[0]['is_violation'] is True
+    assert results[1]['error']
+    assert results[1]['is_violation'] is None
+    assert results[2]['is_violation'] is False
+
+
+def test_predict_batch_rejects_empty_list(authorized_app_client: TestClient) -> None:
+    response = authorized_app_client.post('/predict/batch', json={'items': []})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
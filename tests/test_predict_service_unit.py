@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+import pytest
+
+from models.model import InferenceModel, train_model
+from services.predict import PredictService, predict_violation
+
+PAYLOAD = {
+    "seller_id": 1,
+    "is_verified_seller": False,
+    "item_id": 10,
+    "name": "item",
+    "description": "desc",
+    "category": 10,
+    "images_qty": 0,
+}
+
+
+class _CountingModel:
+    def __init__(self) -> None:
+        self.estimator = train_model()
+        self.batch_sizes: list[int] = []
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(len(features))
+        return self.estimator.predict_proba(features)
+
+
+def _single_prediction(model: object, payload: dict) -> tuple[bool, float]:
+    return predict_violation(
+        model=model,
+        seller_id=payload["seller_id"],
+        item_id=payload["item_id"],
+        is_verified_seller=payload["is_verified_seller"],
+        images_qty=payload["images_qty"],
+        description=payload["description"],
+        category=payload["category"],
+    )
+
+
+def test_predict_many_scores_only_cache_misses_in_one_call() -> None:
+    model = _CountingModel()
+    payloads = [
+        {**PAYLOAD, "item_id": 1},
+        {**PAYLOAD, "item_id": 2, "is_verified_seller": True, "images_qty": 9},
+        {**PAYLOAD, "item_id": 3},
+    ]
+    cache = MagicMock()
+    cache.get_sync_predictions = AsyncMock(
+        return_value=[None, {"is_violation": False, "probability": 0.01}, None],
+    )
+    cache.set_sync_predictions = AsyncMock()
+
+    results = asyncio.run(
+        PredictService().predict_many_from_payloads(
+            payloads=payloads,
+            model=model,
+            cache_storage=cache,
+        )
+    )
+
+    assert model.batch_sizes == [2]
+    assert results[1] == (False, 0.01)
+    expected = _single_prediction(InferenceModel(model.estimator), payloads[0])
+    assert results[0][0] is expected[0]
+    assert results[0][1] == pytest.approx(expected[1])
+    written = cache.set_sync_predictions.await_args.args[0]
+    assert [item_id for item_id, _, _ in written] == [1, 3]
+
+
+def test_predict_many_without_cache() -> None:
+    model = InferenceModel(train_model())
+    payloads = [{**PAYLOAD, "item_id": index, "images_qty": index} for index in range(5)]
+
+    results = asyncio.run(
+        PredictService().predict_many_from_payloads(payloads=payloads, model=model)
+    )
+
+    for payload, (is_violation, probability) in zip(payloads, results):
+        expected = _single_prediction(model, payload)
+        assert is_violation is expected[0]
+        assert probability == pytest.approx(expected[1])
+
+
+def test_predict_many_by_item_ids_fetches_misses_in_one_query() -> None:
+    model = _CountingModel()
+    add_repo = MagicMock()
+    add_repo.get_many_with_seller = AsyncMock(return_value={
+        1: {
+            "add_id": 1,
+            "seller_id": 7,
+            "is_verified_seller": False,
+            "images_qty": 0,
+            "description": "desc",
+            "category": 10,
+        },
+    })
+    cache = MagicMock()
+    cache.get_simple_predictions = AsyncMock(
+        return_value=[None, {"is_violation": True, "probability": 0.9}, None],
+    )
+    cache.set_simple_predictions = AsyncMock()
+
+    results = asyncio.run(
+        PredictService(add_repo=add_repo).predict_many_by_item_ids(
+            item_ids=[1, 2, 3, 1],
+            model=model,
+            cache_storage=cache,
+        )
+    )
+
+    cache.get_simple_predictions.assert_awaited_once_with([1, 2, 3], None)
+    add_repo.get_many_with_seller.assert_awaited_once_with([1, 3])
+    assert model.batch_sizes == [1]
+    assert set(results) == {1, 2}
+    assert results[2] == (True, 0.9)
+    written = cache.set_simple_predictions.await_args.args[0]
+    assert list(written) == [1]
+
+
+ADD_WITH_SELLER = {
+    "add_id": 5,
+    "seller_id": 7,
+    "is_verified_seller": False,
+    "images_qty": 0,
+    "description": "desc",
+    "category": 10,
+}
+
+
+def test_concurrent_misses_for_one_item_share_one_computation() -> None:
+    model = _CountingModel()
+    add_repo = MagicMock()
+
+    async def _slow_get_with_seller(item_id: int) -> dict:
+        await asyncio.sleep(0.01)
+        return ADD_WITH_SELLER
+
+    add_repo.get_with_seller = AsyncMock(side_effect=_slow_get_with_seller)
+    cache = MagicMock()
+    cache.get_simple_prediction = AsyncMock(return_value=None)
+    cache.set_simple_prediction = AsyncMock()
+    service = PredictService(add_repo=add_repo)
+
+    async def _run() -> list:
+        return await asyncio.gather(*[
+            service.predict_by_item_id(item_id=5, model=model, cache_storage=cache)
+            for _ in range(10)
+        ])
+
+    results = asyncio.run(_run())
+
+    assert len(set(results)) == 1
+    add_repo.get_with_seller.assert_awaited_once_with(5)
+    cache.set_simple_prediction.assert_awaited_once()
+    assert model.batch_sizes == [1]
+    assert len(service.single_flight) == 0
+
+
+def test_single_flight_error_reaches_every_waiter() -> None:
+    add_repo = MagicMock()
+
+    async def _failing_get_with_seller(item_id: int) -> dict:
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db is down")
+
+    add_repo.get_with_seller = AsyncMock(side_effect=_failing_get_with_seller)
+    service = PredictService(add_repo=add_repo)
+
+    async def _run() -> list:
+        return await asyncio.gather(
+            *[service.predict_by_item_id(item_id=5, model=_CountingModel()) for _ in range(3)],
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(_run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    add_repo.get_with_seller.assert_awaited_once()
+
+
+def test_redis_lock_holder_elsewhere_is_awaited_instead_of_recomputing(monkeypatch) -> None:
+    monkeypatch.setattr("services.predict.PREDICTION_CACHE_LOCK_POLL_MS", 1)
+    add_repo = MagicMock()
+    add_repo.get_with_seller = AsyncMock(return_value=ADD_WITH_SELLER)
+    cache = MagicMock()
+    cache.get_simple_prediction = AsyncMock(side_effect=[None, None, {"is_violation": True, "probability": 0.7}])
+    cache.acquire_simple_prediction_lock = AsyncMock(return_value=None)
+    service = PredictService(add_repo=add_repo, cache_lock_enabled=True)
+
+    result = asyncio.run(service.predict_by_item_id(item_id=5, model=_CountingModel(), cache_storage=cache))
+
+    assert result == (True, 0.7)
+    add_repo.get_with_seller.assert_not_awaited()
+
+
+def test_redis_lock_is_released_after_computation() -> None:
+    add_repo = MagicMock()
+    add_repo.get_with_seller = AsyncMock(return_value=ADD_WITH_SELLER)
+    cache = MagicMock()
+    cache.get_simple_prediction = AsyncMock(return_value=None)
+    cache.set_simple_prediction = AsyncMock()
+    cache.acquire_simple_prediction_lock = AsyncMock(return_value="token")
+    cache.release_simple_prediction_lock = AsyncMock()
+    service = PredictService(add_repo=add_repo, cache_lock_enabled=True)
+
+    asyncio.run(service.predict_by_item_id(item_id=5, model=_CountingModel(), cache_storage=cache))
+
+    add_repo.get_with_seller.assert_awaited_once_with(5)
+    cache.release_simple_prediction_lock.assert_awaited_once_with(5, "token", None)
+
+
+def test_stale_hit_is_served_while_one_background_refresh_runs() -> None:
+    add_repo = MagicMock()
+    refreshed = asyncio.Event()
+
+    async def _get_with_seller(item_id: int) -> dict:
+        refreshed.set()
+        return ADD_WITH_SELLER
+
+    add_repo.get_with_seller = AsyncMock(side_effect=_get_with_seller)
+    cache = MagicMock()
+    stale = {"is_violation": True, "probability": 0.9, "fresh_until": 0.0, "delta": 0.0}
+    cache.get_simple_prediction = AsyncMock(return_value=stale)
+    cache.set_simple_prediction = AsyncMock()
+    service = PredictService(add_repo=add_repo)
+
+    async def _run() -> list:
+        results = await asyncio.gather(*[
+            service.predict_by_item_id(item_id=5, model=_CountingModel(), cache_storage=cache)
+            for _ in range(5)
+        ])
+        await asyncio.wait_for(refreshed.wait(), timeout=1)
+        while len(service.single_flight):
+            await asyncio.sleep(0)
+        return results
+
+    results = asyncio.run(_run())
+
+    assert results == [(True, 0.9)] * 5
+    add_repo.get_with_seller.assert_awaited_once_with(5)
+    cache.set_simple_prediction.assert_awaited_once()
+    assert cache.set_simple_prediction.await_args.kwargs["compute_seconds"] >= 0
+
+
+def test_fresh_hit_does_not_refresh() -> None:
+    add_repo = MagicMock()
+    add_repo.get_with_seller = AsyncMock(return_value=ADD_WITH_SELLER)
+    cache = MagicMock()
+    fresh = {"is_violation": False, "probability": 0.1, "fresh_until": 10.0**12, "delta": 0.0}
+    cache.get_simple_prediction = AsyncMock(return_value=fresh)
+    service = PredictService(add_repo=add_repo)
+
+    result = asyncio.run(service.predict_by_item_id(item_id=5, model=_CountingModel(), cache_storage=cache))
+
+    assert result == (False, 0.1)
+    add_repo.get_with_seller.assert_not_awaited()
+
+
+def test_stale_batch_hits_are_served_and_refreshed_in_one_background_batch() -> None:
+    model = _CountingModel()
+    add_repo = MagicMock()
+    add_repo.get_many_with_seller = AsyncMock(side_effect=lambda ids: {
+        item_id: {**ADD_WITH_SELLER, "add_id": item_id} for item_id in ids
+    })
+    stale = {"is_violation": True, "probability": 0.9, "fresh_until": 0.0, "delta": 0.0}
+    fresh = {"is_violation": False, "probability": 0.1, "fresh_until": 10.0**12, "delta": 0.0}
+    cache = MagicMock()
+    cache.get_simple_predictions = AsyncMock(return_value=[stale, fresh, stale])
+    cache.set_simple_predictions = AsyncMock()
+    service = PredictService(add_repo=add_repo)
+
+    async def _run() -> dict:
+        results = await service.predict_many_by_item_ids(item_ids=[1, 2, 3], model=model, cache_storage=cache)
+        while len(service.single_flight):
+            await asyncio.sleep(0)
+        return results
+
+    results = asyncio.run(_run())
+
+    assert results == {1: (True, 0.9), 2: (False, 0.1), 3: (True, 0.9)}
+    add_repo.get_many_with_seller.assert_awaited_once_with([1, 3])
+    assert model.batch_sizes == [2]
+    assert sorted(cache.set_simple_predictions.await_args.args[0]) == [1, 3]
+    assert cache.set_simple_predictions.await_args.kwargs["compute_seconds"] > 0
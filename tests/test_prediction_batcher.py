@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import numpy as np
+import pytest
+
+from services.predict import build_features
+from services.prediction_batcher import PredictionBatcher
+
+
+class _CountingModel:
+    def __init__(self) -> None:
+        self.batch_sizes: list[int] = []
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        self.batch_sizes.append(len(features))
+        positive = features[:, 1]
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        return features[:, 1] > 0.5
+
+
+def _features(images_qty: int) -> np.ndarray:
+    return build_features(
+        is_verified_seller=False,
+        images_qty=images_qty,
+        description="desc",
+        category=1,
+    )
+
+
+def test_batcher_scores_concurrent_requests_in_one_call() -> None:
+    model = _CountingModel()
+
+    async def _scenario() -> list[tuple[bool, float]]:
+        batcher = PredictionBatcher(max_batch_size=8, max_wait_ms=50)
+        await batcher.start()
+        try:
+            return await asyncio.gather(
+                *(batcher.predict(model, _features(qty)) for qty in range(8))
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(_scenario())
+
+    assert model.batch_sizes == [8]
+    assert [probability for _, probability in results] == pytest.approx([qty / 10.0 for qty in range(8)])
+    assert [is_violation for is_violation, _ in results] == [qty > 5 for qty in range(8)]
+
+
+def test_batcher_flushes_partial_batch_after_max_wait() -> None:
+    model = _CountingModel()
+
+    async def _scenario() -> tuple[bool, float]:
+        batcher = PredictionBatcher(max_batch_size=64, max_wait_ms=1)
+        await batcher.start()
+        try:
+            return await asyncio.wait_for(batcher.predict(model, _features(7)), timeout=1)
+        finally:
+            await batcher.stop()
+
+    is_violation, probability = asyncio.run(_scenario())
+
+    assert model.batch_sizes == [1]
+    assert is_violation is True
+    assert probability == pytest.approx(0.7)
+
+
+def test_batcher_propagates_model_error_to_every_caller() -> None:
+    class _BrokenModel:
+        def predict_proba(self, *_: Any) -> np.ndarray:
+            raise RuntimeError("boom")
+
+    async def _scenario() -> list[Any]:
+        batcher = PredictionBatcher(max_batch_size=2, max_wait_ms=50)
+        await batcher.start()
+        try:
+            model = _BrokenModel()
+            return await asyncio.gather(
+                batcher.predict(model, _features(1)),
+                batcher.predict(model, _features(2)),
+                return_exceptions=True,
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(_scenario())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_batcher_caps_concurrent_flushes_to_executor() -> None:
+    model = _CountingModel()
+
+    class _SlowExecutor:
+        def __init__(self) -> None:
+            self.in_flight = self.peak = 0
+
+        async def score(self, model: Any, features: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            probabilities = model.predict_proba(features)[:, 1]
+            return probabilities > 0.5, probabilities
+
+    executor = _SlowExecutor()
+
+    async def _scenario() -> list[tuple[bool, float]]:
+        batcher = PredictionBatcher(max_batch_size=1, max_wait_ms=0, executor=executor, max_in_flight=2)
+        await batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.predict(model, _features(qty % 10)) for qty in range(10)))
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(_scenario())
+
+    assert len(results) == 10
+    assert executor.peak == 2
+
+
+def test_stop_fails_requests_of_the_batch_being_collected() -> None:
+    async def _scenario() -> list[Any]:
+        batcher = PredictionBatcher(max_batch_size=8, max_wait_ms=10_000)
+        await batcher.start()
+        requests = [asyncio.create_task(batcher.predict(_CountingModel(), _features(qty))) for qty in range(3)]
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), timeout=1)
+
+    results = asyncio.run(_scenario())
+
+    assert [type(result) for result in results] == [RuntimeError] * 3
+
+
+def test_stop_fails_batch_waiting_for_executor_slot() -> None:
+    class _SlowExecutor:
+        async def score(self, model: Any, features: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            await asyncio.sleep(0.05)
+            probabilities = model.predict_proba(features)[:, 1]
+            return probabilities > 0.5, probabilities
+
+    async def _scenario() -> list[Any]:
+        batcher = PredictionBatcher(max_batch_size=2, max_wait_ms=0, executor=_SlowExecutor(), max_in_flight=1)
+        await batcher.start()
+        requests = [asyncio.create_task(batcher.predict(_CountingModel(), _features(qty))) for qty in range(4)]
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), timeout=1)
+
+    results = asyncio.run(_scenario())
+
+    # Первый батч уже в executor и досчитывается, второй ждал слота.
+    assert all(isinstance(result, tuple) for result in results[:2])
+    assert [type(result) for result in results[2:]] == [RuntimeError] * 2
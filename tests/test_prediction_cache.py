@@ -1,13 +1,26 @@
 from __future__ import annotations
 
 import asyncio
-from types import SimpleNamespace
-from unittest.mock import AsyncMock
-from storages.prediction_cache import PredictionCacheStorage
+import time
+from unittest.mock import AsyncMock, MagicMock
 
+import pytest
 
-def test_set_sync_prediction_calls_redis_with_ttl() -> None:
-    client = AsyncMock()
+from storages.codecs import decode_value, get_codec
+from storages.local_cache import LocalCache
+from storages.prediction_cache import CACHE_INVALIDATION_CHANNEL, PredictionCacheStorage, needs_refresh
+
+
+def _pipelined_client() -> tuple[MagicMock, MagicMock]:
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    return client, pipe
+
+
+def test_set_sync_prediction_is_one_pipelined_round_trip() -> None:
+    client, pipe = _pipelined_client()
     storage = PredictionCacheStorage(client=client, ttl_seconds=123)
 
     payload = {
@@ -21,10 +34,22 @@ def test_set_sync_prediction_calls_redis_with_ttl() -> None:
     result = {"is_violation": True, "probability": 0.8}
     asyncio.run(storage.set_sync_prediction(item_id=42, payload=payload, result=result))
 
-    assert client.set.await_count == 1
-    args, kwargs = client.set.await_args
-    assert args[0].startswith("prediction:sync:item:42:")
+    pipe.execute.assert_awaited_once()
+    args, kwargs = pipe.set.call_args
+    assert args[0] == "prediction:sync:f:0:2:1:1"
     assert kwargs["ex"] == 123
+    pipe.sadd.assert_not_called()
+
+
+def test_set_simple_prediction_is_one_pipelined_round_trip() -> None:
+    client, pipe = _pipelined_client()
+    storage = PredictionCacheStorage(client=client, ttl_seconds=60)
+
+    asyncio.run(storage.set_simple_prediction(7, {"is_violation": False, "probability": 0.1}))
+
+    pipe.execute.assert_awaited_once()
+    assert pipe.set.call_args.args[0] == "prediction:simple:item:{7}"
+    pipe.sadd.assert_called_once_with("prediction:item:index:{7}", "prediction:simple:item:{7}")
 
 
 def test_get_simple_prediction_returns_none_on_cache_miss() -> None:
@@ -35,29 +60,26 @@ def test_get_simple_prediction_returns_none_on_cache_miss() -> None:
     value = asyncio.run(storage.get_simple_prediction(7))
 
     assert value is None
-    client.get.assert_awaited_once_with("prediction:simple:item:7")
+    client.get.assert_awaited_once_with("prediction:simple:item:{7}")
 
 
-def test_delete_item_predictions_uses_index_and_delete() -> None:
-    client = SimpleNamespace(
-        set=AsyncMock(),
-        get=AsyncMock(),
-        delete=AsyncMock(),
-        smembers=AsyncMock(return_value={"prediction:simple:item:5", "prediction:sync:item:5:abc"}),
-    )
+def test_delete_item_predictions_runs_one_script() -> None:
+    script = AsyncMock(return_value=2)
+    client = MagicMock()
+    client.register_script.return_value = script
     storage = PredictionCacheStorage(client=client)
 
     asyncio.run(storage.delete_item_predictions(5))
+    asyncio.run(storage.delete_item_predictions(6))
 
-    client.smembers.assert_awaited_once_with("prediction:item:index:5")
-    args, _kwargs = client.delete.await_args
-    assert "prediction:simple:item:5" in args
-    assert "prediction:sync:item:5:abc" in args
-    assert "prediction:item:index:5" in args
+    client.register_script.assert_called_once()
+    assert script.await_count == 2
+    script.assert_awaited_with(keys=["prediction:item:index:{6}"])
+    client.publish.assert_not_called()
 
 
 def test_set_moderation_result_calls_redis_with_ttl() -> None:
-    client = AsyncMock()
+    client, pipe = _pipelined_client()
     storage = PredictionCacheStorage(client=client, ttl_seconds=321)
     result = {
         "id": 13,
@@ -70,16 +92,349 @@ def test_set_moderation_result_calls_redis_with_ttl() -> None:
 
     asyncio.run(storage.set_moderation_result(13, result))
 
-    client.set.assert_awaited_once()
-    args, kwargs = client.set.await_args
+    pipe.execute.assert_awaited_once()
+    args, kwargs = pipe.set.call_args
     assert args[0] == "prediction:moderation:task:13"
     assert kwargs["ex"] == 321
+    pipe.publish.assert_not_called()
+
+
+def test_pending_moderation_result_gets_short_ttl() -> None:
+    client, pipe = _pipelined_client()
+    local_cache = LocalCache()
+    storage = PredictionCacheStorage(client=client, ttl_seconds=321, pending_ttl_seconds=2, local_cache=local_cache)
+    result = {"id": 13, "item_id": 5, "status": "pending"}
+
+    asyncio.run(storage.set_moderation_result(13, result))
+
+    assert pipe.set.call_args.kwargs["ex"] == 2
+    assert local_cache._entries["prediction:moderation:task:13"][0] <= time.monotonic() + 2
+    pipe.publish.assert_called_once_with(CACHE_INVALIDATION_CHANNEL, "task:13")
 
 
-def test_delete_moderation_result_calls_redis_delete() -> None:
+def test_pending_moderation_result_is_not_cached_with_zero_ttl() -> None:
+    client, pipe = _pipelined_client()
+    local_cache = LocalCache()
+    local_cache.set("prediction:moderation:task:13", {"status": "completed"}, "task:13")
+    storage = PredictionCacheStorage(client=client, pending_ttl_seconds=0, local_cache=local_cache)
+
+    asyncio.run(storage.set_moderation_result(13, {"id": 13, "item_id": 5, "status": "pending"}))
+
+    pipe.set.assert_not_called()
+    pipe.delete.assert_called_once_with("prediction:moderation:task:13")
+    assert len(local_cache) == 0
+
+
+def test_pending_moderation_result_read_from_redis_keeps_short_ttl_in_local_cache() -> None:
     client = AsyncMock()
+    client.get.return_value = '{"id": 13, "item_id": 5, "status": "pending"}'
+    local_cache = LocalCache(ttl_seconds=30)
+    storage = PredictionCacheStorage(client=client, pending_ttl_seconds=2, local_cache=local_cache)
+
+    asyncio.run(storage.get_moderation_result(13))
+
+    assert local_cache._entries["prediction:moderation:task:13"][0] <= time.monotonic() + 2
+
+
+def test_storage_without_local_cache_can_publish_invalidations() -> None:
+    client, pipe = _pipelined_client()
+    storage = PredictionCacheStorage(client=client, publish_invalidations=True)
+
+    asyncio.run(storage.set_moderation_result(13, {"id": 13, "item_id": 5, "status": "failed"}))
+
+    pipe.publish.assert_called_once_with(CACHE_INVALIDATION_CHANNEL, "task:13")
+
+
+def test_delete_moderation_results_is_one_delete() -> None:
+    client, pipe = _pipelined_client()
     storage = PredictionCacheStorage(client=client)
 
-    asyncio.run(storage.delete_moderation_result(21))
+    asyncio.run(storage.delete_moderation_results([21, 22]))
+    asyncio.run(storage.delete_moderation_results([]))
+
+    pipe.delete.assert_called_once_with("prediction:moderation:task:21", "prediction:moderation:task:22")
+    pipe.execute.assert_awaited_once()
+    pipe.publish.assert_not_called()
+
+
+def _payload(item_id: int, **overrides: object) -> dict:
+    return {
+        "seller_id": 1,
+        "is_verified_seller": False,
+        "item_id": item_id,
+        "name": "item",
+        "description": "abc",
+        "category": 10,
+        "images_qty": 1,
+        **overrides,
+    }
+
+
+def test_get_sync_predictions_uses_single_mget_with_legacy_keys() -> None:
+    client = AsyncMock()
+    client.mget.return_value = [
+        '{"is_violation": true, "probability": 0.9}',
+        None,
+        None,
+        '{"is_violation": false, "probability": 0.2}',
+    ]
+    storage = PredictionCacheStorage(client=client)
+    payloads = [_payload(1), _payload(2, category=11)]
+
+    values = asyncio.run(storage.get_sync_predictions([(1, payloads[0]), (2, payloads[1])]))
+
+    assert values == [
+        {"is_violation": True, "probability": 0.9},
+        {"is_violation": False, "probability": 0.2},
+    ]
+    client.mget.assert_awaited_once()
+    keys = client.mget.await_args.args[0]
+    assert keys[:2] == ["prediction:sync:f:0:1:3:10", "prediction:sync:f:0:1:3:11"]
+    assert keys[2:] == [
+        PredictionCacheStorage._legacy_sync_key(1, payloads[0]),
+        PredictionCacheStorage._legacy_sync_key(2, payloads[1]),
+    ]
+
+
+def test_get_sync_prediction_reads_legacy_key_in_same_round_trip() -> None:
+    client = AsyncMock()
+    client.mget.return_value = [None, '{"is_violation": true, "probability": 0.7}']
+    storage = PredictionCacheStorage(client=client)
+    payload = _payload(5)
+
+    value = asyncio.run(storage.get_sync_prediction(item_id=5, payload=payload, model_version="v1"))
+
+    assert value == {"is_violation": True, "probability": 0.7}
+    client.mget.assert_awaited_once_with([
+        "prediction:sync:model:v1:f:0:1:3:10",
+        PredictionCacheStorage._legacy_sync_key(5, payload, "v1"),
+    ])
+    client.get.assert_not_awaited()
+
+
+def test_sync_key_depends_only_on_model_features() -> None:
+    base = _payload(1)
+
+    same_features = _payload(2, seller_id=99, name="other", description="xyz")
+    other_features = _payload(1, images_qty=2)
+
+    assert PredictionCacheStorage._sync_key(base) == PredictionCacheStorage._sync_key(same_features)
+    assert PredictionCacheStorage._sync_key(base) != PredictionCacheStorage._sync_key(other_features)
+
+
+def test_set_sync_predictions_uses_one_pipeline() -> None:
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    storage = PredictionCacheStorage(client=client, ttl_seconds=55)
+    entries = [
+        (1, _payload(1), {"is_violation": True, "probability": 0.9}),
+        (2, _payload(2, is_verified_seller=True), {"is_violation": False, "probability": 0.1}),
+    ]
+
+    asyncio.run(storage.set_sync_predictions(entries))
+
+    client.pipeline.assert_called_once()
+    pipe.execute.assert_awaited_once()
+    assert [call.args[0] for call in pipe.set.call_args_list] == [
+        "prediction:sync:f:0:1:3:10",
+        "prediction:sync:f:1:1:3:10",
+    ]
+    assert all(call.kwargs["ex"] == 55 for call in pipe.set.call_args_list)
+
+
+def test_get_simple_predictions_uses_single_mget() -> None:
+    client = AsyncMock()
+    client.mget.return_value = [None, '{"is_violation": false, "probability": 0.2}']
+    storage = PredictionCacheStorage(client=client)
+
+    values = asyncio.run(storage.get_simple_predictions([4, 5]))
+
+    assert values == [None, {"is_violation": False, "probability": 0.2}]
+    client.mget.assert_awaited_once_with(["prediction:simple:item:{4}", "prediction:simple:item:{5}"])
+
+
+def test_set_simple_predictions_uses_one_pipeline() -> None:
+    pipe = MagicMock()
+    pipe.execute = AsyncMock()
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    storage = PredictionCacheStorage(client=client, ttl_seconds=77)
+
+    asyncio.run(storage.set_simple_predictions({
+        4: {"is_violation": True, "probability": 0.8},
+        5: {"is_violation": False, "probability": 0.2},
+    }))
+
+    pipe.execute.assert_awaited_once()
+    assert [call.args[0] for call in pipe.set.call_args_list] == [
+        "prediction:simple:item:{4}",
+        "prediction:simple:item:{5}",
+    ]
+    assert all(call.kwargs["ex"] == 77 for call in pipe.set.call_args_list)
+
+
+def test_cache_keys_are_namespaced_by_model_version() -> None:
+    payload = _payload(42)
+
+    assert PredictionCacheStorage._simple_key(7, "v1") != PredictionCacheStorage._simple_key(7, "v2")
+    assert PredictionCacheStorage._simple_key(7, "v1") != PredictionCacheStorage._simple_key(7)
+    assert PredictionCacheStorage._sync_key(payload, "v1").startswith("prediction:sync:model:v1:")
+    assert PredictionCacheStorage._sync_key(payload, "v1") != PredictionCacheStorage._sync_key(payload, "v2")
+
+
+def test_get_simple_prediction_uses_versioned_key() -> None:
+    client = AsyncMock()
+    client.get.return_value = None
+    storage = PredictionCacheStorage(client=client)
+
+    asyncio.run(storage.get_simple_prediction(7, "file-abc"))
+
+    client.get.assert_awaited_once_with("prediction:simple:item:model:file-abc:{7}")
+
+
+def test_local_cache_hit_skips_redis() -> None:
+    client = AsyncMock()
+    client.get.return_value = '{"is_violation": true, "probability": 0.9}'
+    storage = PredictionCacheStorage(client=client, local_cache=LocalCache(max_size=10, ttl_seconds=60))
+
+    first = asyncio.run(storage.get_simple_prediction(7))
+    second = asyncio.run(storage.get_simple_prediction(7))
+
+    assert first == second == {"is_violation": True, "probability": 0.9}
+    client.get.assert_awaited_once_with("prediction:simple:item:{7}")
+
+
+def test_get_simple_predictions_reads_only_local_misses_from_redis() -> None:
+    client = AsyncMock()
+    client.mget.return_value = ['{"is_violation": false, "probability": 0.2}', None]
+    local_cache = LocalCache(max_size=10, ttl_seconds=60)
+    local_cache.set("prediction:simple:item:{1}", {"is_violation": True, "probability": 0.9}, tag="item:1")
+    storage = PredictionCacheStorage(client=client, local_cache=local_cache)
+
+    values = asyncio.run(storage.get_simple_predictions([1, 2, 3]))
+
+    client.mget.assert_awaited_once_with(["prediction:simple:item:{2}", "prediction:simple:item:{3}"])
+    assert values == [
+        {"is_violation": True, "probability": 0.9},
+        {"is_violation": False, "probability": 0.2},
+        None,
+    ]
+    assert local_cache.get("prediction:simple:item:{2}") == {"is_violation": False, "probability": 0.2}
+
+
+def test_delete_item_predictions_invalidates_local_cache_and_publishes() -> None:
+    script = AsyncMock(return_value=1)
+    client = MagicMock()
+    client.register_script.return_value = script
+    client.publish = AsyncMock(return_value=1)
+    local_cache = LocalCache(max_size=10, ttl_seconds=60)
+    local_cache.set("prediction:simple:item:{5}", {"is_violation": True, "probability": 0.9}, tag="item:5")
+    storage = PredictionCacheStorage(client=client, local_cache=local_cache)
+
+    asyncio.run(storage.delete_item_predictions(5))
+
+    assert local_cache.get("prediction:simple:item:{5}") is None
+    script.assert_awaited_once_with(keys=["prediction:item:index:{5}"])
+    client.publish.assert_awaited_once_with(CACHE_INVALIDATION_CHANNEL, "item:5")
+
+
+def test_delete_moderation_results_publishes_all_tags_at_once() -> None:
+    client, pipe = _pipelined_client()
+    local_cache = LocalCache(max_size=10, ttl_seconds=60)
+    local_cache.set("prediction:moderation:task:1", {"status": "pending"}, tag="task:1")
+    storage = PredictionCacheStorage(client=client, local_cache=local_cache)
+
+    asyncio.run(storage.delete_moderation_results([1, 2]))
+
+    pipe.publish.assert_called_once_with(CACHE_INVALIDATION_CHANNEL, "task:1 task:2")
+    assert local_cache.get("prediction:moderation:task:1") is None
+
+
+def test_invalidation_listener_drops_published_tags() -> None:
+    local_cache = LocalCache(max_size=10, ttl_seconds=60)
+    local_cache.set("prediction:moderation:task:3", {"status": "pending"}, tag="task:3")
+    received = asyncio.Event()
+
+    class _PubSub:
+        async def subscribe(self, channel: str) -> None:
+            assert channel == CACHE_INVALIDATION_CHANNEL
+
+        async def listen(self):
+            yield {"type": "subscribe", "data": 1}
+            yield {"type": "message", "data": "task:3 task:4"}
+            received.set()
+            await asyncio.Event().wait()
+
+        async def aclose(self) -> None:
+            return None
+
+    client = MagicMock()
+    client.pubsub.return_value = _PubSub()
+    storage = PredictionCacheStorage(client=client, local_cache=local_cache)
+
+    async def _run() -> None:
+        task = asyncio.create_task(storage.listen_invalidations())
+        await asyncio.wait_for(received.wait(), timeout=1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(_run())
+
+    assert local_cache.get("prediction:moderation:task:3") is None
+
+
+def test_prediction_pair_is_written_with_compact_codec() -> None:
+    client, pipe = _pipelined_client()
+    storage = PredictionCacheStorage(client=client, codec=get_codec("struct"))
+
+    asyncio.run(storage.set_sync_prediction(item_id=7, payload=_payload(7), result={"is_violation": True, "probability": 0.25}))
+
+    raw = pipe.set.call_args.args[1]
+    assert len(raw) == 10
+    assert decode_value(raw) == {"is_violation": True, "probability": 0.25}
+
+
+def test_simple_prediction_carries_soft_expiry_under_hard_ttl(monkeypatch) -> None:
+    monkeypatch.setattr("storages.prediction_cache.time.time", lambda: 1000.0)
+    client, pipe = _pipelined_client()
+    storage = PredictionCacheStorage(client=client, ttl_seconds=100, soft_ttl_seconds=80, codec=get_codec("struct"))
+
+    asyncio.run(storage.set_simple_prediction(7, {"is_violation": True, "probability": 0.25}, compute_seconds=0.5))
+
+    args, kwargs = pipe.set.call_args
+    assert kwargs["ex"] == 100
+    assert len(args[1]) == 22
+    assert decode_value(args[1]) == {
+        "is_violation": True,
+        "probability": 0.25,
+        "fresh_until": 1080.0,
+        "delta": 0.5,
+    }
+
+
+def test_soft_ttl_is_capped_by_hard_ttl() -> None:
+    storage = PredictionCacheStorage(client=MagicMock(), ttl_seconds=10, soft_ttl_seconds=60)
+
+    assert storage.soft_ttl_seconds == 10
+
+
+def test_needs_refresh_follows_soft_expiry(monkeypatch) -> None:
+    monkeypatch.setattr("storages.prediction_cache.random.random", lambda: 0.5)
+    entry = {"is_violation": False, "probability": 0.1, "fresh_until": 1000.0, "delta": 0.0}
+
+    assert not needs_refresh(entry, now=999.0)
+    assert needs_refresh(entry, now=1000.0)
+    assert not needs_refresh({"is_violation": False, "probability": 0.1}, now=10**10)
+
+
+def test_needs_refresh_starts_early_for_expensive_entries(monkeypatch) -> None:
+    # -log(1 - 0.5) * delta(10) * beta(1) ~ 6.9 секунды до мягкого срока
+    monkeypatch.setattr("storages.prediction_cache.random.random", lambda: 0.5)
+    entry = {"is_violation": False, "probability": 0.1, "fresh_until": 1000.0, "delta": 10.0}
 
-    client.delete.assert_awaited_once_with("prediction:moderation:task:21")
+    assert needs_refresh(entry, now=994.0)
+    assert not needs_refresh(entry, now=992.0)
+    assert not needs_refresh(entry, now=994.0, beta=0.0)
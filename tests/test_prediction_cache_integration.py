@@ -12,7 +12,7 @@ pytestmark = pytest.mark.integration
 
 def test_prediction_cache_roundtrip_integration() -> None:
     async def _scenario() -> tuple[bool, dict[str, object] | None]:
-        client = redis.from_url("redis://127.0.0.1:6379/0", decode_responses=True)
+        client = redis.from_url("redis://127.0.0.1:6379/0", decode_responses=False)
         try:
             try:
                 await client.ping()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import asyncio
+from datetime import timedelta
 import pytest
 from errors import AddNotFoundError
 from repositories.adds import AddRepository
@@ -71,3 +72,60 @@ def test_add_delete_integration(clean_db: None) -> None:
     assert deleted.id == add.id
     with pytest.raises(AddNotFoundError):
         asyncio.run(add_repo.get(add.id))
+
+
+def test_get_many_with_seller_integration(
+    clean_db: None,
+    create_user_and_add,
+) -> None:
+    add_repo = AddRepository()
+    seller_id, first_add_id = create_user_and_add(True, 3)
+    _, second_add_id = create_user_and_add(False, 0)
+
+    rows = asyncio.run(add_repo.get_many_with_seller([first_add_id, second_add_id, 999999]))
+
+    assert set(rows) == {first_add_id, second_add_id}
+    assert rows[first_add_id]["seller_id"] == seller_id
+    assert rows[first_add_id]["is_verified_seller"] is True
+    assert rows[second_add_id]["images_qty"] == 0
+
+
+def test_get_recently_active_ids_integration(
+    clean_db: None,
+    create_user_and_add,
+) -> None:
+    add_repo = AddRepository()
+    moderation_repo = ModerationResultRepository()
+    _, old_add_id = create_user_and_add(False, 1)
+    _, new_add_id = create_user_and_add(False, 2)
+    _, closed_add_id = create_user_and_add(False, 3)
+    asyncio.run(moderation_repo.create_pending(old_add_id))
+
+    async def _close() -> None:
+        async with add_repo.connection_provider(add_repo.dsn) as conn:
+            await conn.execute("UPDATE adds SET is_closed = TRUE WHERE id = $1", closed_add_id)
+
+    asyncio.run(_close())
+
+    assert asyncio.run(add_repo.get_recently_active_ids(10, timedelta(hours=1))) == [old_add_id, new_add_id]
+    assert asyncio.run(add_repo.get_recently_active_ids(1, timedelta(hours=1))) == [old_add_id]
+    # Модерация вне окна не поднимает объявление выше новых.
+    assert asyncio.run(add_repo.get_recently_active_ids(10, timedelta(0))) == [new_add_id, old_add_id]
+
+
+def test_mark_completed_many_integration(
+    clean_db: None,
+    create_user_and_add,
+) -> None:
+    moderation_repo = ModerationResultRepository()
+    _, add_id = create_user_and_add(False, 1)
+    first = asyncio.run(moderation_repo.create_pending(add_id))
+    second = asyncio.run(moderation_repo.create_pending(add_id))
+
+    updated = asyncio.run(moderation_repo.mark_completed_many([(first.id, True, 0.9), (second.id, False, 0.1)]))
+
+    assert {result.id: (result.status, result.is_violation) for result in updated} == {
+        first.id: ("completed", True),
+        second.id: ("completed", False),
+    }
+    assert asyncio.run(moderation_repo.get(second.id)).probability == 0.1
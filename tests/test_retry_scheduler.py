@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from services.retry_scheduler import LocalRetryScheduler, RedisRetryScheduler, backoff_delay
+
+
+def test_backoff_grows_exponentially_with_jitter_and_is_capped() -> None:
+    with patch("services.retry_scheduler.random.uniform", side_effect=lambda low, high: high):
+        assert [backoff_delay(attempt, base_delay=1, max_delay=5) for attempt in (1, 2, 3, 4)] == [1, 2, 4, 5]
+    with patch("services.retry_scheduler.random.uniform", side_effect=lambda low, high: low):
+        assert backoff_delay(3, base_delay=1, max_delay=60) == 2
+
+
+def test_schedule_adds_retry_to_sorted_set_with_due_time() -> None:
+    client = MagicMock()
+    client.zadd = AsyncMock()
+    scheduler = RedisRetryScheduler(client, key="retries")
+
+    with patch("services.retry_scheduler.time.time", return_value=1000.0):
+        asyncio.run(scheduler.schedule(item_id=5, task_id=13, retry_count=2, delay=4))
+
+    key, mapping = client.zadd.await_args.args
+    assert key == "retries"
+    ((member, score),) = mapping.items()
+    assert json.loads(member) == {"item_id": 5, "task_id": 13, "retry_count": 2}
+    assert score == 1004.0
+
+
+def test_dispatch_sends_due_retries_to_kafka() -> None:
+    due = [json.dumps({"item_id": item_id, "task_id": item_id + 10, "retry_count": 1}).encode() for item_id in (1, 2)]
+    client = MagicMock()
+    client.register_script.return_value = AsyncMock(return_value=[3, *due])
+    kafka_client = AsyncMock()
+    scheduler = RedisRetryScheduler(client)
+
+    dispatched = asyncio.run(scheduler.dispatch_due(kafka_client))
+
+    assert dispatched == 2
+    assert [call.kwargs for call in kafka_client.send_moderation_request.await_args_list] == [
+        {"item_id": 1, "task_id": 11, "retry_count": 1},
+        {"item_id": 2, "task_id": 12, "retry_count": 1},
+    ]
+
+
+def test_dispatch_puts_unsent_retries_back_when_kafka_fails() -> None:
+    due = [json.dumps({"item_id": item_id, "task_id": item_id, "retry_count": 1}) for item_id in (1, 2, 3)]
+    client = MagicMock()
+    client.register_script.return_value = AsyncMock(return_value=[0, *due])
+    client.zadd = AsyncMock()
+    kafka_client = AsyncMock()
+    kafka_client.send_moderation_request.side_effect = [None, ConnectionError("kafka is down"), None]
+    scheduler = RedisRetryScheduler(client)
+
+    dispatched = asyncio.run(scheduler.dispatch_due(kafka_client))
+
+    assert dispatched == 1
+    requeued = [json.loads(next(iter(call.args[1]))) for call in client.zadd.await_args_list]
+    assert [retry["task_id"] for retry in requeued] == [2, 3]
+
+
+def test_local_scheduler_sends_retry_later_without_blocking() -> None:
+    kafka_client = AsyncMock()
+    scheduler = LocalRetryScheduler(kafka_client, base_delay=0.01)
+
+    async def _run() -> None:
+        await scheduler.schedule(item_id=5, task_id=13, retry_count=1)
+        kafka_client.send_moderation_request.assert_not_awaited()
+        assert len(scheduler) == 1
+        await asyncio.sleep(0.05)
+
+    asyncio.run(_run())
+
+    kafka_client.send_moderation_request.assert_awaited_once_with(item_id=5, task_id=13, retry_count=1)
+    assert len(scheduler) == 0
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import fnmatch
+from collections import Counter
+from typing import Any
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from benchmarks.fakes import InMemoryRedis
+from clients.sharded_redis import PUBSUB_ROUTING_KEY, HashRing, ShardedRedis, hash_tag
+from storages.prediction_cache import CACHE_INVALIDATION_CHANNEL, PredictionCacheStorage
+
+
+class _Shard(InMemoryRedis):
+    def __init__(self) -> None:
+        super().__init__()
+        self.down = False
+        self.published: list[tuple[str, Any]] = []
+        self.scripts_run: list[list[str]] = []
+
+    def _check(self) -> None:
+        if self.down:
+            raise RedisConnectionError("shard is down")
+
+    async def ping(self) -> bool:
+        self._check()
+        return True
+
+    async def get(self, key: str) -> Any:
+        self._check()
+        return await super().get(key)
+
+    async def mget(self, keys: Any) -> list[Any]:
+        self._check()
+        return await super().mget(keys)
+
+    async def publish(self, channel: str, message: Any) -> int:
+        self._check()
+        self.published.append((channel, message))
+        return 1
+
+    async def scan_iter(self, match: str = "*", count: int = 10) -> Any:
+        self._check()
+        for key in list(self._values):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def unlink(self, *keys: str) -> int:
+        self._check()
+        return await self.delete(*keys)
+
+    def register_script(self, script: str) -> Any:
+        async def _run(keys: Any = (), args: Any = ()) -> int:
+            self._check()
+            self.scripts_run.append(list(keys))
+            return await self.delete(*keys)
+
+        return _run
+
+    async def aclose(self) -> None:
+        return None
+
+
+def _sharded(count: int = 3) -> tuple[ShardedRedis, dict[str, _Shard]]:
+    shards = {f"redis://redis-{index}:6379/0": _Shard() for index in range(count)}
+    return ShardedRedis(shards, health_check_interval=0), shards
+
+
+def test_hash_tag_follows_redis_cluster_rules() -> None:
+    assert hash_tag("prediction:item:index:{42}") == b"42"
+    assert hash_tag(b"prediction:simple:item:model:v1:{42}") == b"42"
+    assert hash_tag("prediction:moderation:task:13") == b"prediction:moderation:task:13"
+    assert hash_tag("a:{}:b") == b"a:{}:b"
+
+
+def test_item_keys_share_one_shard() -> None:
+    ring = HashRing(["a", "b", "c", "d"])
+    item_keys = [
+        PredictionCacheStorage._simple_key(42),
+        PredictionCacheStorage._simple_key(42, "file-abc"),
+        PredictionCacheStorage._item_index_key(42),
+        PredictionCacheStorage._simple_lock_key(42, "file-abc"),
+    ]
+
+    assert len({ring.get_node(key) for key in item_keys}) == 1
+
+
+def test_removing_node_moves_only_its_keys() -> None:
+    ring = HashRing(["a", "b", "c", "d"])
+    keys = [f"key:{index}" for index in range(2000)]
+    before = {key: ring.get_node(key) for key in keys}
+    after = {key: ring.get_node(key, exclude={"b"}) for key in keys}
+
+    assert all(after[key] == before[key] for key in keys if before[key] != "b")
+    assert all(after[key] != "b" for key in keys)
+    assert min(Counter(before.values()).values()) > 2000 / 4 * 0.6
+
+
+def test_mget_is_split_by_shard_and_keeps_order() -> None:
+    client, shards = _sharded()
+    keys = [f"key:{index}" for index in range(20)]
+
+    async def _run() -> list[Any]:
+        for index, key in enumerate(keys):
+            await client.set(key, index)
+        return await client.mget(keys)
+
+    assert asyncio.run(_run()) == list(range(20))
+    assert sum(len(shard._values) for shard in shards.values()) == 20
+    assert sum(1 for shard in shards.values() if shard._values) > 1
+
+
+def test_failed_shard_is_skipped_and_reads_fail_over() -> None:
+    client, shards = _sharded()
+    key = "prediction:simple:item:{7}"
+    owner = client.node_for(key)
+    shards[owner].down = True
+
+    async def _run() -> Any:
+        miss = await client.get(key)
+        await client.set(key, "v")
+        return miss, await client.get(key), await client.mget([key, "other"])
+
+    miss, hit, many = asyncio.run(_run())
+
+    assert miss is None
+    assert hit == "v"
+    assert many[0] == "v"
+    assert owner not in client.healthy_nodes
+    assert client.node_for(key) != owner
+
+
+def test_health_check_returns_recovered_shard() -> None:
+    client, shards = _sharded()
+    node = next(iter(shards))
+    shards[node].down = True
+    asyncio.run(client.check_health())
+    assert node not in client.healthy_nodes
+
+    shards[node].down = False
+    asyncio.run(client.check_health())
+    assert node in client.healthy_nodes
+
+
+def test_recovered_shard_drops_entries_changed_during_outage() -> None:
+    client, shards = _sharded()
+    key = "prediction:simple:item:{7}"
+    owner = client.node_for(key)
+
+    async def _run() -> tuple[Any, Any]:
+        await client.set(key, "stale")
+        await shards[owner].set("other:7", "kept")
+        shards[owner].down = True
+        await client.check_health()
+        # Объявление закрыто, пока шард лежал: удаление ушло на резервный узел.
+        await client.delete(key)
+        shards[owner].down = False
+        await client.check_health()
+        return await client.get(key), await shards[owner].get("other:7")
+
+    value, unrelated = asyncio.run(_run())
+
+    assert owner in client.healthy_nodes
+    assert client.node_for(key) == owner
+    assert value is None
+    assert unrelated == "kept"
+
+
+def test_shard_stays_out_of_ring_until_flushed() -> None:
+    client, shards = _sharded()
+    node = next(iter(shards))
+    shards[node].down = True
+    asyncio.run(client.check_health())
+
+    async def _failing_unlink(*keys: str) -> int:
+        raise RedisConnectionError("flush failed")
+
+    shards[node].down = False
+    asyncio.run(shards[node].set("prediction:sync:{1}", "stale"))
+    shards[node].unlink = _failing_unlink
+    asyncio.run(client.check_health())
+
+    assert node not in client.healthy_nodes
+
+
+def test_start_fails_when_every_shard_is_down() -> None:
+    client, shards = _sharded(2)
+    for shard in shards.values():
+        shard.down = True
+
+    with pytest.raises(RedisConnectionError):
+        asyncio.run(client.start())
+
+
+def test_pipeline_groups_commands_and_publishes_to_every_shard() -> None:
+    client, shards = _sharded()
+    keys = [f"key:{index}" for index in range(10)]
+
+    async def _run() -> list[Any]:
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(key, key.upper(), ex=60)
+        pipe.delete(*keys[:4])
+        pipe.publish("channel", "item:1")
+        return await pipe.execute()
+
+    results = asyncio.run(_run())
+
+    assert results[:10] == [True] * 10
+    assert results[10] == 4
+    assert results[11] == 3
+    assert all(shard.published == [("channel", "item:1")] for shard in shards.values())
+    assert asyncio.run(client.mget(keys)) == [None] * 4 + [key.upper() for key in keys[4:]]
+
+
+def test_script_keys_must_share_a_hash_tag() -> None:
+    client, _ = _sharded()
+    script = client.register_script("return 1")
+
+    with pytest.raises(ValueError):
+        asyncio.run(script(keys=["prediction:item:index:{1}", "prediction:item:index:{2}"], args=[]))
+
+
+def test_item_invalidation_reaches_the_subscriber_shard() -> None:
+    client, shards = _sharded(2)
+    subscriber_node = client.node_for(PUBSUB_ROUTING_KEY)
+    item_id = next(
+        item_id for item_id in range(1000)
+        if client.node_for(f"prediction:item:index:{{{item_id}}}") != subscriber_node
+    )
+    item_node = client.node_for(f"prediction:item:index:{{{item_id}}}")
+    storage = PredictionCacheStorage(client=client, publish_invalidations=True)
+
+    asyncio.run(storage.delete_item_predictions(item_id))
+
+    assert shards[item_node].scripts_run == [[f"prediction:item:index:{{{item_id}}}"]]
+    assert (CACHE_INVALIDATION_CHANNEL, f"item:{item_id}") in shards[subscriber_node].published
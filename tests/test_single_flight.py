@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call() -> None:
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def _compute() -> int:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def _run() -> int:
+        first = asyncio.create_task(single_flight.do("key", _compute))
+        second = asyncio.create_task(single_flight.do("key", _compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(_run()) == 42
+    assert calls == 1
+    assert len(single_flight) == 0
+
+
+def test_sequential_calls_are_not_coalesced() -> None:
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def _compute() -> int:
+        nonlocal calls
+        calls += 1
+        return calls
+
+    async def _run() -> list[int]:
+        return [await single_flight.do("key", _compute), await single_flight.do("key", _compute)]
+
+    assert asyncio.run(_run()) == [1, 2]
+
+
+def test_start_skips_key_already_in_flight() -> None:
+    single_flight = SingleFlight()
+
+    async def _compute() -> int:
+        await asyncio.sleep(0.01)
+        return 1
+
+    async def _run() -> tuple:
+        task = single_flight.start("key", _compute)
+        duplicate = single_flight.start("key", _compute)
+        joined = await single_flight.do("key", _compute)
+        return task, duplicate, joined
+
+    task, duplicate, joined = asyncio.run(_run())
+
+    assert task is not None and task.result() == 1
+    assert duplicate is None
+    assert joined == 1
+    assert len(single_flight) == 0
+
+
+def test_start_many_computes_free_keys_once_and_serves_each_waiter() -> None:
+    single_flight = SingleFlight()
+    batches: list[list[str]] = []
+
+    async def _compute_many(keys: list[str]) -> dict[str, str]:
+        batches.append(keys)
+        await asyncio.sleep(0.01)
+        return {key: key.upper() for key in keys}
+
+    async def _run() -> str:
+        busy = asyncio.ensure_future(single_flight.do("a", _slow_value))
+        await asyncio.sleep(0)
+        assert single_flight.start_many(["a", "b", "c"], _compute_many) is not None
+        assert single_flight.start_many(["b", "c"], _compute_many) is None
+        value = await single_flight.do("b", _slow_value)
+        await busy
+        return value
+
+    assert asyncio.run(_run()) == "B"
+    assert batches == [["b", "c"]]
+
+
+async def _slow_value() -> str:
+    await asyncio.sleep(0.01)
+    return "single"
@@ -4,6 +4,7 @@ from unittest.mock import AsyncMock
 
 from models.users import UserModel
 from repositories.users import UserRedisStorage
+from storages.codecs import JsonCodec, decode_value
 
 RAW_USER = {
     "id": 5,
@@ -34,14 +35,14 @@ def test_get_user_cache_miss_returns_none() -> None:
     client.get.assert_awaited_once_with("user:7")
 
 
-def test_set_user_writes_json_with_ttl() -> None:
+def test_set_user_writes_encoded_value_with_ttl() -> None:
     client = AsyncMock()
     storage = UserRedisStorage(client=client, ttl_seconds=123)
     asyncio.run(storage.set_user(UNIT_USER))
     client.set.assert_awaited_once()
     args, kwargs = client.set.await_args
     assert args[0] == "user:11"
-    payload = json.loads(args[1])
+    payload = decode_value(args[1])
     assert payload["id"] == 11
     assert payload["name"] == "Unit User"
     assert kwargs["ex"] == 123
@@ -67,4 +68,12 @@ def test_delete_user_calls_redis_delete() -> None:
     client.delete.assert_awaited_once_with("user:3")
 
 
+def test_user_roundtrip_with_json_codec_stays_readable_by_json() -> None:
+    client = AsyncMock()
+    storage = UserRedisStorage(client=client, codec=JsonCodec())
+    asyncio.run(storage.set_user(UNIT_USER))
+    raw = client.set.await_args.args[1]
+    client.get.return_value = raw
 
+    assert json.loads(raw)["id"] == 11
+    assert asyncio.run(storage.get_user(11)) == UNIT_USER
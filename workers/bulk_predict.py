@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import os
+import sys
+from typing import Any, AsyncIterator, BinaryIO, Optional, Sequence
+
+from models.model import InferenceModel, load_model
+from services.bulk_scoring import BULK_SCORING_CHUNK_SIZE, iter_ndjson_lines, score_ndjson_lines
+
+READ_CHUNK_BYTES = 64 * 1024
+
+
+async def _read_chunks(stream: BinaryIO) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await asyncio.to_thread(stream.read, READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def run_bulk_predict(
+    input_stream: BinaryIO,
+    output_stream: BinaryIO,
+    model: Any,
+    chunk_size: int = BULK_SCORING_CHUNK_SIZE,
+) -> None:
+    results = score_ndjson_lines(
+        iter_ndjson_lines(_read_chunks(input_stream)),
+        model=model,
+        chunk_size=chunk_size,
+    )
+    async for line in results:
+        output_stream.write(line)
+    output_stream.flush()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Score NDJSON PredictRequest lines")
+    parser.add_argument("input", nargs="?", default="-", help="input NDJSON file, '-' for stdin")
+    parser.add_argument("-o", "--output", default="-", help="output NDJSON file, '-' for stdout")
+    parser.add_argument("--chunk-size", type=int, default=BULK_SCORING_CHUNK_SIZE)
+    parser.add_argument(
+        "--model-path",
+        default=os.getenv("MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "model.pkl")),
+    )
+    args = parser.parse_args(argv)
+
+    model = InferenceModel(estimator=load_model(args.model_path))
+    input_stream = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    output_stream = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        asyncio.run(run_bulk_predict(input_stream, output_stream, model, args.chunk_size))
+    finally:
+        if input_stream is not sys.stdin.buffer:
+            input_stream.close()
+        if output_stream is not sys.stdout.buffer:
+            output_stream.close()
+
+
+if __name__ == "__main__":
+    main()
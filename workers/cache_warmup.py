@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+from clients.redis import RedisClient
+from db.connection import close_pg_pool
+from services.cache_warmup import (
+    CACHE_WARMUP_ACTIVE_HOURS,
+    CACHE_WARMUP_BATCH_SIZE,
+    CACHE_WARMUP_LIMIT,
+    CACHE_WARMUP_MAX_BATCHES_PER_SECOND,
+    CacheWarmupStats,
+    warm_prediction_cache,
+)
+from services.model_registry import FileModelSource, MlflowModelSource
+from storages.prediction_cache import PredictionCacheStorage
+
+
+async def run_cache_warmup(
+    model_path: str,
+    limit: int = CACHE_WARMUP_LIMIT,
+    batch_size: int = CACHE_WARMUP_BATCH_SIZE,
+    max_batches_per_second: float = CACHE_WARMUP_MAX_BATCHES_PER_SECOND,
+    active_hours: float = CACHE_WARMUP_ACTIVE_HOURS,
+) -> CacheWarmupStats:
+    # Модель берётся из того же источника, что и в API: иначе версия в ключах
+    # кэша не совпадёт, и прогретые записи никто не прочитает.
+    use_mlflow = os.getenv("USE_MLFLOW", "false").lower() == "true"
+    model_source = MlflowModelSource() if use_mlflow else FileModelSource(Path(model_path))
+    model = await asyncio.to_thread(model_source.load)
+
+    redis_client = RedisClient(decode_responses=False)
+    await redis_client.start()
+    try:
+        return await warm_prediction_cache(
+            model=model,
+            cache_storage=PredictionCacheStorage(redis_client.client),
+            limit=limit,
+            active_hours=active_hours,
+            batch_size=batch_size,
+            max_batches_per_second=max_batches_per_second,
+        )
+    finally:
+        await redis_client.stop()
+        await close_pg_pool()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Warm up the simple prediction cache")
+    parser.add_argument("--limit", type=int, default=CACHE_WARMUP_LIMIT, help="how many recently active items to warm")
+    parser.add_argument(
+        "--active-hours",
+        type=float,
+        default=CACHE_WARMUP_ACTIVE_HOURS,
+        help="moderation activity window used to rank items",
+    )
+    parser.add_argument("--batch-size", type=int, default=CACHE_WARMUP_BATCH_SIZE)
+    parser.add_argument(
+        "--max-batches-per-second",
+        type=float,
+        default=CACHE_WARMUP_MAX_BATCHES_PER_SECOND,
+        help="0 disables the rate limit",
+    )
+    parser.add_argument(
+        "--model-path",
+        default=os.getenv("MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "model.pkl")),
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    stats = asyncio.run(run_cache_warmup(
+        args.model_path,
+        args.limit,
+        args.batch_size,
+        args.max_batches_per_second,
+        args.active_hours,
+    ))
+    print(f"total={stats.total} warmed={stats.warmed} skipped={stats.skipped}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,319 @@
-import json
+import asyncio
+import logging
 import os
-from typing import Any
-from aiokafka import AIOKafkaConsumer
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from aiokafka import AIOKafkaConsumer, ConsumerRebalanceListener, TopicPartition
 from clients.kafka import KafkaClient, KAFKA_BOOTSTRAP_SERVERS, MODERATION_TOPIC
-from models.model import load_model
+from clients.message_codecs import decode_message
+from clients.redis import RedisClient
+from app.metrics import observe_model_version, observe_worker_commit_lag, observe_worker_in_flight
 from repositories.adds import AddRepository
 from repositories.moderation_results import ModerationResultRepository
 from repositories.users import UserRepository
-from services.moderation_processing import process_moderation_message
+from services.inference_executor import EXECUTOR_MODES, INFERENCE_EXECUTOR_MODE, InferenceExecutor
+from services.model_registry import (
+    MODEL_RELOAD_INTERVAL_SECONDS,
+    FileModelSource,
+    MlflowModelSource,
+    ModelWatcher,
+)
+from services.moderation_processing import process_moderation_batch, process_moderation_message
+from services.retry_scheduler import MODERATION_RETRY_REDIS_URL, LocalRetryScheduler, RedisRetryScheduler
+from storages.local_cache import LOCAL_CACHE_MAX_SIZE
+from storages.prediction_cache import PredictionCacheStorage
+
+# Больше 1 — сообщения читаются пачками через getmany и обрабатываются
+# process_moderation_batch, оффсеты коммитятся вручную после пачки.
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", "1"))
+# Сколько getmany ждёт, если новых сообщений в буфере нет.
+MODERATION_BATCH_LINGER_MS = int(os.getenv("MODERATION_BATCH_LINGER_MS", "100"))
+# Сколько сообщений обрабатывается одновременно вне пакетного режима.
+MODERATION_CONCURRENCY = int(os.getenv("MODERATION_CONCURRENCY", "1"))
+MODERATION_COMMIT_INTERVAL_SECONDS = float(os.getenv("MODERATION_COMMIT_INTERVAL_SECONDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+
+class OffsetTracker:
+    """Какие оффсеты можно коммитить, когда сообщения завершаются не по порядку.
+
+    Коммитится только непрерывный префикс завершённых оффсетов партиции:
+    пока раннее сообщение в работе, более поздние готовые ждут, и при падении
+    не потеряется ни одно.
+    """
+
+    def __init__(self) -> None:
+        self._started: dict[TopicPartition, deque[int]] = {}
+        self._done: dict[TopicPartition, set[int]] = {}
+        self._committable: dict[TopicPartition, int] = {}
+
+    def start(self, tp: TopicPartition, offset: int) -> None:
+        self._started.setdefault(tp, deque()).append(offset)
+        self._done.setdefault(tp, set())
+
+    def done(self, tp: TopicPartition, offset: int) -> None:
+        started = self._started.get(tp)
+        if started is None:
+            # Партицию уже отобрали при ребалансировке.
+            return
+        done = self._done[tp]
+        done.add(offset)
+        while started and started[0] in done:
+            finished = started.popleft()
+            done.discard(finished)
+            self._committable[tp] = finished + 1
+
+    def pop_committable(self) -> dict[TopicPartition, int]:
+        committable, self._committable = self._committable, {}
+        return committable
+
+    def lag(self, tp: TopicPartition) -> int:
+        return len(self._started.get(tp, ()))
+
+    @property
+    def partitions(self) -> list[TopicPartition]:
+        return list(self._started)
+
+    def forget(self, partitions: Iterable[TopicPartition]) -> None:
+        for tp in partitions:
+            self._started.pop(tp, None)
+            self._done.pop(tp, None)
+            self._committable.pop(tp, None)
+
+
+class ConcurrentConsumer:
+    """До ``concurrency`` вызовов ``handle`` одновременно, с ручным коммитом
+    непрерывных префиксов оффсетов (``OffsetTracker``) раз в ``commit_interval``
+    и при остановке.
+
+    Если ``handle`` падает, оффсет сообщения не коммитится, а потребление
+    останавливается с этой ошибкой: после рестарта сообщение будет прочитано
+    снова.
+    """
+
+    def __init__(
+        self,
+        consumer: AIOKafkaConsumer,
+        handle: Callable[[dict[str, Any]], Awaitable[None]],
+        concurrency: int = MODERATION_CONCURRENCY,
+        commit_interval: float = MODERATION_COMMIT_INTERVAL_SECONDS,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be positive")
+        self.consumer = consumer
+        self.handle = handle
+        self.commit_interval = commit_interval
+        self.tracker = OffsetTracker()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._failure: Optional[BaseException] = None
+
+    def rebalance_listener(self) -> ConsumerRebalanceListener:
+        return _CommitOnRevoke(self)
+
+    async def run(self) -> None:
+        commit_task = asyncio.create_task(self._commit_periodically())
+        try:
+            async for message in self.consumer:
+                await self._slots.acquire()
+                self._raise_failure()
+                tp = TopicPartition(message.topic, message.partition)
+                self.tracker.start(tp, message.offset)
+                task = asyncio.create_task(self._process(tp, message.offset, decode_message(message.value, message.headers)))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                observe_worker_in_flight(len(self._tasks))
+        finally:
+            commit_task.cancel()
+            await self.drain()
+            await self.commit()
+
+    async def _process(self, tp: TopicPartition, offset: int, payload: dict[str, Any]) -> None:
+        try:
+            await self.handle(payload)
+        except Exception as exc:
+            logger.exception("moderation_message_failed partition=%s offset=%s", tp, offset)
+            if self._failure is None:
+                self._failure = exc
+        else:
+            self.tracker.done(tp, offset)
+        finally:
+            self._slots.release()
+            observe_worker_in_flight(len(self._tasks) - 1)
+
+    def _raise_failure(self) -> None:
+        if self._failure is not None:
+            raise self._failure
+
+    async def drain(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def commit(self) -> None:
+        offsets = self.tracker.pop_committable()
+        if offsets:
+            await self.consumer.commit(offsets)
+        for tp in self.tracker.partitions:
+            observe_worker_commit_lag(f"{tp.topic}:{tp.partition}", self.tracker.lag(tp))
+
+    async def _commit_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.commit_interval)
+            try:
+                await self.commit()
+            except Exception:
+                logger.exception("moderation_offset_commit_failed")
+
+
+class _CommitOnRevoke(ConsumerRebalanceListener):
+    """Перед тем как отдать партиции, дожидается начатых сообщений и коммитит их."""
+
+    def __init__(self, runner: ConcurrentConsumer) -> None:
+        self.runner = runner
+
+    async def on_partitions_revoked(self, revoked: Iterable[TopicPartition]) -> None:
+        await self.runner.drain()
+        await self.runner.commit()
+        self.runner.tracker.forget(revoked)
+
+    async def on_partitions_assigned(self, assigned: Iterable[TopicPartition]) -> None:
+        return None
+
+
+async def consume_in_batches(
+    consumer: AIOKafkaConsumer,
+    handle: Callable[[list[dict[str, Any]]], Awaitable[None]],
+    batch_size: int = MODERATION_BATCH_SIZE,
+    linger_ms: int = MODERATION_BATCH_LINGER_MS,
+) -> None:
+    while True:
+        batches = await consumer.getmany(timeout_ms=linger_ms, max_records=batch_size)
+        messages = [message for records in batches.values() for message in records]
+        if not messages:
+            continue
+        await handle([decode_message(message.value, message.headers) for message in messages])
+        # Оффсеты коммитятся только после записи всей пачки в БД: при падении
+        # пачка будет прочитана заново, а не потеряна.
+        await consumer.commit()
 
 
 async def run_worker() -> None:
     model_path = os.getenv("MODEL_PATH", os.path.join(os.path.dirname(__file__), "..", "model.pkl"))
-    model = load_model(model_path)
+    use_mlflow = os.getenv("USE_MLFLOW", "false").lower() == "true"
+    model_source = MlflowModelSource() if use_mlflow else FileModelSource(Path(model_path))
+    model = model_source.load()
+    observe_model_version(model.version)
+    executor = None
+    if INFERENCE_EXECUTOR_MODE in EXECUTOR_MODES:
+        executor = InferenceExecutor(model, mode=INFERENCE_EXECUTOR_MODE)
+        executor.start()
+    # Воркер берёт model_watcher.model на каждое сообщение, поэтому подмена
+    # модели подхватывается со следующего сообщения.
+    model_watcher = ModelWatcher(
+        model_source,
+        model,
+        on_swap=executor.reload if executor is not None else None,
+    )
+    if MODEL_RELOAD_INTERVAL_SECONDS > 0:
+        await model_watcher.start()
 
+    # Автокоммит выключен в обоих режимах: оффсет коммитится только после
+    # того, как сообщение обработано. Значения декодируются по заголовку
+    # schema (clients.message_codecs), поэтому value_deserializer не задан.
     consumer = AIOKafkaConsumer(
-        MODERATION_TOPIC,
         bootstrap_servers=KAFKA_BOOTSTRAP_SERVERS,
-        value_deserializer=lambda value: json.loads(value.decode("utf-8")),
         group_id="moderation-worker-group",
         auto_offset_reset="earliest",
+        enable_auto_commit=False,
     )
 
-    kafka_client = KafkaClient(KAFKA_BOOTSTRAP_SERVERS)
+    # Повторы и DLQ воркер отправляет только с подтверждением брокера: без него
+    # сбой доставки потерял бы сообщение молча. KAFKA_FIRE_AND_FORGET — только для API.
+    kafka_client = KafkaClient(KAFKA_BOOTSTRAP_SERVERS, fire_and_forget=False)
     moderation_repo = ModerationResultRepository()
     add_repo = AddRepository()
     user_repo = UserRepository()
 
+    # Готовые результаты пишутся в кэш сразу, чтобы опрос /moderation_result не ходил в БД.
+    disable_redis = os.getenv("DISABLE_REDIS", "false").lower() == "true"
+    redis_client = None if disable_redis else RedisClient(decode_responses=False)
+    cache_storage = None
+    if redis_client is not None:
+        try:
+            await redis_client.start()
+            # У воркера нет своего L1, но перезапись задачи должна сбросить L1 в API.
+            cache_storage = PredictionCacheStorage(
+                redis_client.client,
+                publish_invalidations=LOCAL_CACHE_MAX_SIZE > 0,
+            )
+        except Exception as exc:
+            logging.exception("Failed to start Redis client: %s", exc)
+            redis_client = None
+    # Повторы ждут в sorted set Redis, а не в обработчике: потребление не
+    # встаёт, и отложенный повтор переживает рестарт воркера. Очередь — это
+    # состояние задач, а не кэш, поэтому у неё своё соединение без шардинга:
+    # резервный шард или вытеснение по памяти потеряли бы повторы.
+    retry_redis_client = None if disable_redis else RedisClient(MODERATION_RETRY_REDIS_URL, shard_urls=())
+    retry_scheduler = None
+    if retry_redis_client is not None:
+        try:
+            await retry_redis_client.start()
+            retry_scheduler = RedisRetryScheduler(retry_redis_client.client)
+        except Exception as exc:
+            logging.exception("Failed to start retry queue Redis client: %s", exc)
+            retry_redis_client = None
+    if retry_scheduler is None:
+        retry_scheduler = LocalRetryScheduler(kafka_client)
+
+    dependencies = dict(
+        moderation_repo=moderation_repo,
+        add_repo=add_repo,
+        user_repo=user_repo,
+        kafka_client=kafka_client,
+        executor=executor,
+        cache_storage=cache_storage,
+        retry_scheduler=retry_scheduler,
+    )
+    runner = ConcurrentConsumer(
+        consumer,
+        lambda payload: process_moderation_message(payload=payload, model=model_watcher.model, **dependencies),
+    )
+    if MODERATION_BATCH_SIZE > 1:
+        consumer.subscribe([MODERATION_TOPIC])
+    else:
+        consumer.subscribe([MODERATION_TOPIC], listener=runner.rebalance_listener())
+
     await kafka_client.start()
     await consumer.start()
+    retry_dispatcher = None
+    if isinstance(retry_scheduler, RedisRetryScheduler):
+        retry_dispatcher = asyncio.create_task(retry_scheduler.run(kafka_client))
     try:
-        async for message in consumer:
-            await process_moderation_message(
-                payload=message.value,
-                model=model,
-                moderation_repo=moderation_repo,
-                add_repo=add_repo,
-                user_repo=user_repo,
-                kafka_client=kafka_client,
+        if MODERATION_BATCH_SIZE > 1:
+            await consume_in_batches(
+                consumer,
+                lambda payloads: process_moderation_batch(payloads, model=model_watcher.model, **dependencies),
             )
+        else:
+            await runner.run()
     finally:
+        await model_watcher.stop()
+        if retry_dispatcher is not None:
+            retry_dispatcher.cancel()
+            await asyncio.gather(retry_dispatcher, return_exceptions=True)
+        if isinstance(retry_scheduler, LocalRetryScheduler):
+            await retry_scheduler.stop()
         await consumer.stop()
         await kafka_client.stop()
+        if redis_client is not None:
+            await redis_client.stop()
+        if retry_redis_client is not None:
+            await retry_redis_client.stop()
+        if executor is not None:
+            await executor.stop()
 
 
 if __name__ == "__main__":
-    import asyncio
-
     asyncio.run(run_worker())